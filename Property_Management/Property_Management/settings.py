@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import json
 import os
 from pathlib import Path
 
@@ -87,6 +88,85 @@ DATABASES = {
 }
 
 
+# Ollama
+# Connection settings for the LLM server used by the process_properties command
+
+OLLAMA_BASE_URL = os.getenv('OLLAMA_BASE_URL', 'http://ollama:11434')
+
+# Comma-separated list of Ollama servers to spread requests over
+OLLAMA_BASE_URLS = [url.strip() for url in os.getenv('OLLAMA_BASE_URLS', OLLAMA_BASE_URL).split(',') if url.strip()]
+
+# Requests in flight per server (default: 0, the connection pool size)
+OLLAMA_BACKEND_CONCURRENCY = int(os.getenv('OLLAMA_BACKEND_CONCURRENCY', '0'))
+
+# Seconds between health checks of the Ollama servers; 0 disables them
+OLLAMA_HEALTH_CHECK_INTERVAL = float(os.getenv('OLLAMA_HEALTH_CHECK_INTERVAL', '30'))
+
+OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'llama3.2')
+
+# How long Ollama keeps the model loaded after a request during a run
+OLLAMA_KEEP_ALIVE = os.getenv('OLLAMA_KEEP_ALIVE', '30m')
+
+OLLAMA_POOL_SIZE = int(os.getenv('OLLAMA_POOL_SIZE', '10'))
+
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv('OLLAMA_CONNECT_TIMEOUT', '5'))
+
+OLLAMA_READ_TIMEOUT = float(os.getenv('OLLAMA_READ_TIMEOUT', '300'))
+
+# Retries of failed requests, with jittered exponential backoff in seconds
+OLLAMA_RETRIES = int(os.getenv('OLLAMA_RETRIES', '3'))
+
+OLLAMA_RETRY_BACKOFF = float(os.getenv('OLLAMA_RETRY_BACKOFF', '1'))
+
+OLLAMA_RETRY_MAX_BACKOFF = float(os.getenv('OLLAMA_RETRY_MAX_BACKOFF', '30'))
+
+# Seconds a single generate() call may take, retries included
+OLLAMA_CALL_DEADLINE = float(os.getenv('OLLAMA_CALL_DEADLINE', '900'))
+
+# Consecutive failed requests that pause all requests for OLLAMA_BREAKER_RESET seconds
+OLLAMA_BREAKER_THRESHOLD = int(os.getenv('OLLAMA_BREAKER_THRESHOLD', '5'))
+
+OLLAMA_BREAKER_RESET = float(os.getenv('OLLAMA_BREAKER_RESET', '30'))
+
+# Cached responses older than this many seconds are regenerated (default: 30 days)
+OLLAMA_CACHE_TTL = float(os.getenv('OLLAMA_CACHE_TTL', str(30 * 24 * 60 * 60)))
+
+OLLAMA_CACHE_MAX_ENTRIES = int(os.getenv('OLLAMA_CACHE_MAX_ENTRIES', '100000'))
+
+# The TTL and size limit are enforced again after this many new cached
+# responses during a run, besides once at its start
+OLLAMA_CACHE_PRUNE_EVERY = int(os.getenv('OLLAMA_CACHE_PRUNE_EVERY', '1000'))
+
+# Generation options sent with each kind of prompt: any Ollama model option
+# (num_predict, num_ctx, stop, temperature, ...) plus keep_alive. Descriptions
+# and reviews are stored in full, and an answer cut off by num_predict fails
+# the property instead of being saved half-finished.
+OLLAMA_PROMPT_OPTIONS = {
+    'description': {},
+    'summary': {},
+    'review': {},
+    'combined': {},
+}
+
+# Default num_predict of summaries in the marker format, where only their
+# first 500 characters are kept so a cut-off summary is still usable; 0 turns
+# it off. Not applied with --json, where a cut-off object cannot be parsed.
+OLLAMA_SUMMARY_NUM_PREDICT = int(os.getenv('OLLAMA_SUMMARY_NUM_PREDICT', '192'))
+
+# JSON object merged over the profiles above, e.g. '{"summary": {"temperature": 0.2}}'
+for _prompt_type, _options in json.loads(os.getenv('OLLAMA_PROMPT_OPTIONS', '{}')).items():
+    OLLAMA_PROMPT_OPTIONS.setdefault(_prompt_type, {}).update(_options)
+
+# Lets generate_hotels and benchmark_properties insert synthetic hotels into
+# the hotels table without --allow-synthetic. Only set it for a throwaway or
+# benchmark database: process_properties treats those hotels like real ones.
+ALLOW_SYNTHETIC_HOTELS = os.getenv('ALLOW_SYNTHETIC_HOTELS', '').lower() in ('1', 'true', 'yes')
+
+# Bearer token Prometheus must send to scrape /metrics; the endpoint is
+# disabled (404) while it is empty
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
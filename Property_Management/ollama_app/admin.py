@@ -1,11 +1,74 @@
+from typing import Optional, Tuple
+
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
 from .models import Hotel, PropertyContent, PropertySummary, PropertyReview
 
+# Below this many rows an exact COUNT(*) is cheap, and the estimate may be off
+# by more than the table size
+ESTIMATE_MIN_ROWS = 10000
+
+
+class EstimatedCountPaginator(Paginator):
+    # An unfiltered changelist counts the whole table on every page load. On
+    # PostgreSQL the planner's row estimate from pg_class is used instead;
+    # filtered and searched lists, other databases and small tables still get
+    # an exact count.
+    @cached_property
+    def count(self) -> int:
+        estimate = self.estimated_count()
+        if estimate is not None and estimate >= ESTIMATE_MIN_ROWS:
+            return estimate
+        return super().count
+
+    def estimated_count(self) -> Optional[int]:
+        query = getattr(self.object_list, 'query', None)
+        if query is None or query.where or query.distinct:
+            return None
+        connection = connections[self.object_list.db]
+        if connection.vendor != 'postgresql':
+            return None
+        table = connection.ops.quote_name(self.object_list.model._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)", [table])
+            row = cursor.fetchone()
+        # reltuples is -1 for a table that has never been vacuumed or analyzed
+        if row is None or row[0] is None or row[0] < 0:
+            return None
+        return row[0]
+
+
+class DeferredFieldsChangeList(ChangeList):
+    # Leaves the model admin's list_defer fields out of the changelist query
+    # only; the change form still loads every field. Takes whatever arguments
+    # the installed Django passes (exclude_parameters only exists from 5.0).
+    def get_queryset(self, request, *args, **kwargs):
+        queryset = super().get_queryset(request, *args, **kwargs)
+        if self.model_admin.list_defer:
+            queryset = queryset.defer(*self.model_admin.list_defer)
+        return queryset
+
+
+class ScalableModelAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    # Skips the second COUNT(*) of the whole table behind "N total" when the
+    # list is filtered
+    show_full_result_count = False
+    # Large fields the changelist does not display
+    list_defer: Tuple[str, ...] = ()
+
+    def get_changelist(self, request, **kwargs):
+        return DeferredFieldsChangeList
+
 # Register Hotel model
 
 
 @admin.register(Hotel)
-class HotelAdmin(admin.ModelAdmin):
+class HotelAdmin(ScalableModelAdmin):
     list_display = ('hotelId', 'title', 'city')
     search_fields = ('hotelId', 'title', 'city')
     list_filter = ('city', 'rating')
@@ -15,29 +78,40 @@ class HotelAdmin(admin.ModelAdmin):
 
 
 @admin.register(PropertyContent)
-class PropertyContentAdmin(admin.ModelAdmin):
+class PropertyContentAdmin(ScalableModelAdmin):
     list_display = ('propertyId', 'title', 'hotel', 'created_at')
+    list_select_related = ('hotel',)
+    list_defer = ('description',)
     # hotel__title is used to search by related hotel title
     search_fields = ('propertyId', 'title', 'hotel__title')
     list_filter = ('created_at',)
     ordering = ('-created_at',)
+    # Searches hotels as you type instead of rendering every hotel in a <select>
+    autocomplete_fields = ('hotel',)
 
 # Register PropertySummary model
 
 
 @admin.register(PropertySummary)
-class PropertySummaryAdmin(admin.ModelAdmin):
+class PropertySummaryAdmin(ScalableModelAdmin):
     list_display = ('propertyId', 'property', 'created_at')
+    # Joins the property into the list query instead of one query per row
+    list_select_related = ('property',)
+    list_defer = ('summary', 'property__description')
     search_fields = ('propertyId', 'property__title',)
     list_filter = ('created_at',)
     ordering = ('-created_at',)
+    autocomplete_fields = ('property',)
 
 # Register PropertyReview model
 
 
 @admin.register(PropertyReview)
-class PropertyReviewAdmin(admin.ModelAdmin):
+class PropertyReviewAdmin(ScalableModelAdmin):
     list_display = ('propertyId', 'property', 'rating', 'created_at')
+    list_select_related = ('property',)
+    list_defer = ('review', 'property__description')
     search_fields = ('propertyId', 'property__title',)
     list_filter = ('rating', 'created_at')
     ordering = ('-created_at',)
+    autocomplete_fields = ('property',)
@@ -0,0 +1,212 @@
+# backends.py
+import logging
+import threading
+import time
+from typing import List, Optional
+
+import requests
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class NoHealthyBackendError(Exception):
+    pass
+
+
+class AdaptiveLimit:
+    # AIMD controller for the number of requests one backend may have in
+    # flight. The latency it sees is per generated character, so short and long
+    # prompts are comparable. While latency stays within `tolerance` times its
+    # running baseline the limit grows, by one per request until the first
+    # slowdown and then by about one per full window of requests. An error or
+    # a slow response multiplies it by `backoff`, at most once per window:
+    # requests started before the last decrease do not shrink it again.
+    def __init__(self, max_limit: int, initial: int = 1, tolerance: float = 2.0, backoff: float = 0.75):
+        self.max_limit = max(max_limit, 1)
+        self.limit = float(min(max(initial, 1), self.max_limit))
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.baseline: Optional[float] = None
+        self.slow_start = True
+        self.last_decrease = float('-inf')
+
+    @property
+    def value(self) -> int:
+        return int(self.limit)
+
+    def update(self, started_at: float, latency: Optional[float], failed: bool) -> None:
+        congested = (latency is not None and self.baseline is not None
+                     and latency > self.baseline * self.tolerance)
+        if failed or congested:
+            if started_at > self.last_decrease:
+                self.limit = max(self.limit * self.backoff, 1.0)
+                self.slow_start = False
+                self.last_decrease = time.monotonic()
+            return
+        if latency is None:
+            return
+
+        self.baseline = latency if self.baseline is None else self.baseline + 0.1 * (latency - self.baseline)
+        increase = 1.0 if self.slow_start else 1.0 / self.limit
+        self.limit = min(self.limit + increase, float(self.max_limit))
+
+
+class Backend:
+    def __init__(self, url: str, limit: Optional[AdaptiveLimit] = None):
+        self.url = url.rstrip('/')
+        self.limit = limit
+        self.outstanding = 0
+        self.served = 0
+        self.failures = 0
+        self.healthy = True
+
+    def __repr__(self) -> str:
+        return f"Backend({self.url!r})"
+
+
+class BackendPool:
+    # Spreads requests over several Ollama servers. Each request goes to the
+    # healthy backend with the fewest requests in flight, and no backend gets
+    # more than max_concurrency at once. A backend is ejected after a failed
+    # health check or failure_threshold consecutive failed requests, and only
+    # comes back once a health check succeeds. The last healthy backend is
+    # never ejected: requests to it fail and are retried, and the circuit
+    # breaker pauses them during an outage. Without health checks nothing
+    # would bring it back, so failure_threshold defaults to 0 (never eject).
+    # With adaptive=True each backend's cap is an AdaptiveLimit that starts
+    # at one request and is tuned up to max_concurrency.
+    def __init__(self, urls: List[str], max_concurrency: int, failure_threshold: int = 0,
+                 adaptive: bool = False):
+        if not urls:
+            raise ValueError("At least one Ollama backend URL is required")
+        self.max_concurrency = max(max_concurrency, 1)
+        self.backends = [
+            Backend(url, AdaptiveLimit(self.max_concurrency) if adaptive else None) for url in urls
+        ]
+        self.failure_threshold = failure_threshold
+        self.condition = threading.Condition()
+
+    @property
+    def urls(self) -> List[str]:
+        return [backend.url for backend in self.backends]
+
+    def capacity(self, backend: Backend) -> int:
+        return backend.limit.value if backend.limit is not None else self.max_concurrency
+
+    def try_acquire(self, prefer: Optional[str] = None) -> Optional[Backend]:
+        # `prefer` names a backend to use if it has room, e.g. the one holding
+        # the KV cache of an earlier prompt in the same exchange
+        with self.condition:
+            healthy = [backend for backend in self.backends if backend.healthy]
+            if not healthy:
+                raise NoHealthyBackendError(
+                    f"All Ollama backends are unhealthy: {', '.join(self.urls)}")
+            available = [backend for backend in healthy if backend.outstanding < self.capacity(backend)]
+            if not available:
+                return None
+            # Load is relative to each backend's cap, which only differs
+            # between backends with adaptive limits. Ties go to the backend
+            # that has served the fewest requests, so an idle pool still
+            # rotates through every backend.
+            preferred = [backend for backend in available if backend.url == prefer]
+            backend = preferred[0] if preferred else min(
+                available, key=lambda b: (b.outstanding / self.capacity(b), b.served))
+            backend.outstanding += 1
+            backend.served += 1
+            return backend
+
+    def acquire(self, prefer: Optional[str] = None) -> Backend:
+        # Wait for a free slot; the timeout lets a backend that a health check
+        # restores be picked up without a release() to wake us
+        with self.condition:
+            while True:
+                backend = self.try_acquire(prefer)
+                if backend is not None:
+                    return backend
+                self.condition.wait(timeout=1.0)
+
+    def release(self, backend: Backend, failed: bool = False, started_at: Optional[float] = None,
+                latency: Optional[float] = None) -> None:
+        with self.condition:
+            backend.outstanding -= 1
+            if backend.limit is not None and started_at is not None:
+                backend.limit.update(started_at, latency, failed)
+            if not failed:
+                backend.failures = 0
+            else:
+                backend.failures += 1
+                if (self.failure_threshold and backend.healthy and backend.failures >= self.failure_threshold
+                        and self.can_eject(backend)):
+                    logger.warning(
+                        f"Ejecting Ollama backend {backend.url} after {backend.failures} failed requests")
+                    backend.healthy = False
+                    metrics.BACKEND_HEALTHY.labels(backend=backend.url).set(0)
+            self.condition.notify_all()
+
+    def can_eject(self, backend: Backend) -> bool:
+        return any(other.healthy for other in self.backends if other is not backend)
+
+    def mark(self, backend: Backend, healthy: bool) -> None:
+        with self.condition:
+            if healthy and not backend.healthy:
+                logger.info(f"Ollama backend {backend.url} is healthy again")
+                backend.failures = 0
+            elif not healthy and backend.healthy:
+                if not self.can_eject(backend):
+                    logger.warning(
+                        f"Ollama backend {backend.url} failed a health check; keeping it as the last healthy one")
+                    healthy = True
+                else:
+                    logger.warning(f"Ejecting Ollama backend {backend.url} after a failed health check")
+            backend.healthy = healthy
+            metrics.BACKEND_HEALTHY.labels(backend=backend.url).set(1 if healthy else 0)
+            self.condition.notify_all()
+
+    def check_health(self, session: requests.Session, timeout: float, model: Optional[str] = None) -> None:
+        for backend in self.backends:
+            problem = backend_problem(session, backend.url, timeout, model)
+            if problem is not None:
+                logger.debug(f"Health check of {backend.url} failed: {problem}")
+            self.mark(backend, problem is None)
+
+
+def has_model(names: List[str], model: str) -> bool:
+    # Ollama lists models with their tag, and a name without one means :latest
+    return model in names or (':' not in model and f"{model}:latest" in names)
+
+
+def backend_problem(session: requests.Session, url: str, timeout: float,
+                    model: Optional[str] = None) -> Optional[str]:
+    # Describes why a backend cannot serve requests for `model`, or returns None
+    try:
+        response = session.get(f"{url}/api/tags", timeout=timeout)
+        response.raise_for_status()
+        names = [entry.get('name') for entry in response.json().get('models', [])]
+    except (requests.exceptions.RequestException, ValueError) as e:
+        return f"unreachable ({str(e)})"
+    if model is not None and not has_model(names, model):
+        return f"model '{model}' is not installed (available: {', '.join(names) or 'none'})"
+    return None
+
+
+class BackendHealthCheck(threading.Thread):
+    # Polls every backend in the pool so failed ones are ejected before
+    # requests reach them and recovered ones are put back into rotation
+    def __init__(self, pool: BackendPool, interval: float, timeout: float, model: Optional[str] = None):
+        super().__init__(name='ollama-health-check', daemon=True)
+        self.pool = pool
+        self.interval = interval
+        self.timeout = timeout
+        self.model = model
+        self.stop_event = threading.Event()
+
+    def run(self) -> None:
+        with requests.Session() as session:
+            while not self.stop_event.wait(self.interval):
+                self.pool.check_health(session, self.timeout, self.model)
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        self.join()
@@ -0,0 +1,82 @@
+# cache.py
+import hashlib
+import json
+import logging
+import threading
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import GenerationCache
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    def __init__(self, version: Any, ttl: Optional[float] = None, max_entries: Optional[int] = None,
+                 prune_every: Optional[int] = None):
+        self.version = version
+        self.ttl = timedelta(seconds=ttl if ttl is not None else settings.OLLAMA_CACHE_TTL)
+        self.max_entries = max_entries if max_entries is not None else settings.OLLAMA_CACHE_MAX_ENTRIES
+        self.prune_every = prune_every if prune_every is not None else settings.OLLAMA_CACHE_PRUNE_EVERY
+        # set() is called from worker threads and, in --async mode, from
+        # sync_to_async threads
+        self.lock = threading.Lock()
+        self.sets_since_prune = 0
+
+    def make_key(self, payload: Dict[str, Any]) -> str:
+        # The key covers the model, the rendered prompt and every generation
+        # option, plus the prompt template version. Streaming and keep_alive
+        # only change how the response is delivered, so they are left out.
+        data = {name: value for name, value in payload.items() if name not in ('stream', 'keep_alive')}
+        data['version'] = self.version
+        return hashlib.sha256(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        entry = GenerationCache.objects.filter(key=key).values_list('response', 'created_at').first()
+        if entry is None:
+            return None
+
+        response, created_at = entry
+        if created_at < timezone.now() - self.ttl:
+            self.delete(key)
+            return None
+        return response
+
+    def set(self, key: str, response: str) -> None:
+        # Another worker may have stored the same prompt in the meantime
+        GenerationCache.objects.bulk_create(
+            [GenerationCache(key=key, response=response)], ignore_conflicts=True)
+        if self.prune_due():
+            self.prune()
+
+    def prune_due(self) -> bool:
+        # A long run keeps adding responses, so the limits are enforced every
+        # prune_every new ones rather than only when the next run starts
+        if self.prune_every <= 0:
+            return False
+        with self.lock:
+            self.sets_since_prune += 1
+            if self.sets_since_prune < self.prune_every:
+                return False
+            self.sets_since_prune = 0
+            return True
+
+    def delete(self, key: str) -> None:
+        GenerationCache.objects.filter(key=key).delete()
+
+    def prune(self) -> int:
+        expired, _ = GenerationCache.objects.filter(created_at__lt=timezone.now() - self.ttl).delete()
+
+        # Keep only the newest max_entries rows
+        overflow = 0
+        cutoff = list(GenerationCache.objects.order_by('-id').values_list('id', flat=True)
+                      [self.max_entries:self.max_entries + 1])
+        if cutoff:
+            overflow, _ = GenerationCache.objects.filter(id__lte=cutoff[0]).delete()
+
+        if expired or overflow:
+            logger.info(f"Pruned {expired} expired and {overflow} excess cached responses")
+        return expired + overflow
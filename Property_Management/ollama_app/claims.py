@@ -0,0 +1,104 @@
+# claims.py
+import logging
+import os
+import socket
+import threading
+from datetime import timedelta
+from typing import List
+
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Hotel, HotelClaim
+
+logger = logging.getLogger(__name__)
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def enqueue_hotels(hotels: List[Hotel]) -> int:
+    hotel_ids = [hotel.id for hotel in hotels]
+    HotelClaim.objects.bulk_create(
+        [HotelClaim(hotel_id=hotel_id) for hotel_id in hotel_ids], ignore_conflicts=True)
+    # Hotels that were finished or gave up on before are queued again; hotels
+    # a worker is busy with are left alone
+    HotelClaim.objects.filter(
+        hotel_id__in=hotel_ids, status__in=[HotelClaim.DONE, HotelClaim.FAILED]
+    ).update(status=HotelClaim.PENDING, worker_id=None, updated_at=timezone.now())
+    return len(hotel_ids)
+
+
+def claim_hotels(worker_id: str, count: int) -> List[int]:
+    # SKIP LOCKED lets every worker grab a different set of pending rows
+    # without waiting on the rows other workers are claiming at the same time
+    with transaction.atomic():
+        claim_ids = list(
+            HotelClaim.objects.select_for_update(skip_locked=True)
+            .filter(status=HotelClaim.PENDING)
+            .order_by('-hotel_id')
+            .values_list('id', flat=True)[:count]
+        )
+        if not claim_ids:
+            return []
+
+        now = timezone.now()
+        HotelClaim.objects.filter(id__in=claim_ids).update(
+            status=HotelClaim.CLAIMED,
+            worker_id=worker_id,
+            attempts=F('attempts') + 1,
+            claimed_at=now,
+            heartbeat_at=now,
+            updated_at=now,
+        )
+        return list(HotelClaim.objects.filter(id__in=claim_ids).values_list('hotel_id', flat=True))
+
+
+def requeue_expired_claims(lease_seconds: float) -> int:
+    # A claim whose heartbeat stopped belongs to a worker that died
+    expired_before = timezone.now() - timedelta(seconds=lease_seconds)
+    requeued = HotelClaim.objects.filter(
+        status=HotelClaim.CLAIMED, heartbeat_at__lt=expired_before
+    ).update(status=HotelClaim.PENDING, worker_id=None, updated_at=timezone.now())
+    if requeued:
+        logger.warning(f"Re-queued {requeued} hotels claimed by workers that stopped responding")
+    return requeued
+
+
+def finish_claims(worker_id: str, hotel_ids: List[int], status: str) -> int:
+    return HotelClaim.objects.filter(
+        worker_id=worker_id, hotel_id__in=hotel_ids, status=HotelClaim.CLAIMED
+    ).update(status=status, updated_at=timezone.now())
+
+
+def release_claims(worker_id: str) -> int:
+    return HotelClaim.objects.filter(
+        worker_id=worker_id, status=HotelClaim.CLAIMED
+    ).update(status=HotelClaim.PENDING, worker_id=None, updated_at=timezone.now())
+
+
+class ClaimHeartbeat(threading.Thread):
+    # Keeps this worker's claims alive while it is processing them
+    def __init__(self, worker_id: str, interval: float):
+        super().__init__(name='claim-heartbeat', daemon=True)
+        self.worker_id = worker_id
+        self.interval = interval
+        self.stop_event = threading.Event()
+
+    def run(self) -> None:
+        try:
+            while not self.stop_event.wait(self.interval):
+                try:
+                    HotelClaim.objects.filter(
+                        worker_id=self.worker_id, status=HotelClaim.CLAIMED
+                    ).update(heartbeat_at=timezone.now())
+                except Exception as e:
+                    logger.error(f"Error updating claim heartbeat: {str(e)}")
+        finally:
+            connections.close_all()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        self.join()
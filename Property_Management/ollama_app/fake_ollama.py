@@ -0,0 +1,285 @@
+# fake_ollama.py
+import json
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+
+from .stats import NANOSECONDS
+
+logger = logging.getLogger(__name__)
+
+WORDS = (
+    'hotel', 'room', 'view', 'pool', 'beach', 'city', 'quiet', 'modern', 'spacious', 'friendly', 'staff',
+    'breakfast', 'downtown', 'comfortable', 'elegant', 'walk', 'restaurant', 'suite', 'balcony', 'stay',
+    'location', 'clean', 'bright', 'cozy', 'garden', 'terrace', 'spa', 'station', 'harbor', 'old', 'town',
+)
+
+# Words generated for each field of a response
+FIELD_WORDS = {'title': 6, 'description': 120, 'summary': 40, 'review': 80}
+
+
+class FakeOllamaConfig(NamedTuple):
+    # Time to the first token follows a log-normal distribution around
+    # `latency` seconds; tokens then arrive at `tokens_per_second` (0 means
+    # all at once). At most `parallel` requests generate at a time, the rest
+    # queue like they do on a real server (0 means no limit).
+    model: str = ''
+    latency: float = 0.05
+    latency_sigma: float = 0.5
+    tokens_per_second: float = 0.0
+    prompt_tokens_per_second: float = 2000.0
+    parallel: int = 4
+    # Share of requests answered with a 503, and of responses missing their markers
+    error_rate: float = 0.0
+    malformed_rate: float = 0.0
+    seed: Optional[int] = None
+
+
+def prompt_fields(prompt: str) -> List[str]:
+    # Which fields the command's prompt asks for, from the markers it names
+    if 'TITLE:' in prompt and 'SUMMARY:' in prompt:
+        return ['title', 'description', 'summary', 'rating', 'review']
+    if 'TITLE:' in prompt:
+        return ['title', 'description']
+    if 'SUMMARY:' in prompt:
+        return ['summary']
+    if 'RATING:' in prompt:
+        return ['rating', 'review']
+    return ['description']
+
+
+class FakeOllamaServer:
+    # A local stand-in for Ollama's /api/tags and /api/generate, so the
+    # command can be run and benchmarked without a GPU
+    def __init__(self, config: FakeOllamaConfig = FakeOllamaConfig(), host: str = '127.0.0.1', port: int = 0):
+        self.config = config._replace(model=config.model or settings.OLLAMA_MODEL)
+        self.random = random.Random(config.seed)
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(config.parallel) if config.parallel > 0 else None
+        self.requests = 0
+        self.errors = 0
+        self.malformed = 0
+        self.httpd = ThreadingHTTPServer((host, port), FakeOllamaHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.fake = self
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'FakeOllamaServer':
+        self.thread = threading.Thread(
+            target=self.httpd.serve_forever, kwargs={'poll_interval': 0.05}, name='fake-ollama', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread is not None:
+            self.thread.join()
+
+    def __enter__(self) -> 'FakeOllamaServer':
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def draw(self) -> Tuple[float, bool, bool]:
+        # One lock around the shared generator keeps a seeded run repeatable
+        # for a given order of requests
+        with self.lock:
+            self.requests += 1
+            latency = self.random.lognormvariate(0, self.config.latency_sigma) * self.config.latency
+            failed = self.random.random() < self.config.error_rate
+            malformed = not failed and self.random.random() < self.config.malformed_rate
+            self.errors += failed
+            self.malformed += malformed
+            return latency, failed, malformed
+
+    def text(self, words: int) -> str:
+        with self.lock:
+            return ' '.join(self.random.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+    def rating(self) -> float:
+        with self.lock:
+            return round(self.random.uniform(3.0, 5.0), 1)
+
+    def respond(self, payload: Dict[str, Any], malformed: bool) -> str:
+        fields = prompt_fields(payload.get('prompt', ''))
+        if malformed:
+            return "I'm sorry, I can't help with that request."
+        values = {
+            field: self.rating() if field == 'rating' else self.text(FIELD_WORDS[field]) for field in fields
+        }
+        if payload.get('format'):
+            return json.dumps(values)
+        return '\n'.join(f"{field.upper()}: {value}" for field, value in values.items())
+
+    def timings(self, prompt: str, output_tokens: int, generation_seconds: float) -> Dict[str, Any]:
+        prompt_tokens = len(prompt.split())
+        prompt_seconds = prompt_tokens / self.config.prompt_tokens_per_second
+        return {
+            'prompt_eval_count': prompt_tokens,
+            'prompt_eval_duration': int(prompt_seconds * NANOSECONDS),
+            'eval_count': output_tokens,
+            'eval_duration': int(generation_seconds * NANOSECONDS),
+            'load_duration': 0,
+            'total_duration': int((prompt_seconds + generation_seconds) * NANOSECONDS),
+        }
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are separate writes; with Nagle's algorithm the body
+    # waits for the client's delayed ACK and adds ~40ms to every response
+    disable_nagle_algorithm = True
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug(f"Fake Ollama: {format % args}")
+
+    @property
+    def fake(self) -> FakeOllamaServer:
+        return self.server.fake
+
+    def send_json(self, status: int, data: Dict[str, Any]) -> None:
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        if self.path != '/api/tags':
+            self.send_json(404, {'error': 'not found'})
+            return
+        self.send_json(200, {'models': [{'name': f"{self.fake.config.model}:latest"}]})
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        if self.path != '/api/generate':
+            self.send_json(404, {'error': 'not found'})
+            return
+        if not payload.get('prompt'):
+            # A request without a prompt only loads the model
+            self.send_json(200, {'model': payload.get('model'), 'response': '', 'done': True})
+            return
+
+        latency, failed, malformed = self.fake.draw()
+        if self.fake.slots is not None:
+            self.fake.slots.acquire()
+        try:
+            time.sleep(latency)
+            if failed:
+                self.send_json(503, {'error': 'fake Ollama server is overloaded'})
+                return
+            text = self.fake.respond(payload, malformed)
+            # Like Ollama, stop at num_predict tokens and say so
+            done_reason = 'stop'
+            num_predict = (payload.get('options') or {}).get('num_predict')
+            if num_predict and 0 < num_predict < len(text.split(' ')):
+                text = ' '.join(text.split(' ')[:num_predict])
+                done_reason = 'length'
+            if payload.get('stream'):
+                self.stream(payload, text, done_reason)
+            else:
+                self.generate(payload, text, done_reason)
+        finally:
+            if self.fake.slots is not None:
+                self.fake.slots.release()
+
+    def token_delay(self) -> float:
+        rate = self.fake.config.tokens_per_second
+        return 1.0 / rate if rate > 0 else 0.0
+
+    def generate(self, payload: Dict[str, Any], text: str, done_reason: str = 'stop') -> None:
+        tokens = text.split(' ')
+        generation_seconds = len(tokens) * self.token_delay()
+        time.sleep(generation_seconds)
+        self.send_json(200, {
+            'model': payload.get('model'),
+            'response': text,
+            'done': True,
+            'done_reason': done_reason,
+            'context': [1, 2, 3],
+            **self.fake.timings(payload['prompt'], len(tokens), generation_seconds),
+        })
+
+    def stream(self, payload: Dict[str, Any], text: str, done_reason: str = 'stop') -> None:
+        # One JSON object per line with no length up front, so the
+        # connection is closed to mark the end of the response
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        tokens = text.split(' ')
+        started_at = time.monotonic()
+        try:
+            for index, token in enumerate(tokens):
+                time.sleep(self.token_delay())
+                piece = token if index == 0 else f" {token}"
+                self.wfile.write(json.dumps({'response': piece, 'done': False}).encode() + b'\n')
+            self.wfile.write(json.dumps({
+                'response': '',
+                'done': True,
+                'done_reason': done_reason,
+                'context': [1, 2, 3],
+                **self.fake.timings(payload['prompt'], len(tokens), time.monotonic() - started_at),
+            }).encode() + b'\n')
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading once it had what it needed
+            pass
+
+
+def add_fake_ollama_arguments(parser) -> None:
+    # Options shared by the commands that start a fake server
+    parser.add_argument(
+        '--latency', type=float, default=0.05,
+        help='Median seconds before the fake server starts answering (default: 0.05)'
+    )
+    parser.add_argument(
+        '--latency-sigma', type=float, default=0.5,
+        help='Spread of the log-normal latency distribution; 0 makes every request take --latency (default: 0.5)'
+    )
+    parser.add_argument(
+        '--tokens-per-second', type=float, default=0.0,
+        help='Rate at which the fake server generates words; 0 answers at once (default: 0)'
+    )
+    parser.add_argument(
+        '--parallel', type=int, default=4,
+        help='Requests the fake server generates at the same time, like OLLAMA_NUM_PARALLEL (default: 4)'
+    )
+    parser.add_argument(
+        '--error-rate', type=float, default=0.0,
+        help='Share of requests answered with a 503 (default: 0)'
+    )
+    parser.add_argument(
+        '--malformed-rate', type=float, default=0.0,
+        help='Share of responses without the markers the command parses (default: 0)'
+    )
+    parser.add_argument(
+        '--seed', type=int, default=0,
+        help='Seed for the random latencies, failures and text (default: 0)'
+    )
+
+
+def fake_ollama_config(options: Dict[str, Any]) -> FakeOllamaConfig:
+    return FakeOllamaConfig(
+        latency=options.get('latency', 0.05),
+        latency_sigma=options.get('latency_sigma', 0.5),
+        tokens_per_second=options.get('tokens_per_second', 0.0),
+        parallel=options.get('parallel', 4),
+        error_rate=options.get('error_rate', 0.0),
+        malformed_rate=options.get('malformed_rate', 0.0),
+        seed=options.get('seed', 0),
+    )
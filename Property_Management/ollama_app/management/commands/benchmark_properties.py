@@ -0,0 +1,136 @@
+import json
+import time
+from io import StringIO
+from typing import Any, Dict, Tuple
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+
+from ...fake_ollama import FakeOllamaServer, add_fake_ollama_arguments, fake_ollama_config
+from ...models import Hotel, PropertyContent
+from ...stats import percentile
+from ...synthetic import add_allow_synthetic_argument, check_synthetic_allowed, synthetic_hotels, synthetic_prefix
+from .process_properties import Command as ProcessPropertiesCommand
+
+
+class Command(BaseCommand):
+    help = ('Benchmark process_properties on synthetic hotels against a fake Ollama server. '
+            'Never run it against the production database: the hotels are inserted into the real hotels table.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hotels', type=int, default=200,
+            help='Number of synthetic hotels processed at each concurrency level (default: 200)'
+        )
+        parser.add_argument(
+            '--concurrency', type=int, nargs='+', default=[1, 4, 16],
+            help='Workers (or asyncio requests with --async) to benchmark (default: 1 4 16)'
+        )
+        parser.add_argument(
+            '--async', action='store_true', dest='use_async',
+            help='Benchmark the asyncio mode instead of worker threads'
+        )
+        parser.add_argument(
+            '--stream', action='store_true',
+            help='Stream the fake responses'
+        )
+        parser.add_argument(
+            '--combined', action='store_true',
+            help='Generate each property with one prompt instead of three'
+        )
+        parser.add_argument(
+            '--flush-size', type=int, default=50,
+            help='Number of generated properties saved together in one bulk insert (default: 50)'
+        )
+        parser.add_argument(
+            '--keep', action='store_true',
+            help='Keep the synthetic hotels and their generated content afterwards'
+        )
+        parser.add_argument(
+            '--output', metavar='PATH',
+            help='Also write the results to PATH as JSON'
+        )
+        add_allow_synthetic_argument(parser)
+        add_fake_ollama_arguments(parser)
+
+    def run_level(self, server: FakeOllamaServer, level: int, count: int, id_range: Tuple[int, int],
+                  options: Dict[str, Any]) -> Dict[str, Any]:
+        command = ProcessPropertiesCommand()
+        requests_before = server.requests
+        mode = {'concurrency': level} if options.get('use_async') else {'workers': level}
+        started_at = time.monotonic()
+        call_command(
+            command,
+            backends=[server.url],
+            use_async=options.get('use_async', False),
+            stream=options.get('stream', False),
+            combined=options.get('combined', False),
+            flush_size=options.get('flush_size', 50),
+            limit=count,
+            min_id=id_range[0],
+            max_id=id_range[1],
+            health_check_interval=0,
+            stdout=StringIO(),
+            **mode,
+        )
+        seconds = time.monotonic() - started_at
+
+        llm = command.stats.samples('llm.')
+        writes = command.stats.samples('db_write')
+        return {
+            'concurrency': level,
+            'processed': command.success_count,
+            'failed': command.error_count,
+            'seconds': seconds,
+            'hotels_per_second': command.success_count / seconds if seconds else 0.0,
+            'llm_p50': percentile(llm, 0.50),
+            'llm_p95': percentile(llm, 0.95),
+            'db_write_seconds': sum(writes),
+            'db_write_p95': percentile(writes, 0.95),
+            'requests': server.requests - requests_before,
+        }
+
+    def handle(self, *args, **options):
+        count = options.get('hotels', 200)
+        if count < 1:
+            raise CommandError("--hotels must be at least 1")
+        check_synthetic_allowed(options)
+        seed = options.get('seed', 0)
+        prefix = synthetic_prefix(seed)
+
+        # Start from the same hotels every time, without leftovers of a run
+        # that was interrupted
+        Hotel.objects.filter(hotelId__startswith=prefix).delete()
+        Hotel.objects.bulk_create(synthetic_hotels(count, seed), batch_size=1000)
+        bounds = Hotel.objects.filter(hotelId__startswith=prefix).aggregate(min_id=Min('id'), max_id=Max('id'))
+        id_range = (bounds['min_id'], bounds['max_id'])
+
+        results = []
+        try:
+            with FakeOllamaServer(fake_ollama_config(options)) as server:
+                self.stdout.write(f"Benchmarking {count} synthetic hotels against a fake Ollama at {server.url}")
+                for level in options.get('concurrency', [1, 4, 16]):
+                    # Each level writes its content from scratch
+                    PropertyContent.objects.filter(hotel__hotelId__startswith=prefix).delete()
+                    result = self.run_level(server, max(level, 1), count, id_range, options)
+                    self.stdout.write(
+                        f"Concurrency {result['concurrency']}: {result['hotels_per_second']:.2f} hotels/s")
+                    results.append(result)
+        finally:
+            if not options.get('keep'):
+                Hotel.objects.filter(hotelId__startswith=prefix).delete()
+
+        self.stdout.write(
+            f"\n{'concurrency':>11}{'hotels/s':>10}{'processed':>11}{'failed':>8}{'requests':>10}"
+            f"{'llm p50':>9}{'llm p95':>9}{'db write s':>12}{'db p95':>9}")
+        for result in results:
+            self.stdout.write(
+                f"{result['concurrency']:>11}{result['hotels_per_second']:>10.2f}{result['processed']:>11}"
+                f"{result['failed']:>8}{result['requests']:>10}{result['llm_p50']:>9.3f}{result['llm_p95']:>9.3f}"
+                f"{result['db_write_seconds']:>12.3f}{result['db_write_p95']:>9.3f}")
+
+        if options.get('output'):
+            with open(options['output'], 'w') as f:
+                json.dump({'hotels': count, 'seed': seed, 'results': results}, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
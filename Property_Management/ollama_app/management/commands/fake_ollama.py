@@ -0,0 +1,32 @@
+import threading
+
+from django.core.management.base import BaseCommand
+
+from ...fake_ollama import FakeOllamaServer, add_fake_ollama_arguments, fake_ollama_config
+
+
+class Command(BaseCommand):
+    help = 'Serve a fake Ollama API with configurable latency and failures, for runs without a GPU'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--host', default='127.0.0.1',
+            help='Address to listen on (default: 127.0.0.1)'
+        )
+        parser.add_argument(
+            '--port', type=int, default=11434,
+            help='Port to listen on (default: 11434)'
+        )
+        add_fake_ollama_arguments(parser)
+
+    def handle(self, *args, **options):
+        server = FakeOllamaServer(
+            fake_ollama_config(options), host=options.get('host', '127.0.0.1'), port=options.get('port', 11434))
+        self.stdout.write(f"Fake Ollama serving '{server.config.model}' at {server.url}, press Ctrl+C to stop")
+        with server:
+            try:
+                threading.Event().wait()
+            except KeyboardInterrupt:
+                pass
+        self.stdout.write(
+            f"Served {server.requests} requests, {server.errors} errors and {server.malformed} malformed responses")
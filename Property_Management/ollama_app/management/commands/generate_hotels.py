@@ -0,0 +1,53 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from ...models import Hotel
+from ...synthetic import (
+    add_allow_synthetic_argument, check_synthetic_allowed, hotel_fixture, synthetic_hotels, synthetic_prefix)
+
+
+class Command(BaseCommand):
+    help = ('Create synthetic hotels for benchmarks, or write them out as a fixture. '
+            'Never run it against the production database: the hotels are inserted into the real hotels table.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--count', type=int, default=1000,
+            help='Number of hotels to generate (default: 1000)'
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Seed for the generated data; the same seed gives the same hotels (default: 0)'
+        )
+        parser.add_argument(
+            '--output', metavar='PATH',
+            help='Write a fixture for loaddata to PATH instead of inserting the hotels'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of hotels inserted per query (default: 1000)'
+        )
+        parser.add_argument(
+            '--delete', action='store_true',
+            help='Delete the synthetic hotels for --seed, and their generated content, instead'
+        )
+        add_allow_synthetic_argument(parser)
+
+    def handle(self, *args, **options):
+        seed = options.get('seed', 0)
+        if options.get('delete'):
+            deleted, _ = Hotel.objects.filter(hotelId__startswith=synthetic_prefix(seed)).delete()
+            self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} synthetic rows"))
+            return
+
+        hotels = synthetic_hotels(options.get('count', 1000), seed)
+        if options.get('output'):
+            with open(options['output'], 'w') as f:
+                json.dump(hotel_fixture(hotels), f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {len(hotels)} hotels to {options['output']}"))
+            return
+
+        check_synthetic_allowed(options)
+        Hotel.objects.bulk_create(hotels, batch_size=max(options.get('batch_size', 1000), 1))
+        self.stdout.write(self.style.SUCCESS(f"Created {len(hotels)} synthetic hotels"))
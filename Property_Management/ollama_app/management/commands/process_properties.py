@@ -1,40 +1,211 @@
-from django.core.management.base import BaseCommand
-from django.db import transaction
-import requests
+import asyncio
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from functools import partial, wraps
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import OuterRef, Subquery
+import hashlib
 import json
 import logging
-from typing import Dict, Any
+import threading
+from typing import Callable, Dict, Any, Iterable, List, Optional, Set, Tuple, TypeVar
 
-from ...models import Hotel, PropertyContent, PropertySummary, PropertyReview
+from ... import metrics
+from ...backends import BackendHealthCheck, BackendPool
+from ...cache import ResponseCache
+from ...claims import (
+    ClaimHeartbeat, claim_hotels, default_worker_id, enqueue_hotels, finish_claims,
+    release_claims, requeue_expired_claims)
+from ...metrics import MetricsExporter
+from ...models import Hotel, HotelClaim, ProcessingCheckpoint, PropertyContent
+from ...ollama_client import AsyncOllamaClient, GenerationContext, ModelUnavailableError, OllamaClient
+from ...profiling import RunProfiler, current_hotel, hotel_scope
+from ...retry import CircuitBreaker, RetryPolicy
+from ...stats import RunStats
+from ...writer import GeneratedProperty, PropertyWriter
 
 logger = logging.getLogger(__name__)
 
-class OllamaClient:
-    def __init__(self, base_url: str = "http://ollama:11434"):
-        self.base_url = base_url
-        self.model = "llama3.2"
+T = TypeVar('T')
+
+
+def timed(phase: str):
+    # Records how long each call of a Command method takes under `phase`
+    def decorate(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.stats.timer(phase):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorate
+
+# Bump whenever a prompt template changes, so cached responses generated from
+# the old wording are no longer reused
+PROMPT_VERSION = 1
+
+# Hotel fields used in the prompts; a change to any of them means the
+# generated content is out of date
+FINGERPRINT_FIELDS = ('title', 'location', 'city', 'price', 'room_type', 'rating')
+
+# Only these columns are loaded from the hotels table
+HOTEL_FIELDS = ('id', 'hotelId') + FINGERPRINT_FIELDS
+
+# JSON schemas passed to Ollama's `format` option when running with --json
+DESCRIPTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "description": {"type": "string"},
+    },
+    "required": ["title", "description"],
+}
+
+SUMMARY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "summary": {"type": "string"},
+    },
+    "required": ["summary"],
+}
+
+REVIEW_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "rating": {"type": "number", "minimum": 1.0, "maximum": 5.0},
+        "review": {"type": "string"},
+    },
+    "required": ["rating", "review"],
+}
+
+COMBINED_SCHEMA = {
+    "type": "object",
+    "properties": {
+        **DESCRIPTION_SCHEMA["properties"],
+        **SUMMARY_SCHEMA["properties"],
+        **REVIEW_SCHEMA["properties"],
+    },
+    "required": DESCRIPTION_SCHEMA["required"] + SUMMARY_SCHEMA["required"] + REVIEW_SCHEMA["required"],
+}
+
+PROMPT_SCHEMAS = {
+    'description': DESCRIPTION_SCHEMA,
+    'summary': SUMMARY_SCHEMA,
+    'review': REVIEW_SCHEMA,
+    'combined': COMBINED_SCHEMA,
+}
+
+JSON_TYPES = {
+    'string': str,
+    'number': (int, float),
+}
+
+
+def hotel_fingerprint(hotel: Hotel) -> str:
+    values = [getattr(hotel, field) for field in FINGERPRINT_FIELDS]
+    return hashlib.sha256(json.dumps(values, default=str).encode('utf-8')).hexdigest()
+
+
+# Stages of the three-prompt flow; summary and review both only need the
+# description, so they run side by side once it is done
+STAGES = ('description', 'summary', 'review')
+
+
+class PipelineItem:
+    # A hotel moving through the --pipeline stages
+    def __init__(self, hotel: Hotel):
+        self.hotel = hotel
+        self.content_data: Optional[Dict[str, str]] = None
+        self.results: Dict[str, Any] = {}
+        self.pending = 0
+        self.failed = False
+
+
+class WorkerConnections:
+    # Django gives every thread its own DB connection. Worker threads keep
+    # theirs from one hotel to the next instead of reconnecting for each, and
+    # they are all closed once the pool has shut down.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tracked: Dict[int, Any] = {}
+
+    def track(self) -> None:
+        # Called on the worker thread after each task
+        for connection in connections.all(initialized_only=True):
+            if connection.errors_occurred and connection.connection is not None and not connection.is_usable():
+                # Reconnect on the next task rather than keep a dead connection
+                connection.close()
+            with self.lock:
+                self.tracked[id(connection)] = connection
+
+    def close_all(self) -> None:
+        with self.lock:
+            tracked, self.tracked = list(self.tracked.values()), {}
+        for connection in tracked:
+            # The owning thread is idle or gone; allow closing it from here
+            connection.inc_thread_sharing()
+            try:
+                connection.close()
+            finally:
+                connection.dec_thread_sharing()
+
+
+class CheckpointTracker:
+    # Follows batches in the order they were handed out. Hotels finish out of
+    # order when running concurrently, so the position only moves past a batch
+    # once every hotel in it and in all earlier batches has finished.
+    # Hotels that fail are remembered instead of holding the position back, so
+    # the next run retries them without redoing everything below them.
+    def __init__(self, retry: Iterable[int] = ()):
+        self.lock = threading.Lock()
+        self.batches = deque()
+        self.position: Optional[int] = None
+        # Failed in an earlier run and not handed out again yet
+        self.retry: Set[int] = set(retry)
+        # Handed out again and not finished yet
+        self.retrying: Set[int] = set()
+        self.failed: Set[int] = set()
+
+    def add(self, batch, last_id: int) -> None:
+        with self.lock:
+            self.batches.append((last_id, {hotel.id for hotel in batch}))
+            self.advance()
+
+    def add_retry(self, batch, hotel_ids: Iterable[int]) -> None:
+        with self.lock:
+            self.retry.difference_update(hotel_ids)
+            self.retrying.update(hotel.id for hotel in batch)
+
+    def finish(self, hotel: Hotel, failed: bool = False) -> None:
+        with self.lock:
+            for _, outstanding in self.batches:
+                if hotel.id in outstanding:
+                    outstanding.discard(hotel.id)
+                    break
+            self.retrying.discard(hotel.id)
+            if failed:
+                self.failed.add(hotel.id)
+            self.advance()
+
+    def fail(self, hotel: Hotel) -> None:
+        # A hotel whose rows could not be saved after it was reported done
+        with self.lock:
+            self.failed.add(hotel.id)
+
+    def advance(self) -> None:
+        while self.batches and not self.batches[0][1]:
+            self.position = self.batches.popleft()[0]
+
+    def failed_ids(self, position: int) -> List[int]:
+        # Failures below the position are still in unfinished batches, which
+        # the next run walks again anyway
+        with self.lock:
+            hotel_ids = self.failed | self.retry | self.retrying
+        return sorted((hotel_id for hotel_id in hotel_ids if hotel_id >= position), reverse=True)
 
-    def generate(self, prompt: str) -> str:
-        try:
-            response = requests.post(
-                f"{self.base_url}/api/generate",
-                json={"model": self.model, "prompt": prompt, "stream": False},
-                stream=False
-            )
-            response.raise_for_status()
-            
-            response_data = response.json()
-            return response_data.get('response', '')
-            
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error making request to Ollama API: {str(e)}")
-            raise
-        except json.JSONDecodeError as e:
-            logger.error(f"Error decoding JSON response: {str(e)}")
-            raise
-        except Exception as e:
-            logger.error(f"Unexpected error in generate(): {str(e)}")
-            raise
 
 class Command(BaseCommand):
     help = 'Process properties using Ollama LLM'
@@ -42,9 +213,142 @@ class Command(BaseCommand):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.ollama = OllamaClient()
+        self.combined = False
+        self.json_output = False
+        self.incremental = False
+        self.parse_retries = 0
+        self.reuse_context = False
+        self.prompt_options: Dict[str, Dict[str, Any]] = {}
+        self.success_count = 0
+        self.error_count = 0
+        self.skipped_count = 0
+        self.checkpoint_name: Optional[str] = None
+        self.checkpoint = CheckpointTracker()
+        self.saved_position: Optional[int] = None
+        self.saved_failed: List[int] = []
+        self.exhausted = False
+        self.worker_id: Optional[str] = None
+        self.lease_seconds = 300.0
+        self.failed_claims: List[int] = []
+        # Failures are appended where results are collected and flushed from
+        # the batch generator, which can be different threads
+        self.failed_claims_lock = threading.Lock()
+        self.stats = RunStats()
+        self.profiler: Optional[RunProfiler] = None
+        self.writer = PropertyWriter()
+        self.worker_connections = WorkerConnections()
 
-    def generate_property_description_and_modify_title(self, hotel: Hotel) -> Dict[str, str]:
-        prompt = f"""Modify the title and generate a description for this hotel property. Respond EXACTLY in this format:
+    def json_instructions(self, prompt_type: str) -> str:
+        if not self.json_output:
+            return ""
+        fields = ", ".join(PROMPT_SCHEMAS[prompt_type]['required'])
+        return f"""
+
+            Instead of the markers, respond with a JSON object with the fields: {fields}."""
+
+    def generate_kwargs(self, prompt_type: str) -> Dict[str, Any]:
+        # Extra arguments for OllamaClient.generate() for each kind of prompt
+        kwargs: Dict[str, Any] = {'prompt_type': prompt_type}
+        if self.json_output:
+            kwargs['schema'] = PROMPT_SCHEMAS[prompt_type]
+        elif prompt_type == 'summary':
+            kwargs['is_complete'] = self.summary_complete
+            # Only the first 500 characters are kept, so a summary cut off by
+            # num_predict is still usable
+            kwargs['allow_truncated'] = True
+        if self.prompt_options.get(prompt_type):
+            kwargs['options'] = self.prompt_options[prompt_type]
+        return kwargs
+
+    def load_prompt_options(self, overrides) -> Dict[str, Dict[str, Any]]:
+        # Start from the OLLAMA_PROMPT_OPTIONS profiles and apply each
+        # --option [TYPE.]NAME=VALUE; without a TYPE it applies to every prompt
+        profiles = {
+            prompt_type: dict(settings.OLLAMA_PROMPT_OPTIONS.get(prompt_type, {}))
+            for prompt_type in PROMPT_SCHEMAS
+        }
+        for override in overrides:
+            name, separator, value = override.partition('=')
+            if not separator or not name:
+                raise CommandError(f"Invalid --option '{override}', expected [TYPE.]NAME=VALUE")
+            prompt_type, _, option = name.rpartition('.')
+            if prompt_type and prompt_type not in profiles:
+                raise CommandError(
+                    f"Unknown prompt type '{prompt_type}' in --option, expected one of: {', '.join(profiles)}")
+            try:
+                # Numbers, lists of stop sequences and so on are given as JSON
+                value = json.loads(value)
+            except ValueError:
+                pass
+            for profile_type in ([prompt_type] if prompt_type else profiles):
+                profiles[profile_type][option] = value
+        # A num_predict set for summaries explicitly still applies with --json
+        summary_cap = getattr(settings, 'OLLAMA_SUMMARY_NUM_PREDICT', 0)
+        if summary_cap > 0 and not self.json_output:
+            profiles['summary'].setdefault('num_predict', summary_cap)
+        return profiles
+
+    def ask(self, prompt_type: str, prompt: str, parse: Callable[[str], T],
+            context: Optional[GenerationContext] = None) -> T:
+        kwargs = self.generate_kwargs(prompt_type)
+        if context is not None:
+            kwargs['context'] = context
+        for attempt in range(self.parse_retries + 1):
+            with self.stats.timer(f'llm.{prompt_type}'):
+                response = self.ollama.generate(prompt, **kwargs)
+            try:
+                return parse(response)
+            except ValueError as e:
+                metrics.PARSE_FAILURES.labels(prompt_type=prompt_type).inc()
+                # Drop a malformed response from the cache so a retry asks the model again
+                self.ollama.discard(
+                    prompt, schema=kwargs.get('schema'), context=context, options=kwargs.get('options'))
+                if attempt == self.parse_retries:
+                    raise
+                self.log_parse_retry(prompt_type, attempt, e)
+
+    async def ask_async(self, prompt_type: str, prompt: str, parse: Callable[[str], T],
+                        context: Optional[GenerationContext] = None) -> T:
+        kwargs = self.generate_kwargs(prompt_type)
+        if context is not None:
+            kwargs['context'] = context
+        for attempt in range(self.parse_retries + 1):
+            with self.stats.timer(f'llm.{prompt_type}'):
+                response = await self.async_ollama.generate(prompt, **kwargs)
+            try:
+                return parse(response)
+            except ValueError as e:
+                metrics.PARSE_FAILURES.labels(prompt_type=prompt_type).inc()
+                await self.async_ollama.discard(
+                    prompt, schema=kwargs.get('schema'), context=context, options=kwargs.get('options'))
+                if attempt == self.parse_retries:
+                    raise
+                self.log_parse_retry(prompt_type, attempt, e)
+
+    def log_parse_retry(self, prompt_type: str, attempt: int, error: ValueError) -> None:
+        logger.warning(
+            f"Asking again for the {prompt_type} after an unusable response "
+            f"({attempt + 1}/{self.parse_retries}): {str(error)}")
+
+    def parse_json(self, response: str, prompt_type: str) -> Dict[str, Any]:
+        schema = PROMPT_SCHEMAS[prompt_type]
+        try:
+            data = json.loads(response)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Response format incorrect: Invalid JSON ({str(e)})")
+        if not isinstance(data, dict):
+            raise ValueError("Response format incorrect: Expected a JSON object")
+
+        for field in schema['required']:
+            field_type = schema['properties'][field]['type']
+            value = data.get(field)
+            if isinstance(value, bool) or not isinstance(value, JSON_TYPES[field_type]):
+                raise ValueError(f"Response format incorrect: Field '{field}' must be a {field_type}")
+        return data
+
+    @timed('prompt.description')
+    def description_prompt(self, hotel: Hotel) -> str:
+        return f"""Modify the title and generate a description for this hotel property. Respond EXACTLY in this format:
             TITLE: [modify the title with a catchy, SEO-friendly title under 100 characters]
             DESCRIPTION: [write a detailed description highlighting the location, amenities, and unique features]
 
@@ -55,39 +359,91 @@ class Command(BaseCommand):
             - Room Type: {hotel.room_type}
             - Rating: {hotel.rating}
 
-            Focus only on providing the TITLE and DESCRIPTION under the respective markers. DO NOT include any other text or information."""
+            Focus only on providing the TITLE and DESCRIPTION under the respective markers. DO NOT include any other text or information.{self.json_instructions('description')}"""
+
+    @timed('parse.description')
+    def parse_description(self, response: str) -> Dict[str, str]:
+        if self.json_output:
+            data = self.parse_json(response, 'description')
+            return {
+                'title': data['title'].strip()[:255],
+                'description': data['description'].strip()
+            }
+
+        # Split response using exact markers
+        title = ""
+        description = ""
         
-        try:
-            response = self.ollama.generate(prompt)
+        if "TITLE:" in response and "DESCRIPTION:" in response:
+            # Find the indices of the markers
+            title_start = response.find("TITLE:") + 6
+            desc_start = response.find("DESCRIPTION:") + 12
+            desc_end = len(response)
             
-            # Split response using exact markers
-            title = ""
-            description = ""
+            # Extract title (everything between TITLE: and DESCRIPTION:)
+            title = response[title_start:response.find("DESCRIPTION:")].strip()
             
-            if "TITLE:" in response and "DESCRIPTION:" in response:
-                # Find the indices of the markers
-                title_start = response.find("TITLE:") + 6
-                desc_start = response.find("DESCRIPTION:") + 12
-                desc_end = len(response)
-                
-                # Extract title (everything between TITLE: and DESCRIPTION:)
-                title = response[title_start:response.find("DESCRIPTION:")].strip()
-                
-                # Extract description (everything after DESCRIPTION:)
-                description = response[desc_start:desc_end].strip()
-            else:
-                raise ValueError("Response format incorrect: Missing TITLE: or DESCRIPTION: markers")
-            
-            return {
-                'title': title[:255],  # Ensure title fits in database field
-                'description': description
-            }
+            # Extract description (everything after DESCRIPTION:)
+            description = response[desc_start:desc_end].strip()
+        else:
+            raise ValueError("Response format incorrect: Missing TITLE: or DESCRIPTION: markers")
+        
+        return {
+            'title': title[:255],  # Ensure title fits in database field
+            'description': description
+        }
+
+    def generate_property_description_and_modify_title(self, hotel: Hotel) -> Dict[str, str]:
+        try:
+            return self.ask('description', self.description_prompt(hotel), self.parse_description)
         except Exception as e:
             logger.error(f"Error generating property description: {str(e)}")
             raise
 
-    def generate_summary(self, hotel: Hotel, property_content: PropertyContent) -> str:
-        prompt = f"""Create a concise one-paragraph summary of the following property. Respond EXACTLY in this format:
+    def describe(self, hotel: Hotel) -> Tuple[Dict[str, str], Optional[GenerationContext]]:
+        # With --reuse-context, also returns the context of the description
+        # exchange so the follow-up prompts can continue from it
+        if not self.reuse_context:
+            return self.generate_property_description_and_modify_title(hotel), None
+
+        prompt = self.description_prompt(hotel)
+        kwargs = self.generate_kwargs('description')
+        with self.stats.timer('llm.description'):
+            response, context = self.ollama.generate_with_context(prompt, **kwargs)
+        try:
+            return self.parse_description(response), context
+        except ValueError:
+            metrics.PARSE_FAILURES.labels(prompt_type='description').inc()
+            # Fall back to the regular prompt, which asks again for unusable
+            # responses; the follow-ups then carry the full hotel details
+            self.ollama.discard(prompt, schema=kwargs.get('schema'), options=kwargs.get('options'))
+            return self.generate_property_description_and_modify_title(hotel), None
+
+    async def describe_async(self, hotel: Hotel) -> Tuple[Dict[str, str], Optional[GenerationContext]]:
+        prompt = self.description_prompt(hotel)
+        if not self.reuse_context:
+            return await self.ask_async('description', prompt, self.parse_description), None
+
+        kwargs = self.generate_kwargs('description')
+        with self.stats.timer('llm.description'):
+            response, context = await self.async_ollama.generate_with_context(prompt, **kwargs)
+        try:
+            return self.parse_description(response), context
+        except ValueError:
+            metrics.PARSE_FAILURES.labels(prompt_type='description').inc()
+            await self.async_ollama.discard(prompt, schema=kwargs.get('schema'), options=kwargs.get('options'))
+            return await self.ask_async('description', prompt, self.parse_description), None
+
+    @timed('prompt.summary')
+    def summary_prompt(self, hotel: Hotel, description: str, continued: bool = False) -> str:
+        if continued:
+            # The hotel details and the description are already in the context
+            return f"""Now create a concise one-paragraph summary of the property you just described. Respond EXACTLY in this format:
+            SUMMARY: [write a summary under 500 characters, no other text or information]
+
+            Focus only on the key selling points of the property and make sure the response is just the summary under 500 characters. DO NOT include any other text, just the summary under the "SUMMARY:" marker.{self.json_instructions('summary')}"""
+
+        return f"""Create a concise one-paragraph summary of the following property. Respond EXACTLY in this format:
             SUMMARY: [write a summary under 500 characters, no other text or information]
 
             Hotel Information:
@@ -96,31 +452,52 @@ class Command(BaseCommand):
             - Price: ${hotel.price}
             - Room Type: {hotel.room_type}
             - Rating: {hotel.rating}
-            - Description: {property_content.description}
+            - Description: {description}
+
+            Focus only on the key selling points of the property and make sure the response is just the summary under 500 characters. DO NOT include any other text, just the summary under the "SUMMARY:" marker.{self.json_instructions('summary')}"""
+
+    @timed('parse.summary')
+    def parse_summary(self, response: str) -> str:
+        if self.json_output:
+            return self.parse_json(response, 'summary')['summary'].strip()[:500]
 
-            Focus only on the key selling points of the property and make sure the response is just the summary under 500 characters. DO NOT include any other text, just the summary under the "SUMMARY:" marker."""
+        summary = ""
         
+        if "SUMMARY:" in response:
+            # Find the index of the SUMMARY: marker
+            summary_start = response.find("SUMMARY:") + 8
+            summary = response[summary_start:].strip()
+        else:
+            raise ValueError("Response format incorrect: Missing SUMMARY: marker")
+        
+        # Ensure summary doesn't exceed 500 characters
+        return summary[:500]
+
+    def summary_complete(self, response: str) -> bool:
+        # parse_summary keeps only the first 500 characters, so a streamed
+        # summary can be cut off as soon as that much has arrived
+        if "SUMMARY:" not in response:
+            return False
+        summary_start = response.find("SUMMARY:") + 8
+        return len(response[summary_start:].strip()) >= 500
+
+    def generate_summary(self, hotel: Hotel, property_content: PropertyContent,
+                         context: Optional[GenerationContext] = None) -> str:
         try:
-            response = self.ollama.generate(prompt)
-            
-            summary = ""
-            
-            if "SUMMARY:" in response:
-                # Find the index of the SUMMARY: marker
-                summary_start = response.find("SUMMARY:") + 8
-                summary = response[summary_start:].strip()
-            else:
-                raise ValueError("Response format incorrect: Missing SUMMARY: marker")
-            
-            # Ensure summary doesn't exceed 500 characters
-            return summary[:500]
-            
+            prompt = self.summary_prompt(hotel, property_content.description, continued=context is not None)
+            return self.ask('summary', prompt, self.parse_summary, context=context)
         except Exception as e:
             logger.error(f"Error generating summary: {str(e)}")
             raise
 
-    def generate_review(self, hotel: Hotel, property_content: PropertyContent) -> Dict[str, Any]:
-        prompt = f"""Generate a realistic guest review based on this property. Respond EXACTLY in this format:
+    @timed('prompt.review')
+    def review_prompt(self, hotel: Hotel, description: str, continued: bool = False) -> str:
+        if continued:
+            return f"""Now write a realistic guest review of the property you just described. Respond EXACTLY in this format:
+            RATING: [number between 1.0-5.0]
+            REVIEW: [write a detailed guest review]{self.json_instructions('review')}"""
+
+        return f"""Generate a realistic guest review based on this property. Respond EXACTLY in this format:
             RATING: [number between 1.0-5.0]
             REVIEW: [write a detailed guest review]
 
@@ -130,89 +507,978 @@ class Command(BaseCommand):
             - Price: ${hotel.price}
             - Room Type: {hotel.room_type}
             - Rating: {hotel.rating}
-            - Description: {property_content.description}"""
+            - Description: {description}{self.json_instructions('review')}"""
+
+    @timed('parse.review')
+    def parse_review(self, response: str) -> Dict[str, Any]:
+        if self.json_output:
+            data = self.parse_json(response, 'review')
+            return {
+                'rating': min(max(float(data['rating']), 1.0), 5.0),
+                'review': data['review'].strip()
+            }
+
+        rating = 4.0  # Default rating
+        review = ""
         
-        try:
-            response = self.ollama.generate(prompt)
-            
-            rating = 4.0  # Default rating
-            review = ""
+        if "RATING:" in response and "REVIEW:" in response:
+            # Find the indices of the markers
+            rating_start = response.find("RATING:") + 7
+            review_start = response.find("REVIEW:") + 7
             
-            if "RATING:" in response and "REVIEW:" in response:
-                # Find the indices of the markers
-                rating_start = response.find("RATING:") + 7
-                review_start = response.find("REVIEW:") + 7
-                
-                # Extract rating
-                rating_str = response[rating_start:response.find("REVIEW:")].strip()
-                try:
-                    rating = float(rating_str)
-                except ValueError:
-                    rating = 4.0  # Default rating if parsing fails
-                
-                # Extract review
-                review = response[review_start:].strip()
-            else:
-                raise ValueError("Response format incorrect: Missing RATING: or REVIEW: markers")
+            # Extract rating
+            rating_str = response[rating_start:response.find("REVIEW:")].strip()
+            try:
+                rating = float(rating_str)
+            except ValueError:
+                rating = 4.0  # Default rating if parsing fails
             
-            return {
-                'rating': min(max(rating, 1.0), 5.0),  # Ensure rating is between 1.0 and 5.0
-                'review': review
-            }
+            # Extract review
+            review = response[review_start:].strip()
+        else:
+            raise ValueError("Response format incorrect: Missing RATING: or REVIEW: markers")
+        
+        return {
+            'rating': min(max(rating, 1.0), 5.0),  # Ensure rating is between 1.0 and 5.0
+            'review': review
+        }
+
+    def generate_review(self, hotel: Hotel, property_content: PropertyContent,
+                        context: Optional[GenerationContext] = None) -> Dict[str, Any]:
+        try:
+            prompt = self.review_prompt(hotel, property_content.description, continued=context is not None)
+            return self.ask('review', prompt, self.parse_review, context=context)
         except Exception as e:
             logger.error(f"Error generating review: {str(e)}")
             raise
 
-    @transaction.atomic
+    @timed('prompt.combined')
+    def combined_prompt(self, hotel: Hotel) -> str:
+        return f"""Rewrite the title, write a description, a summary and a realistic guest review for this hotel property. Respond EXACTLY in this format:
+            TITLE: [modify the title with a catchy, SEO-friendly title under 100 characters]
+            DESCRIPTION: [write a detailed description highlighting the location, amenities, and unique features]
+            SUMMARY: [write a one-paragraph summary of the key selling points under 500 characters]
+            RATING: [number between 1.0-5.0]
+            REVIEW: [write a detailed guest review]
+
+            Hotel Information:
+            - Title: {hotel.title}
+            - Location: {hotel.location}, {hotel.city}
+            - Price: ${hotel.price}
+            - Room Type: {hotel.room_type}
+            - Rating: {hotel.rating}
+
+            Provide every field under its marker, in the order shown. DO NOT include any other text or information.{self.json_instructions('combined')}"""
+
+    @timed('parse.combined')
+    def parse_combined(self, response: str) -> Tuple[Dict[str, str], str, Dict[str, Any]]:
+        if self.json_output:
+            # Every field parser reads its own keys from the same JSON object
+            self.parse_json(response, 'combined')
+            return self.parse_description(response), self.parse_summary(response), self.parse_review(response)
+
+        # Cut the response at the SUMMARY: and RATING: markers and hand each part
+        # to the parser of the matching single-purpose prompt
+        summary_start = response.find("SUMMARY:")
+        rating_start = response.find("RATING:")
+        if summary_start == -1 or rating_start == -1 or rating_start < summary_start:
+            raise ValueError("Response format incorrect: Missing SUMMARY: or RATING: markers")
+
+        content_data = self.parse_description(response[:summary_start])
+        summary = self.parse_summary(response[summary_start:rating_start])
+        review_data = self.parse_review(response[rating_start:])
+        return content_data, summary, review_data
+
+    def generate_combined(self, hotel: Hotel) -> Tuple[Dict[str, str], str, Dict[str, Any]]:
+        try:
+            return self.ask('combined', self.combined_prompt(hotel), self.parse_combined)
+        except Exception as e:
+            logger.error(f"Error generating combined property content: {str(e)}")
+            raise
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Number of properties to process concurrently (default: 1)'
+        )
+        parser.add_argument(
+            '--pool-size', type=int,
+            help='Maximum number of open connections to Ollama (default: number of workers)'
+        )
+        parser.add_argument(
+            '--connect-timeout', type=float,
+            help=f'Seconds to wait for a connection to Ollama (default: {settings.OLLAMA_CONNECT_TIMEOUT})'
+        )
+        parser.add_argument(
+            '--read-timeout', type=float,
+            help=f'Seconds to wait for an Ollama response (default: {settings.OLLAMA_READ_TIMEOUT})'
+        )
+        parser.add_argument(
+            '--backend', action='append', dest='backends', metavar='URL',
+            help='Ollama server to send requests to; repeat to spread requests over several servers '
+                 '(default: OLLAMA_BASE_URLS)'
+        )
+        parser.add_argument(
+            '--backend-concurrency', type=int,
+            help='Maximum number of requests in flight per Ollama server (default: the pool size)'
+        )
+        parser.add_argument(
+            '--adaptive', action='store_true',
+            help='Tune the requests in flight per Ollama server to its observed latency and errors, '
+                 'up to --backend-concurrency'
+        )
+        parser.add_argument(
+            '--health-check-interval', type=float,
+            help='Seconds between health checks of the Ollama servers, 0 to disable '
+                 f'(default: {settings.OLLAMA_HEALTH_CHECK_INTERVAL})'
+        )
+        parser.add_argument(
+            '--retries', type=int,
+            help=f'Times to retry a failed Ollama request (default: {settings.OLLAMA_RETRIES})'
+        )
+        parser.add_argument(
+            '--deadline', type=float,
+            help=f'Seconds one Ollama call may take including retries (default: {settings.OLLAMA_CALL_DEADLINE})'
+        )
+        parser.add_argument(
+            '--parse-retries', type=int, default=2,
+            help='Times to ask again when a response cannot be parsed (default: 2)'
+        )
+        parser.add_argument(
+            '--stream', action='store_true',
+            help='Stream responses from Ollama and stop generating once the needed text has arrived'
+        )
+        parser.add_argument(
+            '--async', action='store_true', dest='use_async',
+            help='Process properties on an asyncio event loop instead of worker threads'
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=10,
+            help='Maximum number of properties in flight with --async (default: 10)'
+        )
+        parser.add_argument(
+            '--pipeline', action='store_true',
+            help='Run description, summary and review generation as separate stages with their own workers, '
+                 'so different properties overlap'
+        )
+        for stage in STAGES:
+            parser.add_argument(
+                f'--{stage}-workers', type=int,
+                help=f'Workers for the {stage} stage with --pipeline '
+                     '(default: --workers, or --concurrency with --async)'
+            )
+        parser.add_argument(
+            '--option', action='append', dest='options', default=[], metavar='[TYPE.]NAME=VALUE',
+            help='Ollama generation option for one prompt type (description, summary, review, combined) '
+                 'or, without TYPE, for all of them, e.g. summary.num_predict=160, temperature=0.7 or '
+                 'keep_alive=30m; overrides OLLAMA_PROMPT_OPTIONS'
+        )
+        parser.add_argument(
+            '--keep-alive',
+            help=f'How long Ollama keeps the model loaded between requests (default: {settings.OLLAMA_KEEP_ALIVE})'
+        )
+        parser.add_argument(
+            '--no-warm-up', action='store_false', dest='warm_up',
+            help='Do not load the model on every Ollama server before processing starts'
+        )
+        parser.add_argument(
+            '--reuse-context', action='store_true',
+            help="Continue the summary and review prompts from the description's context tokens "
+                 "instead of sending the hotel details and description again"
+        )
+        parser.add_argument(
+            '--combined', action='store_true',
+            help='Generate title, description, summary and review with a single prompt per property'
+        )
+        parser.add_argument(
+            '--json', action='store_true', dest='json_output',
+            help="Ask Ollama for JSON that matches a schema instead of parsing text markers"
+        )
+        parser.add_argument(
+            '--cache', action='store_true',
+            help='Reuse stored responses for prompts that were already generated'
+        )
+        parser.add_argument(
+            '--cache-ttl', type=float,
+            help=f'Seconds a cached response stays valid (default: {settings.OLLAMA_CACHE_TTL:g})'
+        )
+        parser.add_argument(
+            '--cache-max-entries', type=int,
+            help=f'Maximum number of cached responses to keep (default: {settings.OLLAMA_CACHE_MAX_ENTRIES})'
+        )
+        parser.add_argument(
+            '--limit', type=int, default=5,
+            help='Maximum number of hotels to process, newest first; with --incremental, unchanged hotels '
+                 'that are skipped do not count. 0 processes all of them (default: 5)'
+        )
+        parser.add_argument(
+            '--offset', type=int, default=0,
+            help='Number of hotels to skip before processing starts; ignored when resuming a --checkpoint (default: 0)'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Number of hotels loaded from the database at a time (default: 100)'
+        )
+        parser.add_argument(
+            '--min-id', type=int,
+            help='Only process hotels with an id greater than or equal to this'
+        )
+        parser.add_argument(
+            '--max-id', type=int,
+            help='Only process hotels with an id less than or equal to this'
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='Record progress under this name and resume from it if a previous run stopped early'
+        )
+        parser.add_argument(
+            '--reset-checkpoint', action='store_true',
+            help='Discard the saved progress of --checkpoint and start from the newest hotel'
+        )
+        parser.add_argument(
+            '--enqueue', action='store_true',
+            help='Add the selected hotels to the shared work queue instead of processing them'
+        )
+        parser.add_argument(
+            '--claim', action='store_true',
+            help='Process hotels claimed from the shared work queue, so several machines can share a run'
+        )
+        parser.add_argument(
+            '--worker-id',
+            help='Name this worker uses for its claims (default: hostname and process id)'
+        )
+        parser.add_argument(
+            '--lease-seconds', type=float, default=300.0,
+            help='Seconds without a heartbeat after which a claim is handed to another worker (default: 300)'
+        )
+        parser.add_argument(
+            '--flush-size', type=int, default=50,
+            help='Number of generated properties saved together in one bulk insert (default: 50)'
+        )
+        parser.add_argument(
+            '--flush-interval', type=float, default=10.0,
+            help='Longest time in seconds a generated property waits in the buffer before it is saved (default: 10)'
+        )
+        parser.add_argument(
+            '--incremental', action='store_true',
+            help='Only process hotels that are new or whose details changed since their content was generated'
+        )
+        parser.add_argument(
+            '--report', metavar='PATH',
+            help='Also write the phase timings and token throughput of the run to PATH as JSON'
+        )
+        parser.add_argument(
+            '--profile', metavar='PATH',
+            help='Profile the run with cProfile, write the profile to PATH and report the ORM queries per hotel'
+        )
+        parser.add_argument(
+            '--metrics-file', metavar='PATH',
+            help='Keep PATH updated with the run\'s metrics in the Prometheus text format, '
+                 'for the node_exporter textfile collector'
+        )
+        parser.add_argument(
+            '--metrics-push', metavar='URL',
+            help='Push the run\'s metrics to the Prometheus Pushgateway at URL (job "process_properties")'
+        )
+        parser.add_argument(
+            '--metrics-interval', type=float, default=15.0,
+            help='Seconds between updates of --metrics-file and --metrics-push (default: 15)'
+        )
+
+    def process_hotel(self, hotel: Hotel) -> None:
+        with hotel_scope(hotel.id):
+            if self.combined:
+                content_data, summary, review_data = self.generate_combined(hotel)
+            else:
+                content_data, context = self.describe(hotel)
+                # The follow-up prompts only need the generated description, so the
+                # content row does not have to exist before they are sent
+                property_content = PropertyContent(
+                    title=content_data['title'], description=content_data['description'])
+                summary = self.generate_summary(hotel, property_content, context)
+                review_data = self.generate_review(hotel, property_content, context)
+
+            self.save_property(hotel, content_data, summary, review_data)
+
+    def profile_thread(self):
+        # Worker threads are only profiled while they run a task
+        return self.profiler.thread() if self.profiler is not None else nullcontext()
+
+    def process_hotel_in_worker(self, hotel: Hotel) -> None:
+        try:
+            with self.profile_thread():
+                self.process_hotel(hotel)
+        finally:
+            self.worker_connections.track()
+
+    def changed_hotels(self, hotels):
+        # Look up the fingerprint of each hotel's latest content in one query
+        # and keep only the hotels that are new or whose prompt fields changed.
+        # Older rows do not count: an incremental run rewrites the latest one.
+        latest = PropertyContent.objects.filter(
+            hotel_id=OuterRef('hotel_id')).order_by('-created_at', '-id').values('id')[:1]
+        stored = dict(PropertyContent.objects.filter(
+            hotel_id__in=[hotel.id for hotel in hotels], id=Subquery(latest)
+        ).values_list('hotel_id', 'source_fingerprint'))
+        return [hotel for hotel in hotels if stored.get(hotel.id) != hotel_fingerprint(hotel)]
+
+    def save_property(self, hotel: Hotel, content_data: Dict[str, str], summary: str,
+                      review_data: Dict[str, Any]) -> None:
+        # The writer saves all three rows for a hotel in one transaction, either
+        # right away or together with other hotels when --flush-size is above 1
+        self.writer.add(GeneratedProperty(hotel, content_data, summary, review_data, hotel_fingerprint(hotel)))
+
+    async def process_hotel_async(self, hotel: Hotel, semaphore: asyncio.Semaphore) -> None:
+        # Each hotel runs in its own task, so the scope does not leak into others
+        current_hotel.set(hotel.id)
+        async with semaphore:
+            if self.combined:
+                content_data, summary, review_data = await self.ask_async(
+                    'combined', self.combined_prompt(hotel), self.parse_combined)
+            else:
+                content_data, context = await self.describe_async(hotel)
+                continued = context is not None
+                summary = await self.ask_async(
+                    'summary', self.summary_prompt(hotel, content_data['description'], continued),
+                    self.parse_summary, context)
+                review_data = await self.ask_async(
+                    'review', self.review_prompt(hotel, content_data['description'], continued),
+                    self.parse_review, context)
+
+        # The rows are written only once all generations succeeded, so the
+        # transaction never stays open while waiting on the LLM
+        await sync_to_async(self.save_property)(hotel, content_data, summary, review_data)
+
+    async def process_hotel_pipelined_async(self, hotel: Hotel,
+                                            semaphores: Dict[str, asyncio.Semaphore]) -> None:
+        # Each stage has its own limit, so a hotel waiting for a summary slot
+        # does not hold up another hotel's description
+        async def run_stage(stage: str, prompt: str, parse: Callable[[str], T]) -> T:
+            async with semaphores[stage]:
+                return await self.ask_async(stage, prompt, parse, context)
+
+        current_hotel.set(hotel.id)
+        async with semaphores['description']:
+            content_data, context = await self.describe_async(hotel)
+        continued = context is not None
+        results = await asyncio.gather(
+            run_stage('summary', self.summary_prompt(hotel, content_data['description'], continued),
+                      self.parse_summary),
+            run_stage('review', self.review_prompt(hotel, content_data['description'], continued),
+                      self.parse_review),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        summary, review_data = results
+
+        await sync_to_async(self.save_property)(hotel, content_data, summary, review_data)
+
+    async def process_hotels_async(self, batches, concurrency: int,
+                                   stage_workers: Optional[Dict[str, int]] = None) -> None:
+        if stage_workers:
+            semaphores = {stage: asyncio.Semaphore(count) for stage, count in stage_workers.items()}
+            process = partial(self.process_hotel_pipelined_async, semaphores=semaphores)
+            scheduled = sum(stage_workers.values())
+        else:
+            semaphore = asyncio.Semaphore(concurrency)
+            process = partial(self.process_hotel_async, semaphore=semaphore)
+            scheduled = concurrency
+        next_batch = sync_to_async(next)
+        tasks = {}
+
+        try:
+            batch = await next_batch(batches, None)
+            while batch is not None or tasks:
+                # Keep a couple of batches' worth of hotels scheduled so the
+                # semaphore never runs dry, without loading the whole table
+                while batch is not None and len(tasks) < scheduled * 2:
+                    for hotel in batch:
+                        tasks[asyncio.ensure_future(process(hotel))] = hotel
+                    batch = await next_batch(batches, None)
+                if not tasks:
+                    continue
+
+                metrics.HOTELS_IN_FLIGHT.set(len(tasks))
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    self.record_result(tasks.pop(task), task.exception())
+        finally:
+            await self.async_ollama.close()
+            # Database work ran on the sync_to_async thread; release its connection
+            await sync_to_async(connections.close_all)()
+
+    def process_hotels_threaded(self, batches, workers: int) -> None:
+        # Results are collected here on the main thread, so the counters and
+        # console output never need to be shared with the workers
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {}
+                for batch in batches:
+                    for hotel in batch:
+                        futures[executor.submit(self.process_hotel_in_worker, hotel)] = hotel
+                    # Fetch the next batch only once the queue is nearly drained
+                    while len(futures) >= workers:
+                        self.collect_results(futures)
+                while futures:
+                    self.collect_results(futures)
+        finally:
+            # Don't leave the workers' idle connections behind on the server
+            self.worker_connections.close_all()
+
+    def run_stage(self, generate: Callable[..., T], hotel: Hotel, *args) -> T:
+        try:
+            with self.profile_thread(), hotel_scope(hotel.id):
+                return generate(hotel, *args)
+        finally:
+            # The response cache may have opened a DB connection in this thread
+            self.worker_connections.track()
+
+    def process_hotels_pipelined(self, batches, stage_workers: Dict[str, int]) -> None:
+        # Every stage has its own thread pool. The main thread hands each
+        # finished description on to the summary and review pools and saves a
+        # hotel once both are back, so one hotel's review overlaps with the
+        # next hotels' descriptions.
+        executors = {
+            stage: ThreadPoolExecutor(max_workers=count, thread_name_prefix=f'{stage}-stage')
+            for stage, count in stage_workers.items()
+        }
+        hotels = (hotel for batch in batches for hotel in batch)
+        # Bound the hotels between stages so a slow stage does not make the
+        # earlier ones race through the whole table
+        max_in_flight = sum(stage_workers.values()) * 2
+        futures = {}
+        describing = 0
+        in_flight = 0
+
+        def submit(stage: str, item: PipelineItem, generate: Callable[..., Any], *args) -> None:
+            futures[executors[stage].submit(self.run_stage, generate, item.hotel, *args)] = (stage, item)
+            item.pending += 1
+
+        try:
+            while True:
+                while describing < stage_workers['description'] and in_flight < max_in_flight:
+                    hotel = next(hotels, None)
+                    if hotel is None:
+                        break
+                    submit('description', PipelineItem(hotel), self.describe)
+                    describing += 1
+                    in_flight += 1
+                if not futures:
+                    break
+
+                metrics.HOTELS_IN_FLIGHT.set(in_flight)
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage, item = futures.pop(future)
+                    item.pending -= 1
+                    if stage == 'description':
+                        describing -= 1
+                    error = future.exception()
+
+                    if item.failed:
+                        # Another stage already failed and recorded this hotel
+                        pass
+                    elif error is not None:
+                        item.failed = True
+                        self.record_result(item.hotel, error)
+                    elif stage == 'description':
+                        item.content_data, context = future.result()
+                        property_content = PropertyContent(
+                            title=item.content_data['title'], description=item.content_data['description'])
+                        submit('summary', item, self.generate_summary, property_content, context)
+                        submit('review', item, self.generate_review, property_content, context)
+                    else:
+                        item.results[stage] = future.result()
+                        if not item.pending:
+                            self.save_pipelined(item)
+
+                    if not item.pending:
+                        in_flight -= 1
+        finally:
+            for executor in executors.values():
+                executor.shutdown(wait=True, cancel_futures=True)
+            self.worker_connections.close_all()
+
+    def save_pipelined(self, item: PipelineItem) -> None:
+        try:
+            with hotel_scope(item.hotel.id):
+                self.save_property(item.hotel, item.content_data, item.results['summary'], item.results['review'])
+        except Exception as e:
+            self.record_result(item.hotel, e)
+        else:
+            self.record_result(item.hotel)
+
+    def collect_results(self, futures) -> None:
+        metrics.HOTELS_IN_FLIGHT.set(len(futures))
+        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+        for future in done:
+            self.record_result(futures.pop(future), future.exception())
+
+    def process_hotels_sequentially(self, batches) -> None:
+        for batch in batches:
+            for hotel in batch:
+                try:
+                    self.process_hotel(hotel)
+                    self.record_result(hotel)
+                except Exception as e:
+                    self.record_result(hotel, e)
+
+    def hotel_batches(self, batch_size: int, limit: Optional[int] = None, offset: int = 0,
+                      min_id: Optional[int] = None, max_id: Optional[int] = None):
+        # Walk the hotels table newest first with keyset pagination on id, so
+        # every page is a cheap index range scan and only one page is in memory
+        queryset = Hotel.objects.only(*HOTEL_FIELDS).order_by('-id')
+        if min_id is not None:
+            queryset = queryset.filter(id__gte=min_id)
+        if max_id is not None:
+            queryset = queryset.filter(id__lte=max_id)
+
+        remaining = limit
+        # Hotels that failed in the run that saved the checkpoint go first
+        retry = sorted(self.checkpoint.retry, reverse=True)
+        for start in range(0, len(retry), batch_size):
+            if remaining is not None and remaining <= 0:
+                return
+            size = batch_size if remaining is None else min(batch_size, remaining)
+            hotel_ids = retry[start:start + size]
+            with self.stats.timer('db_fetch'):
+                batch = list(Hotel.objects.only(*HOTEL_FIELDS).filter(id__in=hotel_ids).order_by('-id'))
+            if remaining is not None:
+                remaining -= len(hotel_ids)
+            self.checkpoint.add_retry(batch, hotel_ids)
+            if batch:
+                yield batch
+
+        page = queryset
+        while remaining is None or remaining > 0:
+            # Fetching a batch means earlier work has drained, which makes it
+            # a natural point to record progress
+            self.save_checkpoint()
+
+            # Unchanged hotels are skipped and do not count towards the limit,
+            # so an incremental run reads whole pages until it has enough
+            size = batch_size if remaining is None or self.incremental else min(batch_size, remaining)
+            # The offset only applies to the first page, later pages continue
+            # below the last id already seen
+            with self.stats.timer('db_fetch'):
+                batch = list(page[offset:offset + size])
+            if not batch:
+                self.exhausted = True
+                return
+            offset = 0
+            last_page = len(batch) < size
+
+            hotels = batch
+            if self.incremental:
+                with self.stats.timer('db_fetch'):
+                    hotels = self.changed_hotels(batch)
+                if remaining is not None and len(hotels) > remaining:
+                    # Stop at the last hotel within the limit; the rest of the
+                    # page is left for the next run
+                    hotels = hotels[:remaining]
+                    batch = [hotel for hotel in batch if hotel.id >= hotels[-1].id]
+                    last_page = False
+                self.skipped_count += len(batch) - len(hotels)
+            if remaining is not None:
+                remaining -= len(hotels)
+            last_id = batch[-1].id
+            page = queryset.filter(id__lt=last_id)
+
+            self.checkpoint.add(hotels, last_id)
+            if hotels:
+                yield hotels
+            if last_page:
+                self.exhausted = True
+                return
+
+    def claimed_batches(self, batch_size: int, limit: Optional[int] = None):
+        remaining = limit
+        while remaining is None or remaining > 0:
+            self.flush_failed_claims()
+            requeue_expired_claims(self.lease_seconds)
+
+            size = batch_size if remaining is None else min(batch_size, remaining)
+            with self.stats.timer('db_fetch'):
+                hotel_ids = claim_hotels(self.worker_id, size)
+                batch = list(Hotel.objects.only(*HOTEL_FIELDS).filter(id__in=hotel_ids).order_by('-id'))
+            if not hotel_ids:
+                self.exhausted = True
+                return
+            if remaining is not None:
+                remaining -= len(hotel_ids)
+
+            yield batch
+
+    def flush_failed_claims(self) -> None:
+        # Failures are recorded where results are collected, which may be the
+        # event loop, so they are written to the database with the next claim
+        if self.worker_id is None:
+            return
+        with self.failed_claims_lock:
+            failed, self.failed_claims = self.failed_claims, []
+        if not failed:
+            return
+        try:
+            finish_claims(self.worker_id, failed, HotelClaim.FAILED)
+        except BaseException:
+            # Try again with the next claim
+            with self.failed_claims_lock:
+                self.failed_claims[:0] = failed
+            raise
+
+    def save_checkpoint(self) -> None:
+        position = self.checkpoint.position
+        if position is None:
+            position = self.saved_position
+        if self.checkpoint_name is None or position is None:
+            return
+        if position == self.saved_position and self.checkpoint.failed_ids(position) == self.saved_failed:
+            return
+        # Hotels before the position may still be waiting in the writer, and
+        # any of them that fail to save have to be kept for the next run
+        self.writer.flush()
+        failed = self.checkpoint.failed_ids(position)
+        ProcessingCheckpoint.objects.update_or_create(
+            name=self.checkpoint_name, defaults={'last_hotel_id': position, 'failed_hotel_ids': failed})
+        self.saved_position = position
+        self.saved_failed = failed
+
+    def record_result(self, hotel: Hotel, error: Optional[BaseException] = None) -> None:
+        self.checkpoint.finish(hotel, failed=error is not None)
+        if error is None:
+            self.success_count += 1
+            self.report_success(hotel)
+        else:
+            self.error_count += 1
+            metrics.PROPERTIES.labels(result='failed').inc()
+            self.report_error(hotel, error)
+            if self.worker_id is not None:
+                with self.failed_claims_lock:
+                    self.failed_claims.append(hotel.id)
+        self.collect_write_failures()
+
+    def collect_write_failures(self) -> None:
+        # Hotels are counted as processed once generated; if saving them fails
+        # later, move them over to the failures
+        for hotel, error in self.writer.take_failures():
+            self.success_count -= 1
+            self.record_result(hotel, error)
+
+    def report_success(self, hotel: Hotel) -> None:
+        self.stdout.write(self.style.SUCCESS(
+            f"Successfully processed property {hotel.hotelId}"
+        ))
+
+    def report_error(self, hotel: Hotel, error: BaseException) -> None:
+        self.stdout.write(self.style.ERROR(
+            f"Error processing property {hotel.hotelId}: {str(error)}"
+        ))
+        logger.error(f"Error processing property {hotel.hotelId}",
+                     exc_info=(type(error), error, error.__traceback__))
+
     def handle(self, *args, **options):
-        hotels = Hotel.objects.all().order_by('-id')[:5]  # Limit to 5 properties for testing. Change here to process how many properties you want
-        self.stdout.write(f"Processing {len(hotels)} properties...")
-        
-        success_count = 0
-        error_count = 0
+        workers = max(options.get('workers', 1), 1)
+        self.combined = options.get('combined', False)
+        self.json_output = options.get('json_output', False)
+        self.incremental = options.get('incremental', False)
+        self.parse_retries = max(options.get('parse_retries', 2), 0)
+        self.reuse_context = options.get('reuse_context', False)
+        self.prompt_options = self.load_prompt_options(options.get('options', []))
+        self.stats = RunStats()
+        keep_alive = options.get('keep_alive') or settings.OLLAMA_KEEP_ALIVE
+        if keep_alive:
+            # Every request renews the keep-alive; an explicit --option keep_alive wins
+            for profile in self.prompt_options.values():
+                profile.setdefault('keep_alive', keep_alive)
 
-        for hotel in hotels:
-            try:
-                # Generate and save property content
-                content_data = self.generate_property_description_and_modify_title(hotel)
-                property_content = PropertyContent.objects.create(
-                    hotel=hotel,
-                    title=content_data['title'],
-                    description=content_data['description'],
-                    propertyId=hotel.hotelId
-                    
-                )
+        cache = None
+        if options.get('cache'):
+            cache = ResponseCache(PROMPT_VERSION, ttl=options.get('cache_ttl'),
+                                  max_entries=options.get('cache_max_entries'))
+            cache.prune()
 
-                # Generate and save summary
-                summary = self.generate_summary(hotel, property_content)
-                PropertySummary.objects.create(
-                    property=property_content,
-                    summary=summary,
-                    propertyId=hotel.hotelId
-                )
+        # Size the connection pool to the number of workers so every worker can
+        # hold a keep-alive connection without waiting on the others
+        use_async = options.get('use_async', False)
+        concurrency = max(options.get('concurrency', 10), 1)
+        in_flight = concurrency if use_async else workers
 
-                # Generate and save review
-                review_data = self.generate_review(hotel, property_content)
-                PropertyReview.objects.create(
-                    property=property_content,
-                    rating=review_data['rating'],
-                    review=review_data['review'],
-                    propertyId=hotel.hotelId
-                )
+        stage_workers = None
+        if options.get('pipeline'):
+            if self.combined:
+                raise CommandError("--pipeline runs the three prompts as stages and cannot be used with --combined")
+            stage_workers = {
+                stage: max(options.get(f'{stage}_workers') or in_flight, 1) for stage in STAGES
+            }
+            in_flight = sum(stage_workers.values())
+        pool_size = options.get('pool_size') or in_flight
+
+        health_check_interval = options.get('health_check_interval')
+        if health_check_interval is None:
+            health_check_interval = settings.OLLAMA_HEALTH_CHECK_INTERVAL
+        backends = BackendPool(
+            options.get('backends') or settings.OLLAMA_BASE_URLS,
+            max_concurrency=(options.get('backend_concurrency')
+                             or settings.OLLAMA_BACKEND_CONCURRENCY or pool_size),
+            # Failed backends are only ejected when a health check can bring them back
+            failure_threshold=3 if health_check_interval > 0 else 0,
+            adaptive=options.get('adaptive', False),
+        )
+        # Shared by both clients, so an outage pauses every request
+        retry = RetryPolicy(retries=options.get('retries'), deadline=options.get('deadline'))
+        breaker = CircuitBreaker()
+
+        self.ollama = OllamaClient(
+            pool_size=pool_size,
+            connect_timeout=options.get('connect_timeout'),
+            read_timeout=options.get('read_timeout'),
+            stream=options.get('stream', False),
+            cache=cache,
+            backends=backends,
+            retry=retry,
+            breaker=breaker,
+            stats=self.stats,
+        )
+
+        limit = options.get('limit', 5) or None
+        batch_size = max(options.get('batch_size', 100), 1)
+        max_id = options.get('max_id')
+        offset = options.get('offset', 0)
+
+        self.checkpoint_name = options.get('checkpoint')
+        if self.checkpoint_name and options.get('claim'):
+            raise CommandError("--checkpoint cannot be combined with --claim; the claim queue tracks progress")
+        self.checkpoint = CheckpointTracker()
+        self.saved_position = None
+        self.saved_failed = []
+        self.exhausted = False
+        if self.checkpoint_name:
+            if options.get('reset_checkpoint'):
+                ProcessingCheckpoint.objects.filter(name=self.checkpoint_name).delete()
+            saved = ProcessingCheckpoint.objects.filter(name=self.checkpoint_name).first()
+            if saved is not None:
+                self.saved_failed = list(saved.failed_hotel_ids or [])
+                self.stdout.write(
+                    f"Resuming checkpoint '{self.checkpoint_name}' below hotel id {saved.last_hotel_id}"
+                    + (f", retrying {len(self.saved_failed)} failed properties first" if self.saved_failed else ""))
+                self.checkpoint = CheckpointTracker(retry=self.saved_failed)
+                self.saved_position = saved.last_hotel_id
+                max_id = saved.last_hotel_id - 1 if max_id is None else min(max_id, saved.last_hotel_id - 1)
+                # The first run already skipped the --offset newest hotels, and
+                # the saved position is below them
+                offset = 0
+
+        self.success_count = 0
+        self.error_count = 0
+        self.skipped_count = 0
+
+        batches = self.hotel_batches(
+            batch_size,
+            limit=limit,
+            offset=offset,
+            min_id=options.get('min_id'),
+            max_id=max_id,
+        )
+
+        if options.get('enqueue'):
+            queued = sum(enqueue_hotels(batch) for batch in batches)
+            self.stdout.write(self.style.SUCCESS(f"Queued {queued} properties for processing"))
+            return
+
+        # Fail once, before anything is claimed or sent, rather than once per hotel
+        try:
+            self.ollama.check_model()
+        except ModelUnavailableError as e:
+            self.ollama.close()
+            raise CommandError(str(e))
+        if options.get('warm_up', True):
+            self.stdout.write(f"Loading model '{self.ollama.model}'...")
+            self.ollama.warm_up(keep_alive)
+
+        heartbeat = None
+        self.worker_id = None
+        self.failed_claims = []
+        if options.get('claim'):
+            # Hotels come from the shared queue instead of the hotels table, so
+            # several machines can run this command against the same database
+            self.worker_id = options.get('worker_id') or default_worker_id()
+            self.lease_seconds = options.get('lease_seconds') or 300.0
+            batches = self.claimed_batches(batch_size, limit=limit)
+            heartbeat = ClaimHeartbeat(self.worker_id, self.lease_seconds / 3)
+            heartbeat.start()
+            self.stdout.write(f"Claiming queued properties as worker '{self.worker_id}'")
+
+        self.writer = PropertyWriter(
+            flush_size=options.get('flush_size', 50),
+            flush_interval=options.get('flush_interval', 10.0),
+            incremental=self.incremental,
+            worker_id=self.worker_id,
+            stats=self.stats,
+            on_failure=self.checkpoint.fail,
+        )
+        self.writer.start()
 
-                success_count += 1
-                self.stdout.write(self.style.SUCCESS(
-                    f"Successfully processed property {hotel.hotelId}"
-                ))
+        self.stdout.write(
+            f"Processing {f'up to {limit}' if limit else 'all'} properties in batches of {batch_size}..."
+        )
+        if len(backends.backends) > 1:
+            self.stdout.write(
+                f"Spreading requests over {len(backends.backends)} Ollama backends, "
+                f"up to {backends.max_concurrency} each")
+        if options.get('adaptive'):
+            self.stdout.write(f"Adapting the requests in flight per backend up to {backends.max_concurrency}")
 
-            except Exception as e:
-                error_count += 1
-                self.stdout.write(self.style.ERROR(
-                    f"Error processing property {hotel.hotelId}: {str(e)}"
-                ))
-                logger.error(f"Error processing property {hotel.hotelId}", exc_info=True)
+        health_check = None
+        if health_check_interval > 0:
+            health_check = BackendHealthCheck(
+                backends, health_check_interval, self.ollama.timeout[0], self.ollama.model)
+            health_check.start()
+
+        metrics_exporter = None
+        if options.get('metrics_file') or options.get('metrics_push'):
+            metrics_exporter = MetricsExporter(
+                options.get('metrics_file'), options.get('metrics_push'), options.get('metrics_interval', 15.0))
+            metrics_exporter.start()
+
+        self.profiler = None
+        if options.get('profile'):
+            self.profiler = RunProfiler()
+            self.profiler.start()
+
+        try:
+            if use_async:
+                if stage_workers:
+                    self.stdout.write("Using asyncio pipeline stages with " + ", ".join(
+                        f"up to {count} {stage} requests" for stage, count in stage_workers.items()))
+                else:
+                    self.stdout.write(f"Using asyncio with up to {concurrency} properties in flight")
+                self.async_ollama = AsyncOllamaClient(
+                    pool_size=pool_size,
+                    connect_timeout=options.get('connect_timeout'),
+                    read_timeout=options.get('read_timeout'),
+                    stream=options.get('stream', False),
+                    cache=cache,
+                    backends=backends,
+                    retry=retry,
+                    breaker=breaker,
+                    stats=self.stats,
+                )
+                asyncio.run(self.process_hotels_async(batches, concurrency, stage_workers))
+            elif stage_workers:
+                self.stdout.write("Using pipeline stages with " + ", ".join(
+                    f"{count} {stage} workers" for stage, count in stage_workers.items()))
+                self.process_hotels_pipelined(batches, stage_workers)
+            elif workers == 1:
+                self.process_hotels_sequentially(batches)
+            else:
+                self.stdout.write(f"Using {workers} workers")
+                self.process_hotels_threaded(batches, workers)
+        except BaseException:
+            # Keep the progress made so far, so the next run resumes from it
+            self.save_checkpoint()
+            raise
+        finally:
+            if health_check is not None:
+                health_check.stop()
+            self.ollama.close()
+            self.writer.stop()
+            self.writer.flush()
+            self.collect_write_failures()
+            if self.profiler is not None:
+                self.profiler.stop()
+            metrics.HOTELS_IN_FLIGHT.set(0)
+            if metrics_exporter is not None:
+                metrics_exporter.stop()
+            metrics.process_exited()
+            if heartbeat is not None:
+                heartbeat.stop()
+                self.flush_failed_claims()
+                # Hand back anything still claimed, e.g. after an interrupt
+                release_claims(self.worker_id)
+
+        if self.checkpoint_name:
+            position = self.checkpoint.position
+            if position is None:
+                position = self.saved_position
+            failed = self.checkpoint.failed_ids(position) if position is not None else []
+            if self.exhausted and not failed:
+                # Every hotel in range is done; the next run starts from the top
+                ProcessingCheckpoint.objects.filter(name=self.checkpoint_name).delete()
+                self.stdout.write(f"Checkpoint '{self.checkpoint_name}' completed and cleared")
+            else:
+                self.save_checkpoint()
+                if failed:
+                    self.stdout.write(
+                        f"Checkpoint '{self.checkpoint_name}' kept {len(failed)} failed properties; "
+                        f"run the same command again to retry them")
 
         # Print summary
         self.stdout.write("\nProcessing completed:")
-        self.stdout.write(f"Successfully processed: {success_count} properties")
-        self.stdout.write(f"Failed to process: {error_count} properties")
\ No newline at end of file
+        self.stdout.write(f"Successfully processed: {self.success_count} properties")
+        self.stdout.write(f"Failed to process: {self.error_count} properties")
+        if self.incremental:
+            self.stdout.write(f"Skipped unchanged: {self.skipped_count} properties")
+        for backend in backends.backends:
+            if backend.limit is not None:
+                self.stdout.write(
+                    f"Concurrency limit for {backend.url} settled at {backend.limit.value} "
+                    f"(maximum {backend.limit.max_limit})")
+        self.report_stats(options.get('report'))
+        if self.profiler is not None:
+            self.report_profile(options['profile'])
+
+    def report_profile(self, path: str) -> None:
+        self.stdout.write(f"\nProfile written to {path}, slowest calls by cumulative time:")
+        self.stdout.write(self.profiler.write(path))
+        if self.profiler.skipped_threads:
+            self.stdout.write(self.style.WARNING(
+                "Worker threads were not profiled: this Python allows only one active profiler"))
+
+        queries = self.profiler.queries
+        per_hotel = queries.per_hotel
+        self.stdout.write(
+            f"ORM queries: {queries.total} in total, {queries.unattributed} outside any hotel "
+            f"(fetching batches, claims, shared writes)")
+        if per_hotel:
+            busiest = max(per_hotel, key=per_hotel.get)
+            self.stdout.write(
+                f"Per hotel: {sum(per_hotel.values()) / len(per_hotel):.1f} on average over {len(per_hotel)} "
+                f"hotels, at most {per_hotel[busiest]} (hotel id {busiest})")
+        self.stdout.write(f"{'count':>7}{'hotels':>8}{'seconds':>9}  statement")
+        for entry in queries.top_statements():
+            self.stdout.write(
+                f"{entry['count']:>7}{entry['hotels']:>8}{entry['seconds']:>9.3f}  {entry['sql'][:120]}")
+        for entry in queries.suspects():
+            self.stdout.write(self.style.WARNING(
+                f"Possible N+1: ran {entry['count']} times for {entry['hotels']} hotels: {entry['sql'][:200]}"))
+
+    def report_stats(self, path: Optional[str] = None) -> None:
+        report = self.stats.report()
+        if report['phases']:
+            self.stdout.write("\nPhase timings (seconds):")
+            self.stdout.write(
+                f"{'phase':<22}{'count':>7}{'total':>10}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+            for phase, timing in report['phases'].items():
+                self.stdout.write(
+                    f"{phase:<22}{timing['count']:>7}{timing['total']:>10.2f}{timing['p50']:>9.3f}"
+                    f"{timing['p95']:>9.3f}{timing['p99']:>9.3f}{timing['max']:>9.3f}")
+        if report['generations']:
+            # Ollama's own timings, so these exclude network and queueing time
+            self.stdout.write("\nOllama throughput:")
+            self.stdout.write(
+                f"{'prompt type':<14}{'requests':>9}{'prompt tok':>12}{'prompt tok/s':>14}"
+                f"{'output tok':>12}{'output tok/s':>14}{'load s':>9}")
+            for prompt_type, generation in report['generations'].items():
+                self.stdout.write(
+                    f"{prompt_type:<14}{generation['requests']:>9}{generation['prompt_tokens']:>12}"
+                    f"{generation['prompt_tokens_per_second']:>14.1f}{generation['output_tokens']:>12}"
+                    f"{generation['output_tokens_per_second']:>14.1f}{generation['load_seconds']:>9.2f}")
+        if path:
+            report['processed'] = self.success_count
+            report['failed'] = self.error_count
+            report['skipped'] = self.skipped_count
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Run report written to {path}")
@@ -0,0 +1,109 @@
+# metrics.py
+import logging
+import os
+import threading
+from typing import Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+    push_to_gateway, write_to_textfile)
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+# Seconds; an Ollama call takes from a fraction of a second to minutes
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+DB_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Gauges of a run only count while its process is alive when the samples of
+# several processes are combined (see collection_registry)
+LLM_REQUESTS = Counter(
+    'ollama_requests_total', 'Requests sent to Ollama, by prompt type, backend and outcome',
+    ('prompt_type', 'backend', 'outcome'))
+LLM_LATENCY = Histogram(
+    'ollama_request_seconds', 'Time to a complete Ollama response, by prompt type and backend',
+    ('prompt_type', 'backend'), buckets=LLM_BUCKETS)
+LLM_TOKENS = Counter(
+    'ollama_tokens_total', 'Tokens Ollama evaluated, by prompt type and kind (prompt or output)',
+    ('prompt_type', 'kind'))
+BACKEND_IN_FLIGHT = Gauge(
+    'ollama_backend_requests_in_flight', 'Requests in flight to each Ollama backend', ('backend',),
+    multiprocess_mode='livesum')
+BACKEND_HEALTHY = Gauge(
+    'ollama_backend_healthy', 'Whether each Ollama backend is in rotation (1) or ejected (0)', ('backend',),
+    multiprocess_mode='livemin')
+PARSE_FAILURES = Counter(
+    'property_parse_failures_total', 'Ollama responses that could not be parsed, by prompt type', ('prompt_type',))
+DB_WRITE_LATENCY = Histogram(
+    'property_db_write_seconds', 'Time to save a batch of generated properties', buckets=DB_BUCKETS)
+PROPERTIES = Counter(
+    'properties_processed_total', 'Properties generated and saved, and properties that failed to generate or save',
+    ('result',))
+HOTELS_IN_FLIGHT = Gauge(
+    'property_hotels_in_flight', 'Hotels queued or being generated in the running command',
+    multiprocess_mode='livesum')
+WRITE_BUFFER = Gauge(
+    'property_write_buffer', 'Generated properties waiting to be saved', multiprocess_mode='livesum')
+
+
+def multiprocess_enabled() -> bool:
+    return bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+
+
+def collection_registry() -> CollectorRegistry:
+    # With PROMETHEUS_MULTIPROC_DIR set, every process (the web server and
+    # each process_properties run) writes its samples to files there, and
+    # they are read back together. Otherwise only this process's metrics.
+    if not multiprocess_enabled():
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def render() -> bytes:
+    return generate_latest(collection_registry())
+
+
+def process_exited() -> None:
+    # Drops this process's live gauges from the combined samples
+    if multiprocess_enabled():
+        multiprocess.mark_process_dead(os.getpid())
+
+
+class MetricsExporter(threading.Thread):
+    # Exports the metrics every `interval` seconds and once more when stopped:
+    # to `path` for node_exporter's textfile collector (replaced atomically,
+    # so it is never read half-written) and/or to a Pushgateway at `gateway`.
+    # Only this process's metrics are exported, even in multiprocess mode.
+    def __init__(self, path: Optional[str] = None, gateway: Optional[str] = None, interval: float = 15.0,
+                 job: str = 'process_properties', registry: CollectorRegistry = REGISTRY):
+        super().__init__(name='metrics-exporter', daemon=True)
+        self.path = path
+        self.gateway = gateway
+        self.interval = interval
+        self.job = job
+        self.registry = registry
+        self.stop_event = threading.Event()
+
+    def export(self) -> None:
+        if self.path:
+            try:
+                write_to_textfile(self.path, self.registry)
+            except OSError as e:
+                logger.error(f"Error writing metrics to {self.path}: {str(e)}")
+        if self.gateway:
+            try:
+                push_to_gateway(self.gateway, job=self.job, registry=self.registry)
+            except OSError as e:
+                logger.error(f"Error pushing metrics to {self.gateway}: {str(e)}")
+
+    def run(self) -> None:
+        while not self.stop_event.wait(self.interval):
+            self.export()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        self.join()
+        self.export()
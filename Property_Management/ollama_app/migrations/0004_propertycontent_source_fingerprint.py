@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 02:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ollama_app', '0003_generationcache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='propertycontent',
+            name='source_fingerprint',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.4 on 2026-10-18 02:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ollama_app', '0005_processingcheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HotelClaim',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('claimed', 'Claimed'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=16)),
+                ('worker_id', models.CharField(blank=True, max_length=255, null=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('hotel', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='claim', to='ollama_app.hotel')),
+            ],
+            options={
+                'db_table': 'hotel_claims',
+                'indexes': [models.Index(fields=['status', '-hotel'], name='hotel_claims_status_hotel_idx')],
+            },
+        ),
+    ]
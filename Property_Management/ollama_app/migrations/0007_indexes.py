@@ -0,0 +1,86 @@
+# Generated by Django 5.1.4 on 2026-10-18 03:12
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.operations
+import django.db.models.deletion
+import django.db.models.functions.comparison
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+HOTEL_TRIGRAM_INDEXES = (
+    ('hotels_title_trgm', 'title'),
+    ('hotels_hotelid_trgm', '"hotelId"'),
+    ('hotels_city_trgm', 'city'),
+)
+
+
+class Migration(migrations.Migration):
+    # The tables hold millions of rows, so the indexes are built CONCURRENTLY,
+    # which cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('ollama_app', '0006_hotelclaim'),
+    ]
+
+    operations = [
+        django.contrib.postgres.operations.TrigramExtension(),
+        django.contrib.postgres.operations.AddIndexConcurrently(
+            model_name='propertycontent',
+            index=models.Index(fields=['hotel', '-created_at'], name='property_content_hotel_latest'),
+        ),
+        django.contrib.postgres.operations.AddIndexConcurrently(
+            model_name='propertycontent',
+            index=models.Index(fields=['propertyId'], name='property_content_property_id'),
+        ),
+        django.contrib.postgres.operations.AddIndexConcurrently(
+            model_name='propertycontent',
+            index=models.Index(fields=['-created_at'], name='property_content_created_idx'),
+        ),
+        django.contrib.postgres.operations.AddIndexConcurrently(
+            model_name='propertycontent',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper(django.db.models.functions.comparison.Cast('title', models.TextField())), name='gin_trgm_ops'), name='property_content_title_trgm'),
+        ),
+        django.contrib.postgres.operations.AddIndexConcurrently(
+            model_name='propertycontent',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper(django.db.models.functions.comparison.Cast('propertyId', models.TextField())), name='gin_trgm_ops'), name='property_content_pid_trgm'),
+        ),
+        django.contrib.postgres.operations.AddIndexConcurrently(
+            model_name='propertyreview',
+            index=models.Index(fields=['propertyId'], name='property_review_property_id'),
+        ),
+        django.contrib.postgres.operations.AddIndexConcurrently(
+            model_name='propertyreview',
+            index=models.Index(fields=['-created_at'], name='property_review_created_idx'),
+        ),
+        django.contrib.postgres.operations.AddIndexConcurrently(
+            model_name='propertyreview',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper(django.db.models.functions.comparison.Cast('propertyId', models.TextField())), name='gin_trgm_ops'), name='property_review_pid_trgm'),
+        ),
+        django.contrib.postgres.operations.AddIndexConcurrently(
+            model_name='propertysummary',
+            index=models.Index(fields=['propertyId'], name='property_summary_property_id'),
+        ),
+        django.contrib.postgres.operations.AddIndexConcurrently(
+            model_name='propertysummary',
+            index=models.Index(fields=['-created_at'], name='property_summary_created_idx'),
+        ),
+        django.contrib.postgres.operations.AddIndexConcurrently(
+            model_name='propertysummary',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper(django.db.models.functions.comparison.Cast('propertyId', models.TextField())), name='gin_trgm_ops'), name='property_summary_pid_trgm'),
+        ),
+        # The hotels table is not managed by Django, so its indexes for the
+        # admin searches are created with SQL
+        migrations.RunSQL(
+            [f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON hotels USING gin (UPPER({column}::text) gin_trgm_ops)'
+             for name, column in HOTEL_TRIGRAM_INDEXES],
+            [f'DROP INDEX CONCURRENTLY IF EXISTS {name}' for name, _ in HOTEL_TRIGRAM_INDEXES],
+        ),
+        # Only dropped once the (hotel, -created_at) index can take over its lookups
+        migrations.AlterField(
+            model_name='propertycontent',
+            name='hotel',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='content', to='ollama_app.hotel'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 03:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ollama_app', '0007_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processingcheckpoint',
+            name='failed_hotel_ids',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
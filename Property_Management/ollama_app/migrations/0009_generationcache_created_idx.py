@@ -0,0 +1,21 @@
+# Generated by Django 5.1.4 on 2026-10-18 09:40
+
+import django.contrib.postgres.operations
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Built CONCURRENTLY like the other indexes, so a large cache table stays
+    # writable; that cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('ollama_app', '0008_processingcheckpoint_failed_hotel_ids'),
+    ]
+
+    operations = [
+        django.contrib.postgres.operations.AddIndexConcurrently(
+            model_name='generationcache',
+            index=models.Index(fields=['created_at'], name='generation_cache_created_idx'),
+        ),
+    ]
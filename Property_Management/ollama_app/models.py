@@ -1,5 +1,13 @@
 # models.py
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db import models
+from django.db.models.functions import Cast, Upper
+
+
+def trigram_index(field: str, name: str) -> GinIndex:
+    # On PostgreSQL `icontains` compares UPPER(column::text), so that is the
+    # expression the index has to cover for admin searches to use it
+    return GinIndex(OpClass(Upper(Cast(field, models.TextField())), name='gin_trgm_ops'), name=name)
 
 
 class Hotel(models.Model):
@@ -23,13 +31,25 @@ class PropertyContent(models.Model):
     propertyId = models.CharField(max_length=255, null=True, blank=True)
     title = models.CharField(max_length=255)
     description = models.TextField()
+    # Covered by the (hotel, -created_at) index below, so no index of its own
     hotel = models.ForeignKey(
-        Hotel, on_delete=models.CASCADE, related_name='content')
+        Hotel, on_delete=models.CASCADE, related_name='content', db_index=False)
+    # Hash of the hotel fields the prompts were built from, used to skip
+    # hotels whose source data has not changed since the last run
+    source_fingerprint = models.CharField(max_length=64, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         db_table = 'property_content'
+        indexes = [
+            # The latest content of each hotel, for incremental runs
+            models.Index(fields=['hotel', '-created_at'], name='property_content_hotel_latest'),
+            models.Index(fields=['propertyId'], name='property_content_property_id'),
+            models.Index(fields=['-created_at'], name='property_content_created_idx'),
+            trigram_index('title', 'property_content_title_trgm'),
+            trigram_index('propertyId', 'property_content_pid_trgm'),
+        ]
 
 
 class PropertySummary(models.Model):
@@ -41,6 +61,11 @@ class PropertySummary(models.Model):
 
     class Meta:
         db_table = 'property_summaries'
+        indexes = [
+            models.Index(fields=['propertyId'], name='property_summary_property_id'),
+            models.Index(fields=['-created_at'], name='property_summary_created_idx'),
+            trigram_index('propertyId', 'property_summary_pid_trgm'),
+        ]
 
 
 class PropertyReview(models.Model):
@@ -53,3 +78,62 @@ class PropertyReview(models.Model):
 
     class Meta:
         db_table = 'property_reviews'
+        indexes = [
+            models.Index(fields=['propertyId'], name='property_review_property_id'),
+            models.Index(fields=['-created_at'], name='property_review_created_idx'),
+            trigram_index('propertyId', 'property_review_pid_trgm'),
+        ]
+
+
+class GenerationCache(models.Model):
+    key = models.CharField(max_length=64, unique=True)
+    response = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'generation_cache'
+        indexes = [
+            # Lets prune() find expired responses without scanning the table
+            models.Index(fields=['created_at'], name='generation_cache_created_idx'),
+        ]
+
+
+class ProcessingCheckpoint(models.Model):
+    name = models.CharField(max_length=255, unique=True)
+    # Every hotel with a higher id than this has already been processed
+    last_hotel_id = models.BigIntegerField()
+    # Hotels above last_hotel_id that failed, retried first by the next run
+    failed_hotel_ids = models.JSONField(default=list, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'processing_checkpoints'
+
+
+class HotelClaim(models.Model):
+    PENDING = 'pending'
+    CLAIMED = 'claimed'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (CLAIMED, 'Claimed'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    hotel = models.OneToOneField(
+        Hotel, on_delete=models.CASCADE, related_name='claim')
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    worker_id = models.CharField(max_length=255, null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'hotel_claims'
+        indexes = [
+            # Workers pick the newest pending hotels first
+            models.Index(fields=['status', '-hotel'], name='hotel_claims_status_hotel_idx'),
+        ]
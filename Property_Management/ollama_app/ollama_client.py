@@ -0,0 +1,430 @@
+# ollama_client.py
+import asyncio
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import aiohttp
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .backends import Backend, BackendPool, backend_problem
+from . import metrics
+from .cache import ResponseCache
+from .retry import CircuitBreaker, RetryPolicy, call_with_retries, call_with_retries_async
+from .stats import RunStats
+
+logger = logging.getLogger(__name__)
+
+
+class ModelUnavailableError(Exception):
+    pass
+
+
+class TruncatedResponseError(Exception):
+    # The output reached num_predict before the model finished. Not a
+    # ValueError, so it is not retried as an unusable answer: asking again
+    # with the same cap would be cut off the same way.
+    pass
+
+
+class GenerationContext(NamedTuple):
+    # The `context` tokens Ollama returns for a finished generation. Passing
+    # them with the next prompt continues the same exchange, so the earlier
+    # prompt is not sent again, and the backend that produced them may still
+    # hold their KV cache.
+    tokens: List[int]
+    backend_url: str
+
+
+class OllamaClient:
+    def __init__(self, base_url: Optional[str] = None, pool_size: Optional[int] = None,
+                 connect_timeout: Optional[float] = None, read_timeout: Optional[float] = None,
+                 stream: bool = False, cache: Optional[ResponseCache] = None,
+                 backends: Optional[BackendPool] = None, retry: Optional[RetryPolicy] = None,
+                 breaker: Optional[CircuitBreaker] = None, stats: Optional[RunStats] = None):
+        pool_size = pool_size or settings.OLLAMA_POOL_SIZE
+        self.backends = backends or default_backends(base_url, pool_size)
+        self.model = settings.OLLAMA_MODEL
+        self.stream = stream
+        self.cache = cache
+        self.retry = retry or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self.stats = stats
+        self.timeout = (
+            connect_timeout if connect_timeout is not None else settings.OLLAMA_CONNECT_TIMEOUT,
+            read_timeout if read_timeout is not None else settings.OLLAMA_READ_TIMEOUT,
+        )
+
+        # One session per client keeps connections to Ollama alive between calls
+        # instead of opening a new TCP connection for every prompt. The pool
+        # blocks when full so concurrent workers wait for a free connection
+        # rather than opening extra ones that are thrown away afterwards.
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.backends.backends), pool_maxsize=pool_size,
+                              pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def close(self) -> None:
+        self.session.close()
+
+    def check_model(self) -> None:
+        # Backends that are down or do not have the model are taken out of the
+        # pool; with none left there is no point in sending any prompt
+        problems = []
+        for backend in self.backends.backends:
+            problem = backend_problem(self.session, backend.url, self.timeout[0], self.model)
+            self.backends.mark(backend, problem is None)
+            if problem is not None:
+                problems.append(f"{backend.url}: {problem}")
+        if len(problems) == len(self.backends.backends):
+            raise ModelUnavailableError(
+                f"No Ollama backend can serve model '{self.model}'. " + "; ".join(problems))
+        for problem in problems:
+            logger.warning(f"Skipping Ollama backend {problem}")
+
+    def warm_up(self, keep_alive: Optional[str] = None) -> None:
+        # A request without a prompt makes Ollama load the model and keep it
+        # for keep_alive, so the first hotel does not pay for the load
+        payload = {"model": self.model}
+        if keep_alive:
+            payload["keep_alive"] = keep_alive
+        backends = [backend for backend in self.backends.backends if backend.healthy]
+
+        def load(backend: Backend) -> None:
+            started_at = time.monotonic()
+            try:
+                response = self.session.post(f"{backend.url}/api/generate", json=payload, timeout=self.timeout)
+                response.raise_for_status()
+            except requests.exceptions.RequestException as e:
+                logger.warning(f"Could not load model '{self.model}' on {backend.url}: {str(e)}")
+                return
+            logger.info(f"Loaded model '{self.model}' on {backend.url} in {time.monotonic() - started_at:.1f}s")
+
+        with ThreadPoolExecutor(max_workers=len(backends) or 1) as executor:
+            list(executor.map(load, backends))
+
+    def generate(self, prompt: str, is_complete: Optional[Callable[[str], bool]] = None,
+                 schema: Optional[Dict[str, Any]] = None, context: Optional[GenerationContext] = None,
+                 options: Optional[Dict[str, Any]] = None, prompt_type: Optional[str] = None,
+                 allow_truncated: bool = False) -> str:
+        return self.generate_with_context(
+            prompt, is_complete, schema, context, options, prompt_type, allow_truncated)[0]
+
+    def generate_with_context(self, prompt: str, is_complete: Optional[Callable[[str], bool]] = None,
+                              schema: Optional[Dict[str, Any]] = None,
+                              context: Optional[GenerationContext] = None,
+                              options: Optional[Dict[str, Any]] = None,
+                              prompt_type: Optional[str] = None,
+                              allow_truncated: bool = False
+                              ) -> Tuple[str, Optional[GenerationContext]]:
+        # prompt_type only labels the token counts recorded in `stats`.
+        # Unless allow_truncated, an answer cut off by num_predict raises
+        # TruncatedResponseError.
+        # Also returns the context to continue from, which is None for cached
+        # responses and for streams that were stopped early
+        payload = build_payload(self.model, prompt, self.stream, schema, context, options)
+        if self.cache is not None:
+            cache_key = self.cache.make_key(payload)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached, None
+
+        text, new_context = call_with_retries(
+            lambda time_left: self.request(payload, is_complete, time_left, context, prompt_type, allow_truncated),
+            self.retry, self.breaker)
+        if self.cache is not None:
+            self.cache.set(cache_key, text)
+        return text, new_context
+
+    def request(self, payload: Dict[str, Any], is_complete: Optional[Callable[[str], bool]],
+                time_left: float, context: Optional[GenerationContext] = None,
+                prompt_type: Optional[str] = None,
+                allow_truncated: bool = False) -> Tuple[str, Optional[GenerationContext]]:
+        # One attempt against one backend; retries are handled by generate()
+        backend = self.backends.acquire(prefer=context.backend_url if context else None)
+        metrics.BACKEND_IN_FLIGHT.labels(backend=backend.url).inc()
+        failed = False
+        latency = None
+        started_at = time.monotonic()
+        try:
+            response = self.session.post(
+                f"{backend.url}/api/generate",
+                json=payload,
+                stream=self.stream,
+                timeout=(self.timeout[0], min(self.timeout[1], time_left))
+            )
+            response.raise_for_status()
+
+            if self.stream:
+                text, response_data = self.read_stream(response, is_complete)
+            else:
+                response_data = response.json()
+                text = response_data.get('response', '')
+            latency = response_latency(started_at, text)
+            return text, self.finish_response(response_data, backend, prompt_type, allow_truncated)
+            
+        except requests.exceptions.RequestException as e:
+            failed = True
+            logger.error(f"Error making request to Ollama API at {backend.url}: {str(e)}")
+            raise
+        except json.JSONDecodeError as e:
+            logger.error(f"Error decoding JSON response: {str(e)}")
+            raise
+        except Exception as e:
+            logger.error(f"Unexpected error in generate(): {str(e)}")
+            raise
+        finally:
+            self.backends.release(backend, failed, started_at, latency)
+            record_request(prompt_type, backend, started_at, latency is not None)
+
+    def discard(self, prompt: str, schema: Optional[Dict[str, Any]] = None,
+                context: Optional[GenerationContext] = None, options: Optional[Dict[str, Any]] = None) -> None:
+        if self.cache is not None:
+            self.cache.delete(self.cache.make_key(
+                build_payload(self.model, prompt, self.stream, schema, context, options)))
+
+    def finish_response(self, response_data: Dict[str, Any], backend: Backend,
+                        prompt_type: Optional[str], allow_truncated: bool = False) -> Optional[GenerationContext]:
+        if self.stats is not None:
+            self.stats.record_generation(prompt_type, response_data)
+        for kind, field in (('prompt', 'prompt_eval_count'), ('output', 'eval_count')):
+            if response_data.get(field):
+                metrics.LLM_TOKENS.labels(prompt_type=prompt_type or 'other', kind=kind).inc(response_data[field])
+        if response_data.get('done_reason') == 'length' and not allow_truncated:
+            raise TruncatedResponseError(
+                f"Ollama stopped the {prompt_type or 'response'} at num_predict "
+                f"({response_data.get('eval_count')} tokens); raise num_predict for it")
+        tokens = response_data.get('context')
+        return GenerationContext(tokens, backend.url) if tokens else None
+
+    def read_stream(self, response: requests.Response,
+                    is_complete: Optional[Callable[[str], bool]] = None) -> Tuple[str, Dict[str, Any]]:
+        # Ollama streams one JSON object per line, each carrying the next piece
+        # of the response. Once is_complete() says the caller has everything it
+        # keeps, the connection is dropped, which makes Ollama stop generating.
+        # The context tokens and timings only come with the final chunk, which
+        # is returned along with the text.
+        text = ""
+        final = {}
+        try:
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                text = append_chunk(text, chunk)
+                if chunk.get('done'):
+                    final = chunk
+                if is_complete is not None and is_complete(text):
+                    logger.debug("Stopping generation early, response is complete")
+                    break
+        finally:
+            response.close()
+        return text, final
+
+
+def default_backends(base_url: Optional[str], pool_size: int) -> BackendPool:
+    urls = [base_url] if base_url else settings.OLLAMA_BASE_URLS
+    return BackendPool(urls, settings.OLLAMA_BACKEND_CONCURRENCY or pool_size)
+
+
+def record_request(prompt_type: Optional[str], backend: Backend, started_at: float, succeeded: bool) -> None:
+    metrics.BACKEND_IN_FLIGHT.labels(backend=backend.url).dec()
+    metrics.LLM_REQUESTS.labels(
+        prompt_type=prompt_type or 'other', backend=backend.url, outcome='success' if succeeded else 'error').inc()
+    if succeeded:
+        metrics.LLM_LATENCY.labels(prompt_type=prompt_type or 'other', backend=backend.url).observe(
+            time.monotonic() - started_at)
+
+
+def response_latency(started_at: float, text: str) -> float:
+    # Seconds per generated character, so long and short answers can be compared
+    return (time.monotonic() - started_at) / max(len(text), 1)
+
+
+def build_payload(model: str, prompt: str, stream: bool, schema: Optional[Dict[str, Any]] = None,
+                  context: Optional[GenerationContext] = None,
+                  options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    payload = {"model": model, "prompt": prompt, "stream": stream}
+    if schema is not None:
+        # Ollama constrains the output to JSON matching this schema
+        payload["format"] = schema
+    if context is not None:
+        payload["context"] = context.tokens
+    if options:
+        # keep_alive is a request field rather than a model option, but it is
+        # configured in the same per-prompt profiles
+        options = dict(options)
+        if 'keep_alive' in options:
+            payload["keep_alive"] = options.pop('keep_alive')
+        if options:
+            payload["options"] = options
+    return payload
+
+
+def append_chunk(text: str, chunk: dict) -> str:
+    if 'error' in chunk:
+        raise ValueError(f"Ollama API returned an error: {chunk['error']}")
+    return text + chunk.get('response', '')
+
+
+# asyncio counterpart of OllamaClient with the same generate() contract
+class AsyncOllamaClient:
+    def __init__(self, base_url: Optional[str] = None, pool_size: Optional[int] = None,
+                 connect_timeout: Optional[float] = None, read_timeout: Optional[float] = None,
+                 stream: bool = False, cache: Optional[ResponseCache] = None,
+                 backends: Optional[BackendPool] = None, retry: Optional[RetryPolicy] = None,
+                 breaker: Optional[CircuitBreaker] = None, stats: Optional[RunStats] = None):
+        self.pool_size = pool_size or settings.OLLAMA_POOL_SIZE
+        self.backends = backends or default_backends(base_url, self.pool_size)
+        self.model = settings.OLLAMA_MODEL
+        self.stream = stream
+        self.cache = cache
+        self.retry = retry or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self.stats = stats
+        self.timeout = aiohttp.ClientTimeout(
+            sock_connect=connect_timeout if connect_timeout is not None else settings.OLLAMA_CONNECT_TIMEOUT,
+            sock_read=read_timeout if read_timeout is not None else settings.OLLAMA_READ_TIMEOUT,
+        )
+        # The session has to be created inside the running event loop
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.backend_released: Optional[asyncio.Condition] = None
+
+    def get_session(self) -> aiohttp.ClientSession:
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.pool_size)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self.session
+
+    async def close(self) -> None:
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+        self.backend_released = None
+
+    async def acquire_backend(self, prefer: Optional[str] = None) -> Backend:
+        # Same routing as BackendPool.acquire(), but waits on the event loop
+        # instead of blocking it
+        if self.backend_released is None:
+            self.backend_released = asyncio.Condition()
+        async with self.backend_released:
+            while True:
+                backend = self.backends.try_acquire(prefer)
+                if backend is not None:
+                    return backend
+                try:
+                    await asyncio.wait_for(self.backend_released.wait(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def release_backend(self, backend: Backend, failed: bool, started_at: float,
+                              latency: Optional[float]) -> None:
+        self.backends.release(backend, failed, started_at, latency)
+        if self.backend_released is not None:
+            async with self.backend_released:
+                self.backend_released.notify_all()
+
+    async def generate(self, prompt: str, is_complete: Optional[Callable[[str], bool]] = None,
+                       schema: Optional[Dict[str, Any]] = None,
+                       context: Optional[GenerationContext] = None,
+                       options: Optional[Dict[str, Any]] = None, prompt_type: Optional[str] = None,
+                       allow_truncated: bool = False) -> str:
+        return (await self.generate_with_context(
+            prompt, is_complete, schema, context, options, prompt_type, allow_truncated))[0]
+
+    async def generate_with_context(self, prompt: str, is_complete: Optional[Callable[[str], bool]] = None,
+                                    schema: Optional[Dict[str, Any]] = None,
+                                    context: Optional[GenerationContext] = None,
+                                    options: Optional[Dict[str, Any]] = None,
+                                    prompt_type: Optional[str] = None,
+                                    allow_truncated: bool = False
+                                    ) -> Tuple[str, Optional[GenerationContext]]:
+        payload = build_payload(self.model, prompt, self.stream, schema, context, options)
+        if self.cache is not None:
+            cache_key = self.cache.make_key(payload)
+            cached = await sync_to_async(self.cache.get)(cache_key)
+            if cached is not None:
+                return cached, None
+
+        text, new_context = await call_with_retries_async(
+            lambda time_left: self.request(payload, is_complete, time_left, context, prompt_type, allow_truncated),
+            self.retry, self.breaker)
+        if self.cache is not None:
+            await sync_to_async(self.cache.set)(cache_key, text)
+        return text, new_context
+
+    async def request(self, payload: Dict[str, Any], is_complete: Optional[Callable[[str], bool]],
+                      time_left: float, context: Optional[GenerationContext] = None,
+                      prompt_type: Optional[str] = None,
+                      allow_truncated: bool = False) -> Tuple[str, Optional[GenerationContext]]:
+        backend = await self.acquire_backend(prefer=context.backend_url if context else None)
+        metrics.BACKEND_IN_FLIGHT.labels(backend=backend.url).inc()
+        failed = False
+        latency = None
+        started_at = time.monotonic()
+        try:
+            async with self.get_session().post(
+                f"{backend.url}/api/generate",
+                json=payload,
+                timeout=aiohttp.ClientTimeout(
+                    total=time_left, sock_connect=self.timeout.sock_connect, sock_read=self.timeout.sock_read)
+            ) as response:
+                response.raise_for_status()
+
+                if self.stream:
+                    text, response_data = await self.read_stream(response, is_complete)
+                else:
+                    response_data = await response.json(content_type=None)
+                    text = response_data.get('response', '')
+            latency = response_latency(started_at, text)
+            return text, self.finish_response(response_data, backend, prompt_type, allow_truncated)
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            failed = True
+            logger.error(f"Error making request to Ollama API at {backend.url}: {str(e)}")
+            raise
+        except json.JSONDecodeError as e:
+            logger.error(f"Error decoding JSON response: {str(e)}")
+            raise
+        except Exception as e:
+            logger.error(f"Unexpected error in generate(): {str(e)}")
+            raise
+        finally:
+            await self.release_backend(backend, failed, started_at, latency)
+            record_request(prompt_type, backend, started_at, latency is not None)
+
+    finish_response = OllamaClient.finish_response
+
+    async def discard(self, prompt: str, schema: Optional[Dict[str, Any]] = None,
+                      context: Optional[GenerationContext] = None,
+                      options: Optional[Dict[str, Any]] = None) -> None:
+        if self.cache is not None:
+            cache_key = self.cache.make_key(
+                build_payload(self.model, prompt, self.stream, schema, context, options))
+            await sync_to_async(self.cache.delete)(cache_key)
+
+    async def read_stream(self, response: aiohttp.ClientResponse,
+                          is_complete: Optional[Callable[[str], bool]] = None
+                          ) -> Tuple[str, Dict[str, Any]]:
+        text = ""
+        final = {}
+        async for line in response.content:
+            line = line.strip()
+            if not line:
+                continue
+            chunk = json.loads(line)
+            text = append_chunk(text, chunk)
+            if chunk.get('done'):
+                final = chunk
+            if is_complete is not None and is_complete(text):
+                logger.debug("Stopping generation early, response is complete")
+                # Close rather than release, so the unread stream is not reused
+                response.close()
+                break
+        return text, final
@@ -0,0 +1,178 @@
+# profiling.py
+import cProfile
+import io
+import logging
+import pstats
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+# The hotel whose work is running in this thread or task, so each query can be
+# put down to it. asyncio tasks and sync_to_async carry it along.
+current_hotel: ContextVar[Optional[int]] = ContextVar('current_hotel', default=None)
+
+# A statement run for at least this many hotels, at least once for each, is
+# reported as a likely N+1 query
+N_PLUS_ONE_MIN_HOTELS = 2
+
+# Transaction control comes with every write and is never an N+1 query
+TRANSACTION_STATEMENTS = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE SAVEPOINT')
+
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+VALUES_LIST = re.compile(r'VALUES (\([^()]*\))(?:, \([^()]*\))+')
+
+
+@contextmanager
+def hotel_scope(hotel_id: Optional[int]) -> Iterator[None]:
+    token = current_hotel.set(hotel_id)
+    try:
+        yield
+    finally:
+        current_hotel.reset(token)
+
+
+def normalize_sql(sql: str) -> str:
+    # Bulk statements differ only in the number of placeholders; count them as one
+    sql = IN_LIST.sub('IN (...)', ' '.join(sql.split()))
+    return VALUES_LIST.sub(r'VALUES \1, ...', sql)
+
+
+class QueryCounter:
+    # Execute wrapper counting every ORM query by statement and by hotel.
+    # Django connections belong to one thread, so it is attached to each
+    # connection as it is opened, which covers worker threads as well.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = False
+        self.statements: Dict[str, Dict[str, Any]] = {}
+        self.per_hotel: Dict[int, int] = {}
+        self.unattributed = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        if not self.active:
+            return execute(sql, params, many, context)
+        started_at = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.record(sql, time.perf_counter() - started_at)
+
+    def record(self, sql: str, seconds: float) -> None:
+        hotel_id = current_hotel.get()
+        key = normalize_sql(sql)
+        with self.lock:
+            entry = self.statements.setdefault(key, {'count': 0, 'seconds': 0.0, 'hotels': set()})
+            entry['count'] += 1
+            entry['seconds'] += seconds
+            if hotel_id is None:
+                self.unattributed += 1
+            else:
+                entry['hotels'].add(hotel_id)
+                self.per_hotel[hotel_id] = self.per_hotel.get(hotel_id, 0) + 1
+
+    def attach(self, sender=None, connection=None, **kwargs) -> None:
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def install(self) -> None:
+        self.active = True
+        connection_created.connect(self.attach, weak=False, dispatch_uid=id(self))
+        for connection in connections.all():
+            self.attach(connection=connection)
+
+    def uninstall(self) -> None:
+        self.active = False
+        connection_created.disconnect(dispatch_uid=id(self))
+        for connection in connections.all():
+            if self in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self)
+
+    @property
+    def total(self) -> int:
+        with self.lock:
+            return sum(entry['count'] for entry in self.statements.values())
+
+    def top_statements(self, limit: int = 10) -> List[Dict[str, Any]]:
+        with self.lock:
+            entries = [
+                {'sql': sql, 'count': entry['count'], 'seconds': entry['seconds'], 'hotels': len(entry['hotels'])}
+                for sql, entry in self.statements.items()
+            ]
+        for entry in entries:
+            entry['n_plus_one'] = (entry['hotels'] >= N_PLUS_ONE_MIN_HOTELS
+                                   and entry['count'] >= entry['hotels']
+                                   and not entry['sql'].upper().startswith(TRANSACTION_STATEMENTS))
+        return sorted(entries, key=lambda entry: (-entry['count'], -entry['seconds']))[:limit]
+
+    def suspects(self) -> List[Dict[str, Any]]:
+        return [entry for entry in self.top_statements(limit=len(self.statements)) if entry['n_plus_one']]
+
+
+class RunProfiler:
+    # cProfile for the thread that starts it, plus one profile for each worker
+    # thread that runs under thread(); they are merged when written out.
+    # From Python 3.12 only one profiler can be active in a process, so there
+    # worker threads are left out and only the main thread is profiled.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.profiles: List[cProfile.Profile] = []
+        self.queries = QueryCounter()
+        self.skipped_threads = False
+
+    def start(self) -> None:
+        profile = cProfile.Profile()
+        self.local.profile = profile
+        self.profiles.append(profile)
+        self.queries.install()
+        profile.enable()
+
+    def stop(self) -> None:
+        self.profiles[0].disable()
+        self.queries.uninstall()
+
+    @contextmanager
+    def thread(self) -> Iterator[None]:
+        profile = getattr(self.local, 'profile', None)
+        if profile is None:
+            profile = cProfile.Profile()
+            self.local.profile = profile
+            with self.lock:
+                self.profiles.append(profile)
+        elif profile is self.profiles[0]:
+            # Already profiled as the main thread
+            yield
+            return
+
+        try:
+            profile.enable()
+        except ValueError:
+            self.skipped_threads = True
+            yield
+            return
+        try:
+            yield
+        finally:
+            profile.disable()
+
+    def stats(self) -> pstats.Stats:
+        with self.lock:
+            profiles = list(self.profiles)
+        return pstats.Stats(*profiles, stream=io.StringIO())
+
+    def write(self, path: str) -> str:
+        # Dumps the merged profile for pstats or snakeviz and returns the
+        # functions with the most cumulative time as text
+        stats = self.stats()
+        stats.dump_stats(path)
+        stats.stream = io.StringIO()
+        stats.sort_stats('cumulative').print_stats(20)
+        return stats.stream.getvalue()
@@ -0,0 +1,150 @@
+# retry.py
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import aiohttp
+import requests
+from django.conf import settings
+
+from .backends import NoHealthyBackendError
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# HTTP statuses worth trying again: rate limiting and server-side errors such
+# as the 503 Ollama returns while it is loading a model
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class RetryPolicy:
+    def __init__(self, retries: Optional[int] = None, backoff: Optional[float] = None,
+                 max_backoff: Optional[float] = None, deadline: Optional[float] = None):
+        self.retries = retries if retries is not None else settings.OLLAMA_RETRIES
+        self.backoff = backoff if backoff is not None else settings.OLLAMA_RETRY_BACKOFF
+        self.max_backoff = max_backoff if max_backoff is not None else settings.OLLAMA_RETRY_MAX_BACKOFF
+        self.deadline = deadline if deadline is not None else settings.OLLAMA_CALL_DEADLINE
+
+    def delay(self, attempt: int) -> float:
+        # Exponential backoff with full jitter, so workers that failed together
+        # do not all come back at the same moment
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+
+class CircuitBreaker:
+    # Opens after `threshold` consecutive failed requests and pauses dispatch
+    # for `reset_timeout` seconds. After that requests are let through again
+    # on probation: a success closes the breaker, a failure reopens it.
+    def __init__(self, threshold: Optional[int] = None, reset_timeout: Optional[float] = None):
+        self.threshold = threshold if threshold is not None else settings.OLLAMA_BREAKER_THRESHOLD
+        self.reset_timeout = reset_timeout if reset_timeout is not None else settings.OLLAMA_BREAKER_RESET
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    def wait_time(self) -> float:
+        with self.lock:
+            if self.opened_at is None:
+                return 0.0
+            return max(self.opened_at + self.reset_timeout - time.monotonic(), 0.0)
+
+    def record_success(self) -> None:
+        with self.lock:
+            if self.opened_at is not None:
+                logger.info("Ollama requests are succeeding again, closing the circuit breaker")
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self) -> None:
+        with self.lock:
+            self.failures += 1
+            if self.threshold and self.failures >= self.threshold:
+                if self.opened_at is None:
+                    logger.warning(
+                        f"Opening the circuit breaker after {self.failures} failed Ollama requests, "
+                        f"pausing for {self.reset_timeout}s")
+                self.opened_at = time.monotonic()
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                          requests.exceptions.ChunkedEncodingError, aiohttp.ClientConnectionError,
+                          aiohttp.ClientPayloadError, asyncio.TimeoutError, NoHealthyBackendError)):
+        return True
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        return error.response.status_code in RETRYABLE_STATUSES
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status in RETRYABLE_STATUSES
+    return False
+
+
+def next_delay(error: BaseException, attempt: int, policy: RetryPolicy, breaker: CircuitBreaker,
+               deadline: float) -> Optional[float]:
+    # How long to wait before the next attempt, or None to give up
+    if not is_retryable(error):
+        return None
+    breaker.record_failure()
+    if attempt >= policy.retries:
+        return None
+    delay = max(policy.delay(attempt), breaker.wait_time())
+    if time.monotonic() + delay >= deadline:
+        return None
+    logger.warning(f"Retrying Ollama request in {delay:.1f}s ({attempt + 1}/{policy.retries}): {str(error)}")
+    return delay
+
+
+def check_breaker(breaker: CircuitBreaker, deadline: float) -> float:
+    pause = breaker.wait_time()
+    if pause and time.monotonic() + pause >= deadline:
+        raise CircuitOpenError("Ollama circuit breaker is open and the call deadline would pass while waiting")
+    return pause
+
+
+def call_with_retries(call: Callable[[float], T], policy: RetryPolicy, breaker: CircuitBreaker) -> T:
+    # `call` receives the seconds left before the deadline, to cap its timeout
+    deadline = time.monotonic() + policy.deadline
+    attempt = 0
+    while True:
+        pause = check_breaker(breaker, deadline)
+        if pause:
+            time.sleep(pause)
+        try:
+            result = call(deadline - time.monotonic())
+        except Exception as e:
+            delay = next_delay(e, attempt, policy, breaker, deadline)
+            if delay is None:
+                raise
+            attempt += 1
+            time.sleep(delay)
+        else:
+            breaker.record_success()
+            return result
+
+
+async def call_with_retries_async(call: Callable[[float], Awaitable[T]], policy: RetryPolicy,
+                                  breaker: CircuitBreaker) -> T:
+    deadline = time.monotonic() + policy.deadline
+    attempt = 0
+    while True:
+        pause = check_breaker(breaker, deadline)
+        if pause:
+            await asyncio.sleep(pause)
+        try:
+            result = await call(deadline - time.monotonic())
+        except Exception as e:
+            delay = next_delay(e, attempt, policy, breaker, deadline)
+            if delay is None:
+                raise
+            attempt += 1
+            await asyncio.sleep(delay)
+        else:
+            breaker.record_success()
+            return result
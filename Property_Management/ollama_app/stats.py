@@ -0,0 +1,102 @@
+# stats.py
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+# Ollama reports durations in nanoseconds
+NANOSECONDS = 1e9
+
+# Response fields summed per prompt type; they only come with a finished
+# generation, so cached responses and streams stopped early have none
+GENERATION_FIELDS = ('prompt_eval_count', 'prompt_eval_duration', 'eval_count', 'eval_duration',
+                     'load_duration', 'total_duration')
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    # Nearest-rank percentile of an unsorted list
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+def rate(count: float, duration: float) -> float:
+    # Tokens per second from a token count and a duration in nanoseconds
+    return count / (duration / NANOSECONDS) if duration else 0.0
+
+
+class RunStats:
+    # Collects timings for each phase of a run and Ollama's token counts for
+    # each prompt type. Safe to use from worker threads and the event loop.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = time.monotonic()
+        self.timings: Dict[str, List[float]] = {}
+        self.generations: Dict[str, Dict[str, float]] = {}
+
+    def record(self, phase: str, seconds: float) -> None:
+        with self.lock:
+            self.timings.setdefault(phase, []).append(seconds)
+
+    @contextmanager
+    def timer(self, phase: str) -> Iterator[None]:
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, time.perf_counter() - started_at)
+
+    def samples(self, prefix: str) -> List[float]:
+        # Every timing of the phases whose name starts with `prefix`
+        with self.lock:
+            return [value for phase, values in self.timings.items() if phase.startswith(prefix) for value in values]
+
+    def record_generation(self, prompt_type: Optional[str], response: Dict[str, Any]) -> None:
+        if 'eval_count' not in response:
+            return
+        with self.lock:
+            totals = self.generations.setdefault(
+                prompt_type or 'other', dict.fromkeys(('requests',) + GENERATION_FIELDS, 0))
+            totals['requests'] += 1
+            for field in GENERATION_FIELDS:
+                totals[field] += response.get(field) or 0
+
+    def phase_summary(self) -> Dict[str, Dict[str, float]]:
+        with self.lock:
+            timings = {phase: list(values) for phase, values in self.timings.items()}
+        return {
+            phase: {
+                'count': len(values),
+                'total': sum(values),
+                'p50': percentile(values, 0.50),
+                'p95': percentile(values, 0.95),
+                'p99': percentile(values, 0.99),
+                'max': max(values),
+            }
+            for phase, values in sorted(timings.items())
+        }
+
+    def generation_summary(self) -> Dict[str, Dict[str, float]]:
+        with self.lock:
+            generations = {prompt_type: dict(totals) for prompt_type, totals in self.generations.items()}
+        summary = {}
+        for prompt_type, totals in sorted(generations.items()):
+            summary[prompt_type] = {
+                'requests': totals['requests'],
+                'prompt_tokens': totals['prompt_eval_count'],
+                'output_tokens': totals['eval_count'],
+                'prompt_tokens_per_second': rate(totals['prompt_eval_count'], totals['prompt_eval_duration']),
+                'output_tokens_per_second': rate(totals['eval_count'], totals['eval_duration']),
+                'load_seconds': totals['load_duration'] / NANOSECONDS,
+                'ollama_seconds': totals['total_duration'] / NANOSECONDS,
+            }
+        return summary
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            'elapsed_seconds': time.monotonic() - self.started_at,
+            'phases': self.phase_summary(),
+            'generations': self.generation_summary(),
+        }
@@ -0,0 +1,74 @@
+# synthetic.py
+import random
+from argparse import ArgumentParser
+from typing import Any, Dict, List
+
+from django.conf import settings
+from django.core.management.base import CommandError
+
+from .models import Hotel
+
+# Every generated hotel's hotelId starts with this, so they can be told apart
+# from scraped hotels and deleted again
+SYNTHETIC_PREFIX = 'synthetic-'
+
+CITIES = ('Lisbon', 'Porto', 'Barcelona', 'Valencia', 'Rome', 'Florence', 'Paris', 'Nice', 'Berlin', 'Vienna')
+LOCATIONS = ('Old Town', 'City Centre', 'Riverside', 'Beachfront', 'Harbour', 'Train Station', 'Hillside')
+NAMES = ('Grand', 'Royal', 'Garden', 'Plaza', 'Boutique', 'Park', 'Marina', 'Palace', 'Central', 'Sunset')
+KINDS = ('Hotel', 'Suites', 'Inn', 'Residence', 'Resort', 'Guesthouse')
+ROOM_TYPES = ('Single Room', 'Double Room', 'Twin Room', 'Suite', 'Family Room', 'Studio')
+
+
+def synthetic_prefix(seed: int) -> str:
+    return f"{SYNTHETIC_PREFIX}{seed}-"
+
+
+def add_allow_synthetic_argument(parser: ArgumentParser) -> None:
+    parser.add_argument(
+        '--allow-synthetic', action='store_true',
+        help='Confirm that this database is not production. The synthetic hotels go into the real hotels table, '
+             'where any process_properties run picks them up like scraped hotels (also allowed with '
+             'ALLOW_SYNTHETIC_HOTELS=1)'
+    )
+
+
+def check_synthetic_allowed(options: Dict[str, Any]) -> None:
+    # The hotels table is the scraper's, not a test table, so inserting
+    # synthetic hotels needs an explicit go-ahead for the database
+    if not (options.get('allow_synthetic') or getattr(settings, 'ALLOW_SYNTHETIC_HOTELS', False)):
+        raise CommandError(
+            "Refusing to insert synthetic hotels into the hotels table of this database, where "
+            "process_properties would generate content for them. Use a non-production database and pass "
+            "--allow-synthetic, or set ALLOW_SYNTHETIC_HOTELS=1 for it.")
+
+
+def synthetic_hotels(count: int, seed: int = 0) -> List[Hotel]:
+    # The same seed always gives the same hotels, so benchmark runs compare
+    # like with like
+    rng = random.Random(seed)
+    prefix = synthetic_prefix(seed)
+    hotels = []
+    for index in range(count):
+        city = rng.choice(CITIES)
+        hotels.append(Hotel(
+            hotelId=f"{prefix}{index}",
+            title=f"{rng.choice(NAMES)} {rng.choice(LOCATIONS)} {rng.choice(KINDS)}",
+            city=city,
+            location=f"{rng.choice(LOCATIONS)}, {city}",
+            price=round(rng.uniform(40, 600), 2),
+            image_path=f"images/{prefix}{index}.jpg",
+            rating=round(rng.uniform(2.5, 5.0), 1),
+            room_type=rng.choice(ROOM_TYPES),
+            latitude=round(rng.uniform(36.0, 55.0), 6),
+            longitude=round(rng.uniform(-9.5, 17.0), 6),
+        ))
+    return hotels
+
+
+def hotel_fixture(hotels: List[Hotel]) -> List[Dict[str, Any]]:
+    # Django's fixture format, for `manage.py loaddata`
+    fields = [field.name for field in Hotel._meta.concrete_fields if not field.primary_key]
+    return [
+        {'model': 'ollama_app.hotel', 'fields': {name: getattr(hotel, name) for name in fields}}
+        for hotel in hotels
+    ]
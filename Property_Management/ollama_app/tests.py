@@ -1,17 +1,47 @@
 from django.test import TestCase
-from django.db.models import Avg
+from django.db.models import Avg, Subquery
 from decimal import Decimal
-from .models import Hotel, PropertyContent, PropertySummary, PropertyReview
+from .models import Hotel, HotelClaim, PropertyContent, PropertySummary, PropertyReview
 from unittest import TestCase as UnitTestCase
 from unittest.mock import patch, MagicMock
 from django.utils import timezone
+from datetime import timedelta
 
+import asyncio
 import json
+from concurrent.futures import ThreadPoolExecutor
+import os
+import tempfile
+from collections import deque
+import time
 import unittest
-from unittest.mock import patch, MagicMock, call
+from io import StringIO
+from typing import Iterable, List
+from unittest.mock import ANY, patch, MagicMock, AsyncMock, call
 
+import aiohttp
+import prometheus_client
 import requests
-from ollama_app.management.commands.process_properties import Command, OllamaClient
+from django.contrib import admin
+from django.core.management.base import CommandError, OutputWrapper
+from django.http import Http404
+from django.test import override_settings
+from ollama_app.management.commands.process_properties import (
+    CheckpointTracker, Command, OllamaClient, hotel_fingerprint)
+from ollama_app import claims
+from ollama_app.admin import DeferredFieldsChangeList, EstimatedCountPaginator
+from ollama_app.backends import AdaptiveLimit, BackendPool
+from ollama_app.cache import ResponseCache
+from ollama_app.fake_ollama import FakeOllamaConfig, FakeOllamaServer
+from ollama_app.ollama_client import (
+    AsyncOllamaClient, GenerationContext, ModelUnavailableError, TruncatedResponseError)
+from ollama_app import metrics
+from ollama_app.metrics import MetricsExporter
+from ollama_app.profiling import QueryCounter, RunProfiler, hotel_scope, normalize_sql
+from ollama_app.retry import CircuitBreaker, CircuitOpenError, RetryPolicy, call_with_retries
+from ollama_app.stats import RunStats, percentile
+from ollama_app.synthetic import hotel_fixture, synthetic_hotels
+from ollama_app.writer import GeneratedProperty, PropertyWriter, write_properties
 
 # Using UnitTestCase instead of Django's TestCase to avoid database operations
 
@@ -76,6 +106,20 @@ class PropertyContentModelTests(UnitTestCase):
         self.assertIsNotNone(self.property.created_at)
         self.assertIsNotNone(self.property.updated_at)
 
+    def test_latest_content_index(self):
+        indexes = {index.name: index for index in PropertyContent._meta.indexes}
+        self.assertEqual(indexes['property_content_hotel_latest'].fields, ['hotel', '-created_at'])
+        # The composite index starts with hotel_id, so the FK's own index is dropped
+        self.assertFalse(PropertyContent._meta.get_field('hotel').db_index)
+
+    def test_trigram_index_matches_icontains(self):
+        # Postgres compiles icontains to UPPER(col::text) LIKE UPPER(...), so
+        # the trigram index is on that expression
+        index = next(index for index in PropertyContent._meta.indexes if index.name == 'property_content_title_trgm')
+        expression = index.expressions[0]
+        self.assertEqual(expression.extra['name'], 'gin_trgm_ops')
+        self.assertIn("Upper(Cast(F(title)", repr(expression))
+
 
 class PropertySummaryModelTests(UnitTestCase):
     @patch('django.db.models.Model.save')
@@ -160,15 +204,112 @@ class PropertyReviewModelTests(UnitTestCase):
             self.assertEqual(avg_rating, Decimal('4.5'))
 
 
+class TestScalableAdmin(unittest.TestCase):
+    def postgres(self, estimate):
+        connection = MagicMock(vendor='postgresql')
+        connection.ops.quote_name.side_effect = lambda name: f'"{name}"'
+        cursor = connection.cursor.return_value.__enter__.return_value
+        cursor.fetchone.return_value = (estimate,)
+        return connection
+
+    def test_unfiltered_list_uses_estimate(self):
+        connection = self.postgres(2_000_000)
+        with patch('ollama_app.admin.connections', {'default': connection}), \
+                patch('django.db.models.query.QuerySet.count', autospec=True) as mock_count:
+            paginator = EstimatedCountPaginator(PropertyReview.objects.order_by('-created_at'), 100)
+            self.assertEqual(paginator.count, 2_000_000)
+            self.assertEqual(paginator.num_pages, 20_000)
+
+        mock_count.assert_not_called()
+        cursor = connection.cursor.return_value.__enter__.return_value
+        self.assertEqual(cursor.execute.call_args.args[1], ['"property_reviews"'])
+
+    def test_exact_count_when_estimate_does_not_apply(self):
+        cases = [
+            # Filtered or searched, a small table, a table never analyzed
+            (PropertyReview.objects.filter(rating=5).order_by('-created_at'), 2_000_000),
+            (PropertyReview.objects.order_by('-created_at'), 500),
+            (PropertyReview.objects.order_by('-created_at'), -1),
+        ]
+        for queryset, estimate in cases:
+            with patch('ollama_app.admin.connections', {'default': self.postgres(estimate)}), \
+                    patch('django.db.models.query.QuerySet.count', autospec=True, return_value=480):
+                self.assertEqual(EstimatedCountPaginator(queryset, 100).count, 480)
+
+    @patch('django.db.models.query.QuerySet.count', autospec=True, return_value=7)
+    def test_other_databases_count_exactly(self, mock_count):
+        self.assertEqual(EstimatedCountPaginator(PropertyReview.objects.order_by('-created_at'), 100).count, 7)
+
+    def test_changelist_joins_property_and_defers_text(self):
+        model_admin = admin.site._registry[PropertyReview]
+        self.assertFalse(model_admin.show_full_result_count)
+        self.assertIs(model_admin.paginator, EstimatedCountPaginator)
+
+        changelist = DeferredFieldsChangeList.__new__(DeferredFieldsChangeList)
+        changelist.model_admin = model_admin
+        queryset = PropertyReview.objects.select_related(*model_admin.list_select_related)
+        request = MagicMock()
+        with patch('django.contrib.admin.views.main.ChangeList.get_queryset', return_value=queryset) as mock_get:
+            sql = str(changelist.get_queryset(request).query)
+            # Django 4.2 calls it with the request only, 5.x may add exclude_parameters
+            mock_get.assert_called_once_with(request)
+            changelist.get_queryset(request, {'rating'})
+            mock_get.assert_called_with(request, {'rating'})
+
+        self.assertIn('JOIN "property_content"', sql)
+        self.assertIn('"property_content"."title"', sql)
+        self.assertNotIn('"property_reviews"."review"', sql)
+        self.assertNotIn('"property_content"."description"', sql)
+
+
 ############################################################################################################
 
 
 # testing the management command
+def make_hotels(hotel_ids: Iterable[int], failing: Iterable[int] = ()) -> List[MagicMock]:
+    # Hotel stand-ins in the given order; the hotels in `failing` get a title
+    # the generate() fakes look for to raise
+    failing = set(failing)
+    hotels = []
+    for hotel_id in hotel_ids:
+        hotel = MagicMock()
+        hotel.id = hotel.hotelId = hotel_id
+        hotel.title = "Failing Hotel" if hotel_id in failing else f"Hotel {hotel_id}"
+        hotels.append(hotel)
+    return hotels
+
+
+class HotelQuerySetStub:
+    # Stands in for the hotels queryset: supports the ordering, id range
+    # filters and slicing used to page through the table
+    def __init__(self, hotels):
+        self.hotels = list(hotels)
+
+    def only(self, *fields):
+        return self
+
+    def order_by(self, *fields):
+        return HotelQuerySetStub(sorted(self.hotels, key=lambda hotel: -hotel.id))
+
+    def filter(self, id__lt=None, id__gte=None, id__lte=None, id__in=None):
+        hotels = [
+            hotel for hotel in self.hotels
+            if (id__in is None or hotel.id in id__in)
+            and (id__lt is None or hotel.id < id__lt)
+            and (id__gte is None or hotel.id >= id__gte)
+            and (id__lte is None or hotel.id <= id__lte)
+        ]
+        return HotelQuerySetStub(hotels)
+
+    def __getitem__(self, key):
+        return self.hotels[key]
+
+
 class TestOllamaClient(unittest.TestCase):
     def setUp(self):
         self.client = OllamaClient()
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_generate_success(self, mock_post):
         mock_response = MagicMock()
         mock_response.json.return_value = {'response': 'test response'}
@@ -180,17 +321,109 @@ class TestOllamaClient(unittest.TestCase):
         mock_post.assert_called_once_with(
             "http://ollama:11434/api/generate",
             json={"model": "llama3.2", "prompt": "test prompt", "stream": False},
-            stream=False
+            stream=False,
+            timeout=(5.0, 300.0)
         )
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
+    def test_generate_with_schema(self, mock_post):
+        mock_post.return_value.json.return_value = {'response': '{"summary": "A hotel."}'}
+        schema = {"type": "object", "properties": {"summary": {"type": "string"}}}
+
+        self.client.generate("test prompt", schema=schema)
+
+        self.assertEqual(mock_post.call_args.kwargs['json']['format'], schema)
+
+    @patch('requests.Session.post')
+    def test_generate_truncated_by_num_predict(self, mock_post):
+        mock_post.return_value.json.return_value = {
+            'response': 'A hotel with a', 'done_reason': 'length', 'eval_count': 4}
+
+        with self.assertRaises(TruncatedResponseError):
+            self.client.generate("test prompt", prompt_type='description')
+        # Cut-off summaries are trimmed to 500 characters anyway
+        self.assertEqual(self.client.generate("test prompt", allow_truncated=True), 'A hotel with a')
+
+    @patch('requests.Session.post')
+    def test_generate_with_context(self, mock_post):
+        mock_post.return_value.json.return_value = {'response': 'first', 'context': [1, 2, 3]}
+
+        text, context = self.client.generate_with_context("first prompt")
+        self.assertEqual(text, 'first')
+        self.assertEqual(context, GenerationContext([1, 2, 3], "http://ollama:11434"))
+
+        self.client.generate("follow-up", context=context)
+        self.assertEqual(mock_post.call_args.kwargs['json']['context'], [1, 2, 3])
+        self.assertEqual(mock_post.call_args.kwargs['json']['prompt'], "follow-up")
+
+    @patch('requests.Session.post')
+    def test_generate_with_options(self, mock_post):
+        mock_post.return_value.json.return_value = {'response': 'test response'}
+
+        self.client.generate("test prompt", options={'num_predict': 160, 'stop': ["\n\n"], 'keep_alive': '30m'})
+
+        payload = mock_post.call_args.kwargs['json']
+        self.assertEqual(payload['options'], {'num_predict': 160, 'stop': ["\n\n"]})
+        self.assertEqual(payload['keep_alive'], '30m')
+
+    def test_check_model(self):
+        tags = MagicMock()
+        tags.json.return_value = {'models': [{'name': 'llama3.2:latest'}, {'name': 'mistral:7b'}]}
+        with patch('requests.Session.get', return_value=tags) as mock_get:
+            self.client.check_model()
+        mock_get.assert_called_once_with("http://ollama:11434/api/tags", timeout=5.0)
+
+        tags.json.return_value = {'models': [{'name': 'mistral:7b'}]}
+        with patch('requests.Session.get', return_value=tags):
+            with self.assertRaisesRegex(ModelUnavailableError, "model 'llama3.2' is not installed"):
+                self.client.check_model()
+        # The only backend stays in rotation; the command stops on the error
+        self.assertTrue(self.client.backends.backends[0].healthy)
+
+    def test_check_model_skips_unreachable_backends(self):
+        client = OllamaClient(backends=BackendPool(["http://a:11434", "http://b:11434"], 2))
+        tags = MagicMock()
+        tags.json.return_value = {'models': [{'name': 'llama3.2:latest'}]}
+        with patch('requests.Session.get', side_effect=[requests.exceptions.ConnectionError("refused"), tags]):
+            client.check_model()
+        self.assertEqual([backend.healthy for backend in client.backends.backends], [False, True])
+
+    @patch('requests.Session.post')
+    def test_warm_up(self, mock_post):
+        self.client.warm_up('30m')
+        mock_post.assert_called_once_with(
+            "http://ollama:11434/api/generate", json={"model": "llama3.2", "keep_alive": "30m"},
+            timeout=(5.0, 300.0))
+
+    def test_client_configuration(self):
+        client = OllamaClient(base_url="http://other:11434", pool_size=4,
+                              connect_timeout=2, read_timeout=30)
+        self.assertEqual(client.backends.urls, ["http://other:11434"])
+        self.assertEqual(client.backends.max_concurrency, 4)
+        self.assertEqual(client.timeout, (2, 30))
+        adapter = client.session.get_adapter("http://other:11434/api/generate")
+        self.assertEqual(adapter._pool_maxsize, 4)
+        self.assertTrue(adapter._pool_block)
+
+    @patch('requests.Session.post')
+    def test_generate_reuses_session(self, mock_post):
+        mock_post.return_value.json.return_value = {'response': 'test response'}
+        session = self.client.session
+
+        self.client.generate("first prompt")
+        self.client.generate("second prompt")
+
+        self.assertIs(self.client.session, session)
+        self.assertEqual(mock_post.call_count, 2)
+
+    @patch('requests.Session.post')
     def test_generate_request_exception(self, mock_post):
         mock_post.side_effect = requests.exceptions.RequestException(
             "API error")
         with self.assertRaises(requests.exceptions.RequestException):
             self.client.generate("test prompt")
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_generate_json_decode_error(self, mock_post):
         mock_response = MagicMock()
         mock_response.json.side_effect = json.JSONDecodeError(
@@ -201,10 +434,803 @@ class TestOllamaClient(unittest.TestCase):
             self.client.generate("test prompt")
 
 
+class TestBackendPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = BackendPool(["http://a:11434", "http://b:11434/"], max_concurrency=2, failure_threshold=2)
+        self.a, self.b = self.pool.backends
+
+    def test_routes_to_least_outstanding_backend(self):
+        self.assertEqual(self.b.url, "http://b:11434")
+        first = self.pool.acquire()
+        second = self.pool.acquire()
+        self.assertEqual({first, second}, {self.a, self.b})
+
+        self.pool.release(first)
+        self.assertIs(self.pool.acquire(), first)
+
+    def test_prefers_backend_holding_context(self):
+        self.pool.acquire()
+        self.assertIs(self.pool.acquire(prefer="http://a:11434"), self.a)
+
+        self.a.outstanding = 2
+        self.assertIs(self.pool.acquire(prefer="http://a:11434"), self.b)
+
+    def test_caps_requests_per_backend(self):
+        for _ in range(4):
+            self.pool.acquire()
+        self.assertIsNone(self.pool.try_acquire())
+
+        self.pool.release(self.b)
+        self.assertIs(self.pool.try_acquire(), self.b)
+
+    def test_ejects_backend_after_consecutive_failures(self):
+        self.a.outstanding = 2
+        self.pool.release(self.a, failed=True)
+        self.assertTrue(self.a.healthy)
+        self.pool.release(self.a, failed=True)
+        self.assertFalse(self.a.healthy)
+        self.assertIs(self.pool.acquire(), self.b)
+
+    def test_keeps_last_healthy_backend(self):
+        self.pool.mark(self.a, healthy=False)
+        self.b.outstanding = 2
+        self.pool.release(self.b, failed=True)
+        self.pool.release(self.b, failed=True)
+        self.assertTrue(self.b.healthy)
+
+        self.pool.mark(self.b, healthy=False)
+        self.assertTrue(self.b.healthy)
+        self.assertIs(self.pool.try_acquire(), self.b)
+
+        # Once another backend is back, the failing one can be ejected
+        self.pool.mark(self.a, healthy=True)
+        self.pool.mark(self.b, healthy=False)
+        self.assertFalse(self.b.healthy)
+
+    def test_success_resets_failures(self):
+        self.a.outstanding = 2
+        self.pool.release(self.a, failed=True)
+        self.pool.release(self.a)
+        self.assertEqual(self.a.failures, 0)
+        self.assertTrue(self.a.healthy)
+
+    def test_check_health(self):
+        session = MagicMock()
+        session.get.side_effect = [MagicMock(), requests.exceptions.ConnectionError("refused")]
+        self.pool.mark(self.a, healthy=False)
+
+        self.pool.check_health(session, timeout=1)
+
+        self.assertTrue(self.a.healthy)
+        self.assertFalse(self.b.healthy)
+        session.get.assert_any_call("http://a:11434/api/tags", timeout=1)
+
+    @patch('requests.Session.post')
+    def test_client_spreads_requests(self, mock_post):
+        mock_post.return_value.json.return_value = {'response': 'test response'}
+        client = OllamaClient(backends=self.pool)
+
+        client.generate("first prompt")
+        client.generate("second prompt")
+
+        urls = [c.args[0] for c in mock_post.call_args_list]
+        self.assertEqual(urls, ["http://a:11434/api/generate", "http://b:11434/api/generate"])
+        self.assertEqual((self.a.outstanding, self.b.outstanding), (0, 0))
+
+    @patch('requests.Session.post')
+    def test_client_reports_failed_requests(self, mock_post):
+        mock_post.side_effect = requests.exceptions.ConnectionError("refused")
+        client = OllamaClient(backends=self.pool, retry=RetryPolicy(retries=0))
+
+        for _ in range(2):
+            with self.assertRaises(requests.exceptions.RequestException):
+                client.generate("test prompt")
+
+        self.assertEqual(self.a.failures + self.b.failures, 2)
+        self.assertEqual((self.a.outstanding, self.b.outstanding), (0, 0))
+
+
+class TestAdaptiveLimit(unittest.TestCase):
+    def test_slow_start_then_additive_increase(self):
+        limit = AdaptiveLimit(max_limit=8)
+        for _ in range(3):
+            limit.update(0.0, 0.01, failed=False)
+        self.assertEqual(limit.value, 4)
+
+        limit.update(0.0, 0.01, failed=True)
+        self.assertEqual(limit.value, 3)
+        limit.update(time.monotonic(), 0.01, failed=False)
+        self.assertAlmostEqual(limit.limit, 3.0 + 1 / 3.0)
+
+    def test_never_exceeds_maximum(self):
+        limit = AdaptiveLimit(max_limit=2)
+        for _ in range(5):
+            limit.update(0.0, 0.01, failed=False)
+        self.assertEqual(limit.value, 2)
+
+    def test_slow_responses_decrease_once_per_window(self):
+        limit = AdaptiveLimit(max_limit=16, initial=8)
+        started_at = time.monotonic()
+        limit.update(started_at, 0.01, failed=False)
+
+        # Two slow responses from requests already in flight count as one signal
+        limit.update(started_at, 0.05, failed=False)
+        limit.update(started_at, 0.05, failed=False)
+        self.assertEqual(limit.value, 6)
+
+        limit.update(time.monotonic(), 0.05, failed=False)
+        self.assertEqual(limit.value, 5)
+
+    def test_pool_routes_by_adaptive_capacity(self):
+        pool = BackendPool(["http://a:11434", "http://b:11434"], max_concurrency=4, adaptive=True)
+        a, b = pool.backends
+        a.limit.limit = 3.0
+
+        self.assertEqual([pool.try_acquire() for _ in range(4)], [a, b, a, a])
+        self.assertIsNone(pool.try_acquire())
+
+        pool.release(b, started_at=0.0, latency=0.01)
+        self.assertEqual(pool.capacity(b), 2)
+        self.assertIs(pool.try_acquire(), b)
+
+
+def http_error(status: int) -> requests.exceptions.HTTPError:
+    response = requests.Response()
+    response.status_code = status
+    return requests.exceptions.HTTPError(f"{status} error", response=response)
+
+
+@patch('ollama_app.retry.time.sleep')
+class TestRetries(unittest.TestCase):
+    def setUp(self):
+        self.policy = RetryPolicy(retries=3, backoff=1, max_backoff=4, deadline=60)
+        self.breaker = CircuitBreaker(threshold=0, reset_timeout=30)
+
+    def test_retries_transient_errors(self, mock_sleep):
+        call = MagicMock(side_effect=[http_error(503), requests.exceptions.ConnectionError(), "ok"])
+
+        self.assertEqual(call_with_retries(call, self.policy, self.breaker), "ok")
+
+        self.assertEqual(call.call_count, 3)
+        self.assertEqual(mock_sleep.call_count, 2)
+        for delay_call, cap in zip(mock_sleep.call_args_list, [1, 2]):
+            self.assertLessEqual(delay_call.args[0], cap)
+        # Each attempt gets the time left before the deadline
+        self.assertLessEqual(call.call_args.args[0], 60)
+
+    def test_does_not_retry_client_errors(self, mock_sleep):
+        call = MagicMock(side_effect=http_error(404))
+
+        with self.assertRaises(requests.exceptions.HTTPError):
+            call_with_retries(call, self.policy, self.breaker)
+        call.assert_called_once()
+
+    def test_gives_up_after_retries(self, mock_sleep):
+        call = MagicMock(side_effect=requests.exceptions.Timeout())
+
+        with self.assertRaises(requests.exceptions.Timeout):
+            call_with_retries(call, self.policy, self.breaker)
+        self.assertEqual(call.call_count, 4)
+
+    def test_gives_up_at_deadline(self, mock_sleep):
+        policy = RetryPolicy(retries=3, backoff=100, max_backoff=100, deadline=0.001)
+        call = MagicMock(side_effect=requests.exceptions.Timeout())
+
+        with patch('ollama_app.retry.random.uniform', return_value=100):
+            with self.assertRaises(requests.exceptions.Timeout):
+                call_with_retries(call, policy, self.breaker)
+        call.assert_called_once()
+        mock_sleep.assert_not_called()
+
+    def test_circuit_breaker_pauses_dispatch(self, mock_sleep):
+        breaker = CircuitBreaker(threshold=2, reset_timeout=30)
+        breaker.record_failure()
+        self.assertEqual(breaker.wait_time(), 0)
+        breaker.record_failure()
+        self.assertGreater(breaker.wait_time(), 29)
+
+        call = MagicMock(return_value="ok")
+        self.assertEqual(call_with_retries(call, self.policy, breaker), "ok")
+        self.assertGreater(mock_sleep.call_args.args[0], 29)
+        self.assertEqual(breaker.wait_time(), 0)
+
+        breaker.record_failure()
+        breaker.record_failure()
+        with self.assertRaises(CircuitOpenError):
+            call_with_retries(call, RetryPolicy(deadline=5), breaker)
+
+    def test_client_retries_server_errors(self, mock_sleep):
+        client = OllamaClient(retry=self.policy, breaker=self.breaker)
+        ok = MagicMock()
+        ok.json.return_value = {'response': 'test response'}
+        failed = MagicMock()
+        failed.raise_for_status.side_effect = http_error(503)
+
+        with patch('requests.Session.post', side_effect=[failed, ok]) as mock_post:
+            self.assertEqual(client.generate("test prompt"), 'test response')
+        self.assertEqual(mock_post.call_count, 2)
+        self.assertEqual(client.backends.backends[0].outstanding, 0)
+
+
+class TestOllamaClientStreaming(unittest.TestCase):
+    def setUp(self):
+        self.client = OllamaClient(stream=True)
+
+    @patch('requests.Session.post')
+    def test_generate_stream(self, mock_post):
+        mock_response = mock_post.return_value
+        mock_response.iter_lines.return_value = [
+            b'{"response": "SUMMARY: ", "done": false}',
+            b'',
+            b'{"response": "A hotel.", "done": false}',
+            b'{"response": "", "done": true}',
+        ]
+
+        result = self.client.generate("test prompt")
+
+        self.assertEqual(result, "SUMMARY: A hotel.")
+        self.assertEqual(mock_post.call_args.kwargs['json']['stream'], True)
+        self.assertTrue(mock_post.call_args.kwargs['stream'])
+        mock_response.close.assert_called_once()
+
+    @patch('requests.Session.post')
+    def test_generate_stream_stops_when_complete(self, mock_post):
+        mock_response = mock_post.return_value
+        mock_response.iter_lines.return_value = iter([
+            b'{"response": "SUMMARY: ", "done": false}',
+            b'{"response": "A hotel.", "done": false}',
+            b'{"response": " More text.", "done": false}',
+        ])
+
+        result = self.client.generate(
+            "test prompt", is_complete=lambda text: text.endswith("hotel."))
+
+        self.assertEqual(result, "SUMMARY: A hotel.")
+        # The remaining chunk is never read
+        self.assertEqual(len(list(mock_response.iter_lines.return_value)), 1)
+        mock_response.close.assert_called_once()
+
+    @patch('requests.Session.post')
+    def test_generate_stream_context(self, mock_post):
+        mock_post.return_value.iter_lines.return_value = [
+            b'{"response": "A hotel.", "done": false}',
+            b'{"response": "", "done": true, "context": [4, 5]}',
+        ]
+
+        text, context = self.client.generate_with_context("test prompt")
+
+        self.assertEqual(text, "A hotel.")
+        self.assertEqual(context.tokens, [4, 5])
+
+    @patch('requests.Session.post')
+    def test_generate_stream_records_stats(self, mock_post):
+        self.client.stats = RunStats()
+        mock_post.return_value.iter_lines.return_value = [
+            b'{"response": "A hotel.", "done": false}',
+            b'{"response": "", "done": true, "prompt_eval_count": 50, "prompt_eval_duration": 500000000,'
+            b' "eval_count": 20, "eval_duration": 1000000000}',
+        ]
+
+        self.client.generate("test prompt", prompt_type='summary')
+
+        generation = self.client.stats.generation_summary()['summary']
+        self.assertEqual(generation['requests'], 1)
+        self.assertEqual(generation['output_tokens'], 20)
+        self.assertEqual(generation['output_tokens_per_second'], 20.0)
+        self.assertEqual(generation['prompt_tokens_per_second'], 100.0)
+
+    @patch('requests.Session.post')
+    def test_generate_stream_error(self, mock_post):
+        mock_post.return_value.iter_lines.return_value = [b'{"error": "model not found"}']
+        with self.assertRaises(ValueError):
+            self.client.generate("test prompt")
+
+
+class TestRunStats(unittest.TestCase):
+    def test_percentile(self):
+        values = [float(value) for value in range(100, 0, -1)]
+        self.assertEqual(percentile(values, 0.50), 50.0)
+        self.assertEqual(percentile(values, 0.99), 99.0)
+        self.assertEqual(percentile([3.0], 0.95), 3.0)
+        self.assertEqual(percentile([], 0.95), 0.0)
+
+    def test_phase_summary(self):
+        stats = RunStats()
+        for seconds in (0.1, 0.2, 0.3, 0.4):
+            stats.record('llm.summary', seconds)
+        with stats.timer('db_write'):
+            pass
+
+        summary = stats.phase_summary()
+        self.assertEqual(list(summary), ['db_write', 'llm.summary'])
+        self.assertEqual(summary['llm.summary']['count'], 4)
+        self.assertAlmostEqual(summary['llm.summary']['total'], 1.0)
+        self.assertEqual(summary['llm.summary']['p50'], 0.2)
+        self.assertEqual(summary['llm.summary']['max'], 0.4)
+        self.assertEqual(summary['db_write']['count'], 1)
+
+    def test_generation_without_counts_is_ignored(self):
+        # Cached responses and streams stopped early carry no token counts
+        stats = RunStats()
+        stats.record_generation('summary', {'response': 'A hotel.'})
+        self.assertEqual(stats.generation_summary(), {})
+
+
+def metric_value(name: str, **labels) -> float:
+    return prometheus_client.REGISTRY.get_sample_value(name, labels) or 0
+
+
+class TestMetrics(unittest.TestCase):
+    def test_exporter_writes_file_and_pushes(self):
+        registry = prometheus_client.CollectorRegistry()
+        prometheus_client.Counter('runs', 'Runs', registry=registry).inc()
+        with tempfile.TemporaryDirectory() as directory, \
+                patch('ollama_app.metrics.push_to_gateway') as mock_push:
+            path = os.path.join(directory, 'metrics.prom')
+            exporter = MetricsExporter(path, 'pushgateway:9091', interval=60, registry=registry)
+            exporter.start()
+            exporter.stop()
+            with open(path) as f:
+                self.assertIn('runs_total 1.0\n', f.read())
+            self.assertEqual(os.listdir(directory), ['metrics.prom'])
+        mock_push.assert_called_once_with('pushgateway:9091', job='process_properties', registry=registry)
+
+    def test_exporter_survives_unreachable_gateway(self):
+        with patch('ollama_app.metrics.push_to_gateway', side_effect=OSError("Connection refused")):
+            MetricsExporter(gateway='pushgateway:9091').export()
+
+    def test_collection_registry_combines_processes(self):
+        self.assertIs(metrics.collection_registry(), prometheus_client.REGISTRY)
+        with tempfile.TemporaryDirectory() as directory, \
+                patch.dict(os.environ, {'PROMETHEUS_MULTIPROC_DIR': directory}):
+            registry = metrics.collection_registry()
+            self.assertIsNot(registry, prometheus_client.REGISTRY)
+            self.assertEqual(list(registry.collect()), [])
+
+    def test_metrics_view(self):
+        from django.test import RequestFactory
+        from ollama_app.views import metrics as metrics_view
+        factory = RequestFactory()
+
+        with override_settings(METRICS_TOKEN=''):
+            with self.assertRaises(Http404):
+                metrics_view(factory.get('/metrics', HTTP_AUTHORIZATION='Bearer secret'))
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(metrics_view(factory.get('/metrics')).status_code, 401)
+            self.assertEqual(
+                metrics_view(factory.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong')).status_code, 401)
+            response = metrics_view(factory.get('/metrics', HTTP_AUTHORIZATION='Bearer secret'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], prometheus_client.CONTENT_TYPE_LATEST)
+        self.assertIn(b'# TYPE ollama_requests_total counter', response.content)
+
+    @patch('requests.Session.post')
+    def test_client_records_requests(self, mock_post):
+        client = OllamaClient(backends=BackendPool(['http://metrics-test:11434'], max_concurrency=1),
+                              retry=RetryPolicy(retries=0))
+        mock_post.return_value.json.return_value = {'response': 'A hotel.', 'eval_count': 3}
+        labels = {'prompt_type': 'summary', 'backend': 'http://metrics-test:11434'}
+        tokens_before = metric_value('ollama_tokens_total', prompt_type='summary', kind='output')
+
+        client.generate("test prompt", prompt_type='summary')
+        mock_post.return_value.raise_for_status.side_effect = requests.exceptions.HTTPError("500")
+        with self.assertRaises(requests.exceptions.HTTPError):
+            client.generate("test prompt", prompt_type='summary')
+
+        self.assertEqual(metric_value('ollama_requests_total', outcome='success', **labels), 1)
+        self.assertEqual(metric_value('ollama_requests_total', outcome='error', **labels), 1)
+        self.assertEqual(metric_value('ollama_request_seconds_count', **labels), 1)
+        self.assertEqual(metric_value('ollama_tokens_total', prompt_type='summary', kind='output'), tokens_before + 3)
+        self.assertEqual(
+            metric_value('ollama_backend_requests_in_flight', backend='http://metrics-test:11434'), 0)
+
+
+class TestProfiling(unittest.TestCase):
+    def test_normalize_sql(self):
+        self.assertEqual(
+            normalize_sql('SELECT "id" FROM "hotels"\n WHERE "id" IN (%s, %s, %s)'),
+            'SELECT "id" FROM "hotels" WHERE "id" IN (...)')
+        self.assertEqual(
+            normalize_sql('INSERT INTO "t" ("a", "b") VALUES (%s, %s), (%s, %s)'),
+            'INSERT INTO "t" ("a", "b") VALUES (%s, %s), ...')
+
+    def test_counts_queries_per_hotel(self):
+        counter = QueryCounter()
+        counter.active = True
+        execute = MagicMock(return_value='result')
+        lookup = 'SELECT "response" FROM "generation_cache" WHERE "key" = %s'
+
+        self.assertEqual(counter(execute, 'SELECT "id" FROM "hotels"', None, False, {}), 'result')
+        for hotel_id in (1, 2, 3):
+            with hotel_scope(hotel_id):
+                counter(execute, lookup, ['key'], False, {})
+                counter(execute, 'BEGIN', None, False, {})
+        with hotel_scope(3):
+            counter(execute, 'INSERT INTO "property_content" VALUES (%s)', ['x'], False, {})
+
+        self.assertEqual(counter.total, 8)
+        self.assertEqual(counter.unattributed, 1)
+        self.assertEqual(counter.per_hotel, {1: 2, 2: 2, 3: 3})
+        # Transaction control and statements run for a single hotel are not flagged
+        self.assertEqual([entry['sql'] for entry in counter.suspects()], [lookup])
+
+    def test_profiles_worker_threads(self):
+        profiler = RunProfiler()
+        profiler.start()
+
+        def busy():
+            return sum(range(100))
+
+        def work(_):
+            with profiler.thread():
+                busy()
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            list(executor.map(work, range(4)))
+        profiler.stop()
+
+        # One profile per thread, and the calls made in the workers are in them
+        self.assertLessEqual(len(profiler.profiles), 3)
+        calls = {function[2]: counts[1] for function, counts in profiler.stats().stats.items()}
+        self.assertEqual(calls['busy'], 4)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'run.prof')
+            profiler.write(path)
+            self.assertTrue(os.path.getsize(path))
+
+
+class TestFakeOllama(unittest.TestCase):
+    def start_server(self, **config):
+        server = FakeOllamaServer(FakeOllamaConfig(latency=0.0, seed=1, **config)).start()
+        self.addCleanup(server.stop)
+        return server
+
+    def client_for(self, server, **kwargs):
+        client = OllamaClient(
+            backends=BackendPool([server.url], max_concurrency=2), retry=RetryPolicy(retries=0), **kwargs)
+        self.addCleanup(client.close)
+        return client
+
+    def test_answers_the_command_prompts(self):
+        server = self.start_server()
+        client = self.client_for(server, stats=RunStats())
+        command = Command()
+        hotel = synthetic_hotels(1)[0]
+
+        client.check_model()
+        content_data = command.parse_description(
+            client.generate(command.description_prompt(hotel), prompt_type='description'))
+        review_data = command.parse_review(client.generate(command.review_prompt(hotel, "A hotel.")))
+
+        self.assertTrue(content_data['title'])
+        self.assertTrue(3.0 <= review_data['rating'] <= 5.0)
+        self.assertEqual(client.stats.generation_summary()['description']['requests'], 1)
+        self.assertEqual(server.requests, 2)
+
+    def test_streams_json(self):
+        server = self.start_server()
+        client = self.client_for(server, stream=True)
+        data = json.loads(client.generate("SUMMARY: [a summary]", schema={'type': 'object'}))
+        self.assertEqual(list(data), ['summary'])
+
+    def test_errors_and_malformed_responses(self):
+        failing = self.client_for(self.start_server(error_rate=1.0))
+        with self.assertRaises(requests.exceptions.HTTPError):
+            failing.generate("SUMMARY: [a summary]")
+
+        malformed = self.client_for(self.start_server(malformed_rate=1.0))
+        with self.assertRaises(ValueError):
+            Command().parse_summary(malformed.generate("SUMMARY: [a summary]"))
+
+    def test_stops_at_num_predict(self):
+        client = self.client_for(self.start_server())
+        with self.assertRaises(TruncatedResponseError):
+            client.generate("REVIEW: [a review]", options={'num_predict': 5})
+        text = client.generate("SUMMARY: [a summary]", options={'num_predict': 5}, allow_truncated=True)
+        self.assertEqual(len(text.split(' ')), 5)
+
+
+class TestSyntheticHotels(unittest.TestCase):
+    def test_same_seed_gives_same_hotels(self):
+        first, second = synthetic_hotels(5, seed=3), synthetic_hotels(5, seed=3)
+        self.assertEqual([hotel_fingerprint(hotel) for hotel in first],
+                         [hotel_fingerprint(hotel) for hotel in second])
+        self.assertNotEqual(hotel_fingerprint(first[0]), hotel_fingerprint(synthetic_hotels(1, seed=4)[0]))
+        self.assertEqual(first[2].hotelId, 'synthetic-3-2')
+
+    def test_hotel_fixture(self):
+        entry, = hotel_fixture(synthetic_hotels(1))
+        self.assertEqual(entry['model'], 'ollama_app.hotel')
+        self.assertNotIn('id', entry['fields'])
+        self.assertEqual(entry['fields']['hotelId'], 'synthetic-0-0')
+
+    @override_settings(ALLOW_SYNTHETIC_HOTELS=False)
+    @patch('ollama_app.management.commands.generate_hotels.Hotel.objects')
+    def test_generate_hotels_needs_non_production_database(self, mock_hotel_objects):
+        from ollama_app.management.commands.generate_hotels import Command as GenerateHotelsCommand
+
+        with self.assertRaises(CommandError):
+            GenerateHotelsCommand(stdout=StringIO()).handle(count=2)
+        mock_hotel_objects.bulk_create.assert_not_called()
+
+        GenerateHotelsCommand(stdout=StringIO()).handle(count=2, allow_synthetic=True)
+        self.assertEqual(len(mock_hotel_objects.bulk_create.call_args.args[0]), 2)
+        with override_settings(ALLOW_SYNTHETIC_HOTELS=True):
+            GenerateHotelsCommand(stdout=StringIO()).handle(count=2)
+        self.assertEqual(mock_hotel_objects.bulk_create.call_count, 2)
+
+        # A fixture file and deleting synthetic hotels do not insert anything
+        with tempfile.TemporaryDirectory() as directory:
+            GenerateHotelsCommand(stdout=StringIO()).handle(count=2, output=os.path.join(directory, 'hotels.json'))
+        mock_hotel_objects.filter.return_value.delete.return_value = (0, {})
+        GenerateHotelsCommand(stdout=StringIO()).handle(delete=True)
+        self.assertEqual(mock_hotel_objects.bulk_create.call_count, 2)
+
+    @override_settings(ALLOW_SYNTHETIC_HOTELS=False)
+    @patch('ollama_app.management.commands.benchmark_properties.Hotel.objects')
+    def test_benchmark_needs_non_production_database(self, mock_hotel_objects):
+        from ollama_app.management.commands.benchmark_properties import Command as BenchmarkCommand
+
+        with self.assertRaises(CommandError):
+            BenchmarkCommand(stdout=StringIO()).handle(hotels=5)
+        self.assertEqual(mock_hotel_objects.mock_calls, [])
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = ResponseCache(1, ttl=60, max_entries=10)
+        self.payload = {"model": "llama3.2", "prompt": "test prompt", "stream": False}
+
+    def test_make_key(self):
+        key = self.cache.make_key(self.payload)
+        self.assertEqual(len(key), 64)
+        self.assertEqual(key, self.cache.make_key(dict(self.payload, stream=True)))
+        self.assertEqual(key, self.cache.make_key(dict(self.payload, keep_alive="30m")))
+        self.assertNotEqual(key, self.cache.make_key(dict(self.payload, options={"num_predict": 100})))
+        self.assertNotEqual(key, self.cache.make_key(dict(self.payload, prompt="other")))
+        self.assertNotEqual(key, self.cache.make_key(dict(self.payload, format={"type": "object"})))
+        self.assertNotEqual(key, ResponseCache(2).make_key(self.payload))
+
+    @patch('ollama_app.cache.GenerationCache.objects')
+    def test_get_fresh_entry(self, mock_objects):
+        mock_objects.filter.return_value.values_list.return_value.first.return_value = (
+            'cached response', timezone.now())
+        self.assertEqual(self.cache.get('key'), 'cached response')
+
+    @patch('ollama_app.cache.GenerationCache.objects')
+    def test_get_expired_entry(self, mock_objects):
+        mock_objects.filter.return_value.values_list.return_value.first.return_value = (
+            'cached response', timezone.now() - timedelta(seconds=120))
+        self.assertIsNone(self.cache.get('key'))
+        mock_objects.filter.return_value.delete.assert_called_once()
+
+    @patch.object(ResponseCache, 'prune')
+    @patch('ollama_app.cache.GenerationCache.objects')
+    def test_prunes_during_long_runs(self, mock_objects, mock_prune):
+        cache = ResponseCache(1, ttl=60, max_entries=10, prune_every=3)
+        for index in range(7):
+            cache.set(f'key-{index}', 'response')
+        self.assertEqual(mock_objects.bulk_create.call_count, 7)
+        self.assertEqual(mock_prune.call_count, 2)
+
+        never = ResponseCache(1, prune_every=0)
+        for index in range(5):
+            never.set(f'key-{index}', 'response')
+        self.assertEqual(mock_prune.call_count, 2)
+
+    @patch('requests.Session.post')
+    def test_client_uses_cache(self, mock_post):
+        mock_cache = MagicMock()
+        mock_cache.get.return_value = None
+        mock_post.return_value.json.return_value = {'response': 'test response'}
+        client = OllamaClient(cache=mock_cache)
+
+        self.assertEqual(client.generate("test prompt"), 'test response')
+        mock_cache.set.assert_called_once_with(mock_cache.make_key.return_value, 'test response')
+
+        mock_cache.get.return_value = 'cached response'
+        self.assertEqual(client.generate("test prompt"), 'cached response')
+        mock_post.assert_called_once()
+
+
+class TestClaims(unittest.TestCase):
+    @patch('ollama_app.claims.HotelClaim.objects')
+    def test_enqueue_hotels(self, mock_claim_objects):
+        hotels = [MagicMock(id=1), MagicMock(id=2)]
+
+        self.assertEqual(claims.enqueue_hotels(hotels), 2)
+
+        created = mock_claim_objects.bulk_create.call_args.args[0]
+        self.assertEqual([claim.hotel_id for claim in created], [1, 2])
+        self.assertTrue(mock_claim_objects.bulk_create.call_args.kwargs['ignore_conflicts'])
+        self.assertEqual(mock_claim_objects.filter.return_value.update.call_args.kwargs['status'], 'pending')
+
+    @patch('ollama_app.claims.transaction.atomic')
+    @patch('ollama_app.claims.HotelClaim.objects')
+    def test_claim_hotels_skips_locked_rows(self, mock_claim_objects, mock_atomic):
+        locked = mock_claim_objects.select_for_update.return_value
+        locked.filter.return_value.order_by.return_value.values_list.return_value = [10, 11]
+        mock_claim_objects.filter.return_value.values_list.return_value = [5, 4]
+
+        self.assertEqual(claims.claim_hotels('worker-1', 2), [5, 4])
+
+        mock_claim_objects.select_for_update.assert_called_once_with(skip_locked=True)
+        update = mock_claim_objects.filter.return_value.update.call_args.kwargs
+        self.assertEqual(update['status'], 'claimed')
+        self.assertEqual(update['worker_id'], 'worker-1')
+
+    @patch('ollama_app.claims.transaction.atomic')
+    @patch('ollama_app.claims.HotelClaim.objects')
+    def test_claim_hotels_empty_queue(self, mock_claim_objects, mock_atomic):
+        locked = mock_claim_objects.select_for_update.return_value
+        locked.filter.return_value.order_by.return_value.values_list.return_value = []
+
+        self.assertEqual(claims.claim_hotels('worker-1', 2), [])
+        mock_claim_objects.filter.return_value.update.assert_not_called()
+
+    @patch('ollama_app.claims.HotelClaim.objects')
+    def test_requeue_expired_claims(self, mock_claim_objects):
+        mock_claim_objects.filter.return_value.update.return_value = 3
+
+        self.assertEqual(claims.requeue_expired_claims(60), 3)
+
+        lookups = mock_claim_objects.filter.call_args.kwargs
+        self.assertEqual(lookups['status'], 'claimed')
+        self.assertLess(lookups['heartbeat_at__lt'], timezone.now() - timedelta(seconds=59))
+
+
+class TestPropertyWriter(unittest.TestCase):
+    def setUp(self):
+        self.hotel = MagicMock(id=1, hotelId='H1')
+        self.item = GeneratedProperty(
+            self.hotel, {'title': 'New title', 'description': 'New description'},
+            'New summary', {'rating': 4.5, 'review': 'New review'}, 'fingerprint')
+
+    @patch('ollama_app.writer.transaction.atomic')
+    @patch('ollama_app.writer.PropertyReview.objects')
+    @patch('ollama_app.writer.PropertySummary.objects')
+    @patch('ollama_app.writer.PropertyContent.objects')
+    def test_write_properties_bulk_creates_rows(self, mock_content_objects, mock_summary_objects,
+                                                mock_review_objects, mock_atomic):
+        write_properties([self.item])
+
+        content, = mock_content_objects.bulk_create.call_args.args[0]
+        self.assertEqual(content.hotel_id, 1)
+        self.assertEqual(content.title, 'New title')
+        self.assertEqual(content.source_fingerprint, 'fingerprint')
+        mock_content_objects.bulk_update.assert_not_called()
+        summary, = mock_summary_objects.bulk_create.call_args.args[0]
+        self.assertIs(summary.property, content)
+        review, = mock_review_objects.bulk_create.call_args.args[0]
+        self.assertEqual(review.rating, 4.5)
+
+    @patch('ollama_app.writer.finish_claims')
+    @patch('ollama_app.writer.transaction.atomic')
+    @patch('ollama_app.writer.PropertyReview.objects')
+    @patch('ollama_app.writer.PropertySummary.objects')
+    @patch('ollama_app.writer.PropertyContent.objects')
+    def test_write_properties_incremental_updates_content(self, mock_content_objects, mock_summary_objects,
+                                                          mock_review_objects, mock_atomic, mock_finish_claims):
+        existing = PropertyContent(id=7, hotel_id=1, title='Old title')
+        latest = mock_content_objects.filter.return_value.order_by.return_value
+        latest.only.return_value = [existing]
+
+        write_properties([self.item], incremental=True, worker_id='worker-1')
+
+        mock_content_objects.bulk_create.assert_called_once_with([])
+        self.assertEqual(existing.title, 'New title')
+        self.assertIn('updated_at', mock_content_objects.bulk_update.call_args.args[1])
+        mock_summary_objects.filter.assert_called_once_with(property__in=[existing])
+        mock_summary_objects.filter.return_value.delete.assert_called_once()
+        mock_review_objects.filter.return_value.delete.assert_called_once()
+        self.assertIs(mock_summary_objects.bulk_create.call_args.args[0][0].property, existing)
+        mock_finish_claims.assert_called_once_with('worker-1', [1], 'done')
+
+    @patch('ollama_app.writer.write_properties')
+    def test_flushes_when_buffer_is_full(self, mock_write_properties):
+        writer = PropertyWriter(flush_size=2, flush_interval=3600)
+
+        writer.add(self.item)
+        mock_write_properties.assert_not_called()
+        writer.add(self.item)
+
+        mock_write_properties.assert_called_once_with([self.item, self.item], False, None)
+
+    @patch('ollama_app.writer.write_properties')
+    def test_flushes_after_interval(self, mock_write_properties):
+        writer = PropertyWriter(flush_size=100, flush_interval=0)
+
+        writer.add(self.item)
+
+        mock_write_properties.assert_called_once_with([self.item], False, None)
+
+    @patch('ollama_app.writer.connections')
+    @patch('ollama_app.writer.write_properties')
+    def test_timer_flushes_when_generation_stalls(self, mock_write_properties, mock_connections):
+        writer = PropertyWriter(flush_size=100, flush_interval=0.05)
+        writer.start()
+        self.addCleanup(writer.stop)
+
+        writer.add(self.item)
+        mock_write_properties.assert_not_called()
+        # No further property arrives; the timer saves the waiting one
+        deadline = time.monotonic() + 2
+        while not mock_write_properties.called and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        mock_write_properties.assert_called_once_with([self.item], False, None)
+        writer.stop()
+        mock_connections.close_all.assert_called_once()
+
+    @patch('ollama_app.writer.write_properties')
+    def test_failed_bulk_write_falls_back_to_single_rows(self, mock_write_properties):
+        error = Exception("Bad row")
+        mock_write_properties.side_effect = [Exception("Bulk failed"), None, error]
+        other = self.item._replace(hotel=MagicMock(id=2))
+        writer = PropertyWriter(flush_size=10)
+
+        writer.add(self.item)
+        writer.add(other)
+        writer.flush()
+
+        self.assertEqual(mock_write_properties.call_count, 3)
+        self.assertEqual(writer.take_failures(), [(other.hotel, error)])
+        self.assertEqual(writer.take_failures(), [])
+
+
+class TestAsyncOllamaClient(unittest.TestCase):
+    def setUp(self):
+        self.client = AsyncOllamaClient()
+        self.mock_response = MagicMock()
+        self.mock_session = MagicMock()
+        self.mock_session.post.return_value.__aenter__.return_value = self.mock_response
+        self.client.session = self.mock_session
+
+    def test_generate_success(self):
+        self.mock_response.json = AsyncMock(return_value={'response': 'test response'})
+
+        result = asyncio.run(self.client.generate("test prompt"))
+        self.assertEqual(result, 'test response')
+
+        self.mock_session.post.assert_called_once_with(
+            "http://ollama:11434/api/generate",
+            json={"model": "llama3.2", "prompt": "test prompt", "stream": False},
+            timeout=ANY
+        )
+
+    def test_generate_client_error(self):
+        self.mock_response.raise_for_status.side_effect = aiohttp.ClientError("API error")
+        with self.assertRaises(aiohttp.ClientError):
+            asyncio.run(self.client.generate("test prompt"))
+
+    def test_generate_json_decode_error(self):
+        self.mock_response.json = AsyncMock(
+            side_effect=json.JSONDecodeError("Invalid JSON", "", 0))
+        with self.assertRaises(json.JSONDecodeError):
+            asyncio.run(self.client.generate("test prompt"))
+
+    def test_generate_stream_stops_when_complete(self):
+        async def lines():
+            for line in [b'{"response": "SUMMARY: "}\n', b'{"response": "A hotel."}\n',
+                         b'{"response": " More text."}\n']:
+                yield line
+        self.client.stream = True
+        self.mock_response.content = lines()
+
+        result = asyncio.run(self.client.generate(
+            "test prompt", is_complete=lambda text: text.endswith("hotel.")))
+
+        self.assertEqual(result, "SUMMARY: A hotel.")
+        self.assertEqual(self.mock_session.post.call_args.kwargs['json']['stream'], True)
+        self.mock_response.close.assert_called_once()
+
+
 class TestProcessProperties(unittest.TestCase):
     def setUp(self):
         self.command = Command()
         self.hotel_mock = MagicMock()
+        self.hotel_mock.id = 1
         self.hotel_mock.hotelId = 1
         self.hotel_mock.title = "Sample Hotel"
         self.hotel_mock.location = "Beachside"
@@ -213,6 +1239,12 @@ class TestProcessProperties(unittest.TestCase):
         self.hotel_mock.room_type = "Suite"
         self.hotel_mock.rating = 4.5
 
+        # handle() checks for the model and loads it before processing
+        for method in ('check_model', 'warm_up'):
+            patcher = patch.object(OllamaClient, method)
+            setattr(self, f'mock_{method}', patcher.start())
+            self.addCleanup(patcher.stop)
+
     def test_generate_property_description_success(self):
         with patch.object(OllamaClient, 'generate') as mock_generate:
             mock_generate.return_value = """TITLE: Luxurious Beachside Escape
@@ -255,6 +1287,22 @@ class TestProcessProperties(unittest.TestCase):
                 self.command.generate_summary(
                     self.hotel_mock, property_content)
 
+    def test_summary_complete(self):
+        self.assertFalse(self.command.summary_complete("Thinking about it..."))
+        self.assertFalse(self.command.summary_complete("SUMMARY: " + "a" * 499))
+        self.assertTrue(self.command.summary_complete("SUMMARY: " + "a" * 500))
+
+    def test_generate_summary_passes_completion_check(self):
+        property_content = MagicMock()
+        property_content.description = "Test description"
+
+        with patch.object(OllamaClient, 'generate') as mock_generate:
+            mock_generate.return_value = "SUMMARY: A wonderful beachfront property"
+
+            self.command.generate_summary(self.hotel_mock, property_content)
+            self.assertEqual(mock_generate.call_args.kwargs['is_complete'],
+                             self.command.summary_complete)
+
     def test_generate_review_success(self):
         property_content = MagicMock()
         property_content.description = "Test description"
@@ -296,16 +1344,12 @@ class TestProcessProperties(unittest.TestCase):
             self.assertEqual(result['rating'], 5.0)  # Should be capped at 5.0
 
     @patch('ollama_app.management.commands.process_properties.Hotel.objects')
-    @patch('ollama_app.management.commands.process_properties.PropertyContent.objects.create')
-    @patch('ollama_app.management.commands.process_properties.PropertySummary.objects.create')
-    @patch('ollama_app.management.commands.process_properties.PropertyReview.objects.create')
+    @patch('ollama_app.writer.write_properties')
     @patch.object(OllamaClient, 'generate')
-    def test_handle_success(self, mock_generate, mock_create_review, mock_create_summary,
-                            mock_create_content, mock_hotel_objects):
+    def test_handle_success(self, mock_generate, mock_write_properties,
+                            mock_hotel_objects):
         # Your existing handle success test...
-        mock_queryset = MagicMock()
-        mock_queryset.order_by.return_value = [self.hotel_mock]
-        mock_hotel_objects.all.return_value = mock_queryset
+        mock_hotel_objects.only.return_value = HotelQuerySetStub([self.hotel_mock])
 
         mock_generate.side_effect = [
             "TITLE: Luxurious Beachside Escape\nDESCRIPTION: Experience unparalleled comfort.",
@@ -316,17 +1360,452 @@ class TestProcessProperties(unittest.TestCase):
         self.command.handle()
 
         self.assertEqual(mock_generate.call_count, 3)
-        mock_create_content.assert_called_once()
-        mock_create_summary.assert_called_once()
-        mock_create_review.assert_called_once()
+        mock_write_properties.assert_called_once()
+        item, = mock_write_properties.call_args.args[0]
+        self.assertIs(item.hotel, self.hotel_mock)
+        self.assertEqual(item.content_data['title'], "Luxurious Beachside Escape")
+        self.assertEqual(item.review_data['rating'], 4.7)
+
+    def test_parse_combined_success(self):
+        content_data, summary, review_data = self.command.parse_combined(
+            """TITLE: Luxurious Beachside Escape
+            DESCRIPTION: Experience unparalleled comfort with ocean views.
+            SUMMARY: A wonderful beachfront property
+            RATING: 4.8
+            REVIEW: Excellent stay with great amenities""")
+
+        self.assertEqual(content_data, {
+            'title': "Luxurious Beachside Escape",
+            'description': "Experience unparalleled comfort with ocean views."
+        })
+        self.assertEqual(summary, "A wonderful beachfront property")
+        self.assertEqual(review_data, {
+            'rating': 4.8, 'review': "Excellent stay with great amenities"})
+
+    def test_parse_combined_invalid_format(self):
+        with self.assertRaises(ValueError):
+            self.command.parse_combined(
+                "TITLE: Escape\nDESCRIPTION: Comfort.\nRATING: 4.8\nREVIEW: Great.")
+        with self.assertRaises(ValueError):
+            self.command.parse_combined(
+                "TITLE: Escape\nDESCRIPTION: Comfort.\nRATING: 4.8\nREVIEW: Great.\nSUMMARY: A hotel.")
 
     @patch('ollama_app.management.commands.process_properties.Hotel.objects')
-    @patch('ollama_app.management.commands.process_properties.PropertyContent.objects.create')
+    @patch('ollama_app.writer.write_properties')
     @patch.object(OllamaClient, 'generate')
-    def test_handle_with_errors(self, mock_generate, mock_create_content, mock_hotel_objects):
-        mock_queryset = MagicMock()
-        mock_queryset.order_by.return_value = [self.hotel_mock]
-        mock_hotel_objects.all.return_value = mock_queryset
+    def test_handle_combined(self, mock_generate, mock_write_properties,
+                             mock_hotel_objects):
+        mock_hotel_objects.only.return_value = HotelQuerySetStub([self.hotel_mock])
+
+        mock_generate.return_value = (
+            "TITLE: Luxurious Beachside Escape\nDESCRIPTION: Experience unparalleled comfort.\n"
+            "SUMMARY: A luxurious beachfront hotel.\nRATING: 4.7\nREVIEW: The perfect getaway."
+        )
+
+        self.command.handle(combined=True)
+
+        mock_generate.assert_called_once()
+        item, = mock_write_properties.call_args.args[0]
+        self.assertEqual(item.content_data['title'], "Luxurious Beachside Escape")
+        self.assertEqual(item.summary, "A luxurious beachfront hotel.")
+        self.assertEqual(item.review_data['rating'], 4.7)
+
+    def test_generate_property_description_json(self):
+        self.command.json_output = True
+        with patch.object(OllamaClient, 'generate') as mock_generate:
+            mock_generate.return_value = json.dumps({
+                'title': ' Luxurious Beachside Escape ',
+                'description': 'Experience unparalleled comfort with ocean views.'
+            })
+
+            result = self.command.generate_property_description_and_modify_title(
+                self.hotel_mock)
+
+            self.assertEqual(result['title'], "Luxurious Beachside Escape")
+            self.assertEqual(
+                result['description'], "Experience unparalleled comfort with ocean views.")
+            self.assertEqual(mock_generate.call_args.kwargs['schema']['required'],
+                             ['title', 'description'])
+            self.assertIn("JSON object", mock_generate.call_args.args[0])
+
+    def test_malformed_response_is_discarded(self):
+        with patch.object(OllamaClient, 'generate') as mock_generate, \
+                patch.object(OllamaClient, 'discard') as mock_discard:
+            mock_generate.return_value = "Invalid format response"
+
+            with self.assertRaises(ValueError):
+                self.command.generate_property_description_and_modify_title(self.hotel_mock)
+            mock_discard.assert_called_once_with(
+                self.command.description_prompt(self.hotel_mock), schema=None, context=None, options=None)
+
+    def test_malformed_response_is_counted(self):
+        before = metric_value('property_parse_failures_total', prompt_type='summary')
+        with patch.object(self.command.ollama, 'generate', side_effect=["nonsense", "SUMMARY: A hotel."]), \
+                patch.object(self.command.ollama, 'discard'):
+            self.command.parse_retries = 1
+            self.command.ask('summary', "prompt", self.command.parse_summary)
+        self.assertEqual(metric_value('property_parse_failures_total', prompt_type='summary'), before + 1)
+
+    def test_malformed_response_is_asked_again(self):
+        self.command.parse_retries = 2
+        with patch.object(OllamaClient, 'generate') as mock_generate, \
+                patch.object(OllamaClient, 'discard') as mock_discard:
+            mock_generate.side_effect = [
+                "Invalid format response", "TITLE: Escape\nDESCRIPTION: Comfort."]
+
+            result = self.command.generate_property_description_and_modify_title(self.hotel_mock)
+
+            self.assertEqual(result['title'], "Escape")
+            self.assertEqual(mock_generate.call_count, 2)
+            mock_discard.assert_called_once()
+
+    def test_process_hotel_reuses_context(self):
+        self.command.reuse_context = True
+        context = GenerationContext([1, 2, 3], "http://ollama:11434")
+        with patch.object(OllamaClient, 'generate_with_context') as mock_generate_with_context, \
+                patch.object(OllamaClient, 'generate') as mock_generate, \
+                patch.object(Command, 'save_property') as mock_save_property:
+            mock_generate_with_context.return_value = ("TITLE: Escape\nDESCRIPTION: Comfort.", context)
+            mock_generate.side_effect = ["SUMMARY: A hotel.", "RATING: 4.7\nREVIEW: Great."]
+
+            self.command.process_hotel(self.hotel_mock)
+
+        for follow_up in mock_generate.call_args_list:
+            self.assertIs(follow_up.kwargs['context'], context)
+            self.assertTrue(follow_up.args[0].startswith("Now"))
+            self.assertNotIn("Comfort.", follow_up.args[0])
+        mock_save_property.assert_called_once_with(
+            self.hotel_mock, {'title': 'Escape', 'description': 'Comfort.'}, "A hotel.",
+            {'rating': 4.7, 'review': 'Great.'})
+
+    def test_process_hotel_without_context_sends_full_prompts(self):
+        self.command.reuse_context = True
+        with patch.object(OllamaClient, 'generate_with_context') as mock_generate_with_context, \
+                patch.object(OllamaClient, 'generate') as mock_generate, \
+                patch.object(Command, 'save_property'):
+            # Cached responses come back without a context
+            mock_generate_with_context.return_value = ("TITLE: Escape\nDESCRIPTION: Comfort.", None)
+            mock_generate.side_effect = ["SUMMARY: A hotel.", "RATING: 4.7\nREVIEW: Great."]
+
+            self.command.process_hotel(self.hotel_mock)
+
+        self.assertIn("Comfort.", mock_generate.call_args_list[0].args[0])
+        self.assertNotIn('context', mock_generate.call_args_list[0].kwargs)
+
+    def test_load_prompt_options(self):
+        with override_settings(OLLAMA_PROMPT_OPTIONS={'summary': {'num_predict': 192}}, OLLAMA_SUMMARY_NUM_PREDICT=0):
+            profiles = self.command.load_prompt_options(
+                ['summary.num_predict=160', 'temperature=0.2', 'review.stop=["\\n\\n"]', 'keep_alive=30m'])
+
+        self.assertEqual(profiles['summary'], {'num_predict': 160, 'temperature': 0.2, 'keep_alive': '30m'})
+        self.assertEqual(profiles['review'], {'temperature': 0.2, 'stop': ["\n\n"], 'keep_alive': '30m'})
+        self.assertEqual(profiles['description'], {'temperature': 0.2, 'keep_alive': '30m'})
+
+        with self.assertRaises(CommandError):
+            self.command.load_prompt_options(['headline.num_predict=10'])
+        with self.assertRaises(CommandError):
+            self.command.load_prompt_options(['num_predict'])
+
+    @override_settings(OLLAMA_PROMPT_OPTIONS={}, OLLAMA_SUMMARY_NUM_PREDICT=192)
+    def test_summary_cap_only_applies_to_markers(self):
+        self.assertEqual(self.command.load_prompt_options([])['summary'], {'num_predict': 192})
+        self.assertEqual(self.command.load_prompt_options(['summary.num_predict=300'])['summary'],
+                         {'num_predict': 300})
+
+        # A JSON summary cut off by num_predict cannot be parsed
+        self.command.json_output = True
+        self.assertEqual(self.command.load_prompt_options([])['summary'], {})
+        self.assertEqual(self.command.load_prompt_options(['summary.num_predict=300'])['summary'],
+                         {'num_predict': 300})
+
+    @override_settings(OLLAMA_PROMPT_OPTIONS={}, OLLAMA_SUMMARY_NUM_PREDICT=192)
+    @patch('ollama_app.management.commands.process_properties.Hotel.objects')
+    @patch('ollama_app.writer.write_properties')
+    @patch('requests.Session.post')
+    def test_handle_json_with_long_summary(self, mock_post, mock_write_properties, mock_hotel_objects):
+        mock_hotel_objects.only.return_value = HotelQuerySetStub([self.hotel_mock])
+        answers = {'title': "Escape", 'description': "Comfort.", 'summary': "A long summary. " * 100,
+                   'rating': 4.7, 'review': "Great."}
+
+        def respond(url, **kwargs):
+            # Like Ollama, a reply capped by num_predict is cut off with done_reason 'length'
+            payload = kwargs['json']
+            text = json.dumps({field: answers[field] for field in payload['format']['required']})
+            num_predict = (payload.get('options') or {}).get('num_predict')
+            response = MagicMock()
+            response.json.return_value = {
+                'response': text[:num_predict] if num_predict else text, 'done': True,
+                'done_reason': 'length' if num_predict and num_predict < len(text) else 'stop'}
+            return response
+        mock_post.side_effect = respond
+
+        self.command.handle(json_output=True)
+
+        self.assertEqual(self.command.error_count, 0)
+        item, = mock_write_properties.call_args.args[0]
+        self.assertEqual(item.summary, answers['summary'][:500])
+
+    def test_generate_summary_sends_options(self):
+        self.command.prompt_options = {'summary': {'num_predict': 160}}
+        property_content = MagicMock()
+        property_content.description = "Test description"
+        with patch.object(OllamaClient, 'generate') as mock_generate:
+            mock_generate.return_value = "SUMMARY: A hotel."
+
+            self.command.generate_summary(self.hotel_mock, property_content)
+
+            self.assertEqual(mock_generate.call_args.kwargs['options'], {'num_predict': 160})
+            self.assertTrue(mock_generate.call_args.kwargs['allow_truncated'])
+
+    def test_hotel_fingerprint(self):
+        fingerprint = hotel_fingerprint(self.hotel_mock)
+        self.assertEqual(fingerprint, hotel_fingerprint(self.hotel_mock))
+
+        self.hotel_mock.price = 250
+        self.assertNotEqual(fingerprint, hotel_fingerprint(self.hotel_mock))
+
+    @patch('ollama_app.management.commands.process_properties.PropertyContent.objects')
+    def test_changed_hotels(self, mock_content_objects):
+        unchanged, changed, new = make_hotels(range(3))
+        for hotel in (unchanged, changed, new):
+            for field in ('title', 'location', 'city', 'price', 'room_type', 'rating'):
+                setattr(hotel, field, field)
+        mock_content_objects.filter.return_value.values_list.return_value = [
+            (unchanged.id, hotel_fingerprint(unchanged)),
+            (changed.id, 'outdated fingerprint'),
+        ]
+
+        self.assertEqual(self.command.changed_hotels([unchanged, changed, new]), [changed, new])
+        # Only each hotel's latest content is compared, not every row it ever had
+        self.assertIsInstance(mock_content_objects.filter.call_args.kwargs['id'], Subquery)
+
+    @patch('ollama_app.management.commands.process_properties.Hotel.objects')
+    def test_hotel_batches(self, mock_hotel_objects):
+        hotels = make_hotels(range(1, 11))
+        mock_hotel_objects.only.return_value = HotelQuerySetStub(hotels)
+
+        def batch_ids(**kwargs):
+            return [[hotel.id for hotel in batch] for batch in self.command.hotel_batches(3, **kwargs)]
+
+        self.assertEqual(batch_ids(), [[10, 9, 8], [7, 6, 5], [4, 3, 2], [1]])
+        self.assertEqual(batch_ids(limit=5), [[10, 9, 8], [7, 6]])
+        self.assertEqual(batch_ids(limit=4, offset=2), [[8, 7, 6], [5]])
+        self.assertEqual(batch_ids(min_id=3, max_id=8), [[8, 7, 6], [5, 4, 3]])
+        self.assertIn('title', mock_hotel_objects.only.call_args.args)
+
+    @patch('ollama_app.management.commands.process_properties.Hotel.objects')
+    def test_hotel_batches_incremental(self, mock_hotel_objects):
+        hotels = make_hotels(range(1, 6))
+        mock_hotel_objects.only.return_value = HotelQuerySetStub(hotels)
+        self.command.incremental = True
+
+        with patch.object(Command, 'changed_hotels', side_effect=lambda batch: batch[1:]):
+            batches = list(self.command.hotel_batches(2))
+
+        self.assertEqual([[hotel.id for hotel in batch] for batch in batches], [[4], [2]])
+        self.assertEqual(self.command.skipped_count, 3)
+
+    @patch('ollama_app.management.commands.process_properties.Hotel.objects')
+    def test_hotel_batches_incremental_limit_counts_processed_hotels(self, mock_hotel_objects):
+        hotels = make_hotels(range(1, 11))
+        mock_hotel_objects.only.return_value = HotelQuerySetStub(hotels)
+        self.command.incremental = True
+        self.command.checkpoint = CheckpointTracker()
+
+        # Only the even ids changed
+        with patch.object(Command, 'changed_hotels',
+                          side_effect=lambda batch: [hotel for hotel in batch if hotel.id % 2 == 0]):
+            batches = list(self.command.hotel_batches(3, limit=3))
+
+        self.assertEqual([[hotel.id for hotel in batch] for batch in batches], [[10, 8], [6]])
+        # 9, 7 and 5 were scanned and skipped; 4 and below are left for the next run
+        self.assertEqual(self.command.skipped_count, 3)
+        self.assertFalse(self.command.exhausted)
+        self.assertEqual(self.command.checkpoint.batches[-1], (5, {6}))
+
+        # Past the limit, the rest of a page is not skipped but left unread
+        self.command.skipped_count = 0
+        with patch.object(Command, 'changed_hotels', side_effect=lambda batch: batch):
+            batches = list(self.command.hotel_batches(3, limit=2))
+        self.assertEqual([[hotel.id for hotel in batch] for batch in batches], [[10, 9]])
+        self.assertEqual(self.command.skipped_count, 0)
+        self.assertEqual(self.command.checkpoint.batches[-1], (9, {10, 9}))
+
+    @patch('ollama_app.management.commands.process_properties.finish_claims')
+    def test_flush_failed_claims_keeps_failures_recorded_meanwhile(self, mock_finish_claims):
+        self.command.worker_id = 'worker-1'
+        self.command.failed_claims = [1, 2]
+        # Another thread records a failure while the first ones are written
+        mock_finish_claims.side_effect = lambda *args: self.command.failed_claims.append(3)
+
+        self.command.flush_failed_claims()
+
+        mock_finish_claims.assert_called_once_with('worker-1', [1, 2], HotelClaim.FAILED)
+        self.assertEqual(self.command.failed_claims, [3])
+
+        mock_finish_claims.side_effect = Exception("Database unavailable")
+        with self.assertRaises(Exception):
+            self.command.flush_failed_claims()
+        # Kept for the next attempt
+        self.assertEqual(self.command.failed_claims, [3])
+
+    def test_checkpoint_tracker_out_of_order(self):
+        hotels = make_hotels(range(6, 0, -1))
+        tracker = CheckpointTracker()
+        tracker.add(hotels[:3], 4)
+        tracker.add(hotels[3:], 1)
+
+        # Finishing the whole second batch first does not move the position
+        for hotel in hotels[3:]:
+            tracker.finish(hotel)
+        self.assertIsNone(tracker.position)
+
+        tracker.finish(hotels[0])
+        tracker.finish(hotels[1])
+        self.assertIsNone(tracker.position)
+        tracker.finish(hotels[2])
+        self.assertEqual(tracker.position, 1)
+
+    def test_checkpoint_tracker_failures(self):
+        hotels = make_hotels(range(6, 0, -1))
+        tracker = CheckpointTracker(retry=[9, 8])
+        tracker.add_retry([], [9])
+        tracker.add(hotels[:3], 4)
+        tracker.add(hotels[3:], 1)
+
+        # A failure does not hold the position back
+        tracker.finish(hotels[0], failed=True)
+        tracker.finish(hotels[1])
+        tracker.finish(hotels[2])
+        tracker.fail(hotels[4])
+        self.assertEqual(tracker.position, 4)
+        # Hotel 9 no longer exists; hotel 8 was not retried yet; hotel 2
+        # failed below the position and is walked again anyway
+        self.assertEqual(tracker.failed_ids(tracker.position), [8, 6])
+
+    @patch('ollama_app.management.commands.process_properties.ProcessingCheckpoint.objects')
+    @patch('ollama_app.management.commands.process_properties.Hotel.objects')
+    @patch.object(Command, 'process_hotel')
+    def test_handle_resumes_from_checkpoint(self, mock_process_hotel, mock_hotel_objects,
+                                            mock_checkpoint_objects):
+        hotels = make_hotels(range(1, 8))
+        mock_hotel_objects.only.return_value = HotelQuerySetStub(hotels)
+        mock_checkpoint_objects.filter.return_value.first.return_value.last_hotel_id = 6
+        mock_checkpoint_objects.filter.return_value.first.return_value.failed_hotel_ids = []
+
+        self.command.handle(checkpoint='nightly', limit=2, batch_size=1, offset=2)
+
+        # The offset was used up by the run that saved the checkpoint
+        processed = [call.args[0].id for call in mock_process_hotel.call_args_list]
+        self.assertEqual(processed, [5, 4])
+        mock_checkpoint_objects.update_or_create.assert_called_with(
+            name='nightly', defaults={'last_hotel_id': 4, 'failed_hotel_ids': []})
+
+    @patch('ollama_app.management.commands.process_properties.ProcessingCheckpoint.objects')
+    @patch('ollama_app.management.commands.process_properties.Hotel.objects')
+    @patch.object(Command, 'process_hotel')
+    def test_handle_keeps_failed_hotels_for_next_run(self, mock_process_hotel, mock_hotel_objects,
+                                                     mock_checkpoint_objects):
+        hotels = make_hotels(range(1, 11))
+        mock_hotel_objects.only.return_value = HotelQuerySetStub(hotels)
+        saved = mock_checkpoint_objects.filter.return_value.first.return_value
+        saved.last_hotel_id = 7
+        saved.failed_hotel_ids = [9, 8]
+
+        def process_hotel(hotel):
+            # Hotel 8 fails again and hotel 5 fails for the first time
+            if hotel.id in (8, 5):
+                raise Exception("Test error")
+        mock_process_hotel.side_effect = process_hotel
+
+        self.command.handle(checkpoint='nightly', limit=5, batch_size=2)
+
+        processed = [call.args[0].id for call in mock_process_hotel.call_args_list]
+        self.assertEqual(processed, [9, 8, 6, 5, 4])
+        mock_checkpoint_objects.update_or_create.assert_called_with(
+            name='nightly', defaults={'last_hotel_id': 4, 'failed_hotel_ids': [8, 5]})
+
+    @patch('ollama_app.management.commands.process_properties.ProcessingCheckpoint.objects')
+    @patch('ollama_app.management.commands.process_properties.Hotel.objects')
+    @patch.object(Command, 'process_hotel')
+    def test_handle_clears_finished_checkpoint(self, mock_process_hotel, mock_hotel_objects,
+                                               mock_checkpoint_objects):
+        mock_hotel_objects.only.return_value = HotelQuerySetStub([self.hotel_mock])
+        mock_checkpoint_objects.filter.return_value.first.return_value = None
+
+        self.command.handle(checkpoint='nightly')
+
+        mock_process_hotel.assert_called_once_with(self.hotel_mock)
+        mock_checkpoint_objects.filter.return_value.delete.assert_called_once()
+
+    @patch('ollama_app.management.commands.process_properties.ClaimHeartbeat')
+    @patch('ollama_app.management.commands.process_properties.release_claims')
+    @patch('ollama_app.management.commands.process_properties.finish_claims')
+    @patch('ollama_app.management.commands.process_properties.requeue_expired_claims')
+    @patch('ollama_app.management.commands.process_properties.claim_hotels')
+    @patch('ollama_app.management.commands.process_properties.Hotel.objects')
+    @patch.object(Command, 'save_property')
+    @patch.object(OllamaClient, 'generate')
+    def test_handle_claim(self, mock_generate, mock_save_property, mock_hotel_objects, mock_claim_hotels,
+                          mock_requeue, mock_finish_claims, mock_release_claims, mock_heartbeat):
+        failing = MagicMock()
+        failing.id = failing.hotelId = 2
+        failing.title = "Failing Hotel"
+        mock_hotel_objects.only.return_value = HotelQuerySetStub([self.hotel_mock, failing])
+        mock_claim_hotels.side_effect = [[2, 1], []]
+
+        def generate(prompt, **kwargs):
+            if "Failing Hotel" in prompt:
+                raise Exception("Test error")
+            if prompt.startswith("Modify the title"):
+                return "TITLE: Escape\nDESCRIPTION: Comfort."
+            if prompt.startswith("Create a concise"):
+                return "SUMMARY: A hotel."
+            return "RATING: 4.7\nREVIEW: Great."
+        mock_generate.side_effect = generate
+
+        self.command.handle(claim=True, worker_id='worker-1', limit=0)
+
+        self.assertEqual(mock_claim_hotels.call_count, 2)
+        mock_save_property.assert_called_once()
+        mock_finish_claims.assert_called_once_with('worker-1', [2], 'failed')
+        mock_release_claims.assert_called_once_with('worker-1')
+        mock_heartbeat.return_value.stop.assert_called_once()
+
+    def test_handle_claim_with_checkpoint(self):
+        with self.assertRaises(CommandError):
+            self.command.handle(claim=True, checkpoint='nightly')
+
+    def test_parse_json_invalid(self):
+        self.command.json_output = True
+        with self.assertRaises(ValueError):
+            self.command.parse_summary("SUMMARY: not json")
+        with self.assertRaises(ValueError):
+            self.command.parse_summary('["summary"]')
+        with self.assertRaises(ValueError):
+            self.command.parse_review('{"rating": "high", "review": "Great."}')
+        with self.assertRaises(ValueError):
+            self.command.parse_description('{"title": "Escape"}')
+
+    def test_parse_combined_json(self):
+        self.command.json_output = True
+        content_data, summary, review_data = self.command.parse_combined(json.dumps({
+            'title': 'Escape',
+            'description': 'Comfort.',
+            'summary': 'A hotel.',
+            'rating': 7,
+            'review': 'Great.'
+        }))
+
+        self.assertEqual(content_data, {'title': 'Escape', 'description': 'Comfort.'})
+        self.assertEqual(summary, 'A hotel.')
+        self.assertEqual(review_data, {'rating': 5.0, 'review': 'Great.'})
+
+    @patch('ollama_app.management.commands.process_properties.Hotel.objects')
+    @patch('ollama_app.writer.write_properties')
+    @patch.object(OllamaClient, 'generate')
+    def test_handle_with_errors(self, mock_generate, mock_write_properties, mock_hotel_objects):
+        mock_hotel_objects.only.return_value = HotelQuerySetStub([self.hotel_mock])
 
         # Simulate an error during content generation
         mock_generate.side_effect = Exception("Test error")
@@ -334,16 +1813,263 @@ class TestProcessProperties(unittest.TestCase):
         self.command.handle()  # Should handle the error gracefully
 
         mock_generate.assert_called_once()
-        mock_create_content.assert_not_called()
+        mock_write_properties.assert_not_called()
+
+    @patch('ollama_app.management.commands.process_properties.Hotel.objects')
+    @patch('ollama_app.writer.write_properties')
+    @patch.object(OllamaClient, 'generate')
+    def test_handle_counts_failed_save_once(self, mock_generate, mock_write_properties, mock_hotel_objects):
+        mock_hotel_objects.only.return_value = HotelQuerySetStub([self.hotel_mock])
+        mock_generate.return_value = (
+            "TITLE: Escape\nDESCRIPTION: Comfort.\nSUMMARY: A hotel.\nRATING: 4.7\nREVIEW: Great.")
+        mock_write_properties.side_effect = Exception("Disk full")
+        generated = metric_value('properties_processed_total', result='generated')
+        failed = metric_value('properties_processed_total', result='failed')
+
+        self.command.handle(combined=True)
+
+        # Generated but never saved: only a failure
+        self.assertEqual(metric_value('properties_processed_total', result='generated'), generated)
+        self.assertEqual(metric_value('properties_processed_total', result='failed'), failed + 1)
+
+        mock_write_properties.side_effect = None
+        self.command.handle(combined=True)
+
+        self.assertEqual(metric_value('properties_processed_total', result='generated'), generated + 1)
+        self.assertEqual(metric_value('properties_processed_total', result='failed'), failed + 1)
+
+    def test_worker_connections_are_closed_once(self):
+        from django.db import connections
+        from ollama_app.management.commands.process_properties import WorkerConnections
+
+        tracker = WorkerConnections()
+
+        def task():
+            connection = connections['default']
+            connection.ensure_connection()
+            tracker.track()
+            return connection
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            opened = {id(connection): connection for connection in executor.map(lambda _: task(), range(6))}
+        # One connection per thread, reused for every task
+        self.assertLessEqual(len(opened), 2)
+        self.assertTrue(all(connection.connection is not None for connection in opened.values()))
+
+        # SQLite never closes the connections of an in-memory test database
+        with patch.object(type(connections['default']), 'is_in_memory_db', return_value=False):
+            tracker.close_all()
+
+        self.assertTrue(all(connection.connection is None for connection in opened.values()))
+        self.assertEqual(tracker.tracked, {})
 
     def test_handle_empty_queryset(self):
         with patch('ollama_app.management.commands.process_properties.Hotel.objects') as mock_hotel_objects:
-            mock_queryset = MagicMock()
-            mock_queryset.order_by.return_value = []
-            mock_hotel_objects.all.return_value = mock_queryset
+            mock_hotel_objects.only.return_value = HotelQuerySetStub([])
 
             self.command.handle()  # Should handle empty queryset gracefully
 
+    @patch('ollama_app.management.commands.process_properties.connections')
+    @patch('ollama_app.management.commands.process_properties.Hotel.objects')
+    @patch('ollama_app.writer.write_properties')
+    @patch.object(OllamaClient, 'generate')
+    def test_handle_with_workers(self, mock_generate, mock_write_properties,
+                                 mock_hotel_objects, mock_connections):
+        hotels = make_hotels(range(4), failing=[3])
+        mock_hotel_objects.only.return_value = HotelQuerySetStub(hotels)
+
+        # Calls from different workers interleave, so answer by prompt type
+        def generate(prompt, **kwargs):
+            if "Failing Hotel" in prompt:
+                raise Exception("Test error")
+            if prompt.startswith("Modify the title"):
+                return "TITLE: Escape\nDESCRIPTION: Comfort."
+            if prompt.startswith("Create a concise"):
+                return "SUMMARY: A hotel."
+            return "RATING: 4.7\nREVIEW: Great."
+        mock_generate.side_effect = generate
+
+        out = StringIO()
+        self.command.stdout = OutputWrapper(out)
+        self.command.handle(workers=3)
+
+        self.assertEqual(mock_generate.call_count, 10)
+        # The successful hotels are buffered and written together
+        mock_write_properties.assert_called_once()
+        self.assertEqual(len(mock_write_properties.call_args.args[0]), 3)
+        self.assertIn("Successfully processed: 3 properties", out.getvalue())
+        self.assertIn("Failed to process: 1 properties", out.getvalue())
+        # Workers keep their DB connection between hotels
+        mock_connections.close_all.assert_not_called()
+        self.assertEqual(mock_connections.all.call_count, 4)
+
+    @patch('ollama_app.management.commands.process_properties.connections')
+    @patch('ollama_app.management.commands.process_properties.Hotel.objects')
+    @patch('ollama_app.writer.write_properties')
+    @patch.object(OllamaClient, 'generate')
+    def test_handle_pipeline(self, mock_generate, mock_write_properties, mock_hotel_objects, mock_connections):
+        hotels = make_hotels(range(5))
+        mock_hotel_objects.only.return_value = HotelQuerySetStub(hotels)
+
+        def generate(prompt, **kwargs):
+            if prompt.startswith("Modify the title"):
+                return "TITLE: Escape\nDESCRIPTION: Comfort."
+            if prompt.startswith("Create a concise"):
+                if "Hotel 3" in prompt:
+                    raise Exception("Test error")
+                return "SUMMARY: A hotel."
+            return "RATING: 4.7\nREVIEW: Great."
+        mock_generate.side_effect = generate
+
+        out = StringIO()
+        self.command.stdout = OutputWrapper(out)
+        self.command.handle(pipeline=True, description_workers=2, summary_workers=1, review_workers=1)
+
+        self.assertEqual(mock_generate.call_count, 15)
+        saved = mock_write_properties.call_args.args[0]
+        self.assertEqual(sorted(item.hotel.id for item in saved), [0, 1, 2, 4])
+        self.assertEqual(saved[0].summary, "A hotel.")
+        self.assertEqual(saved[0].review_data['rating'], 4.7)
+        self.assertIn("2 description workers, 1 summary workers, 1 review workers", out.getvalue())
+        self.assertIn("Successfully processed: 4 properties", out.getvalue())
+        self.assertIn("Failed to process: 1 properties", out.getvalue())
+        self.assertEqual(self.command.checkpoint.batches, deque())
+
+    @patch('ollama_app.management.commands.process_properties.connections')
+    @patch('ollama_app.management.commands.process_properties.Hotel.objects')
+    @patch('ollama_app.writer.write_properties')
+    @patch.object(AsyncOllamaClient, 'close', new_callable=AsyncMock)
+    @patch.object(AsyncOllamaClient, 'generate', new_callable=AsyncMock)
+    def test_handle_pipeline_async(self, mock_generate, mock_close, mock_write_properties,
+                                   mock_hotel_objects, mock_connections):
+        hotels = make_hotels(range(3), failing=[2])
+        mock_hotel_objects.only.return_value = HotelQuerySetStub(hotels)
+
+        async def generate(prompt, **kwargs):
+            if prompt.startswith("Modify the title"):
+                return "TITLE: Escape\nDESCRIPTION: Comfort."
+            if prompt.startswith("Create a concise"):
+                return "SUMMARY: A hotel."
+            if "Failing Hotel" in prompt:
+                raise Exception("Test error")
+            return "RATING: 4.7\nREVIEW: Great."
+        mock_generate.side_effect = generate
+
+        out = StringIO()
+        self.command.stdout = OutputWrapper(out)
+        self.command.handle(use_async=True, pipeline=True, summary_workers=1)
+
+        self.assertEqual(mock_generate.call_count, 9)
+        self.assertEqual(len(mock_write_properties.call_args.args[0]), 2)
+        self.assertIn("up to 10 description requests, up to 1 summary requests", out.getvalue())
+        self.assertIn("Successfully processed: 2 properties", out.getvalue())
+        self.assertIn("Failed to process: 1 properties", out.getvalue())
+
+    @patch('ollama_app.management.commands.process_properties.Hotel.objects')
+    @patch('ollama_app.writer.write_properties')
+    @patch.object(OllamaClient, 'generate')
+    def test_handle_warms_up_with_keep_alive(self, mock_generate, mock_write_properties, mock_hotel_objects):
+        mock_hotel_objects.only.return_value = HotelQuerySetStub([self.hotel_mock])
+        mock_generate.side_effect = [
+            "TITLE: Escape\nDESCRIPTION: Comfort.", "SUMMARY: A hotel.", "RATING: 4.7\nREVIEW: Great."]
+
+        self.command.handle(keep_alive='1h')
+
+        self.mock_check_model.assert_called_once()
+        self.mock_warm_up.assert_called_once_with('1h')
+        for generate_call in mock_generate.call_args_list:
+            self.assertEqual(generate_call.kwargs['options']['keep_alive'], '1h')
+
+    @patch('ollama_app.management.commands.process_properties.Hotel.objects')
+    @patch('ollama_app.writer.write_properties')
+    @patch.object(OllamaClient, 'generate')
+    def test_handle_writes_report(self, mock_generate, mock_write_properties, mock_hotel_objects):
+        mock_hotel_objects.only.return_value = HotelQuerySetStub([self.hotel_mock])
+        mock_generate.side_effect = [
+            "TITLE: Escape\nDESCRIPTION: Comfort.", "SUMMARY: A hotel.", "RATING: 4.7\nREVIEW: Great."]
+        self.command.stdout = OutputWrapper(StringIO())
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'report.json')
+            self.command.handle(report=path)
+            with open(path) as f:
+                report = json.load(f)
+
+        self.assertEqual(report['processed'], 1)
+        for phase in ('db_fetch', 'prompt.description', 'llm.summary', 'parse.review', 'db_write'):
+            self.assertEqual(report['phases'][phase]['count'], 1)
+        self.assertIn('Phase timings', self.command.stdout._out.getvalue())
+        self.assertEqual(mock_generate.call_args.kwargs['prompt_type'], 'review')
+
+    @patch('ollama_app.management.commands.process_properties.connections')
+    @patch('ollama_app.management.commands.process_properties.Hotel.objects')
+    @patch('ollama_app.writer.write_properties')
+    @patch.object(OllamaClient, 'generate')
+    def test_handle_profile_with_workers(self, mock_generate, mock_write_properties, mock_hotel_objects,
+                                         mock_connections):
+        mock_hotel_objects.only.return_value = HotelQuerySetStub([self.hotel_mock])
+        mock_generate.side_effect = [
+            "TITLE: Escape\nDESCRIPTION: Comfort.", "SUMMARY: A hotel.", "RATING: 4.7\nREVIEW: Great."]
+        self.command.stdout = OutputWrapper(StringIO())
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'run.prof')
+            self.command.handle(profile=path, workers=2)
+            self.assertTrue(os.path.getsize(path))
+
+        output = self.command.stdout._out.getvalue()
+        self.assertIn('process_hotel', output)
+        self.assertIn('ORM queries: 0 in total', output)
+        self.assertFalse(self.command.profiler.queries.active)
+
+    @patch('ollama_app.management.commands.process_properties.Hotel.objects')
+    @patch.object(OllamaClient, 'generate')
+    def test_handle_fails_fast_without_model(self, mock_generate, mock_hotel_objects):
+        mock_hotel_objects.only.return_value = HotelQuerySetStub([self.hotel_mock])
+        self.mock_check_model.side_effect = ModelUnavailableError("No Ollama backend can serve model 'llama3.2'.")
+
+        with self.assertRaisesRegex(CommandError, "llama3.2"):
+            self.command.handle(warm_up=False)
+
+        mock_generate.assert_not_called()
+        self.mock_warm_up.assert_not_called()
+
+    def test_handle_pipeline_with_combined(self):
+        with self.assertRaises(CommandError):
+            self.command.handle(pipeline=True, combined=True)
+
+    @patch('ollama_app.management.commands.process_properties.connections')
+    @patch('ollama_app.management.commands.process_properties.Hotel.objects')
+    @patch('ollama_app.writer.write_properties')
+    @patch.object(AsyncOllamaClient, 'close', new_callable=AsyncMock)
+    @patch.object(AsyncOllamaClient, 'generate', new_callable=AsyncMock)
+    def test_handle_async(self, mock_generate, mock_close, mock_write_properties,
+                          mock_hotel_objects, mock_connections):
+        hotels = make_hotels(range(3), failing=[2])
+        mock_hotel_objects.only.return_value = HotelQuerySetStub(hotels)
+
+        async def generate(prompt, **kwargs):
+            if prompt.startswith("Modify the title"):
+                if "Failing Hotel" in prompt:
+                    return "Invalid format response"
+                return "TITLE: Escape\nDESCRIPTION: Comfort."
+            if prompt.startswith("Create a concise"):
+                return "SUMMARY: A hotel."
+            return "RATING: 4.7\nREVIEW: Great."
+        mock_generate.side_effect = generate
+
+        out = StringIO()
+        self.command.stdout = OutputWrapper(out)
+        self.command.handle(use_async=True, concurrency=2)
+
+        # The failing hotel's description is asked for three times
+        self.assertEqual(mock_generate.call_count, 9)
+        mock_write_properties.assert_called_once()
+        self.assertEqual(len(mock_write_properties.call_args.args[0]), 2)
+        mock_close.assert_awaited_once()
+        self.assertIn("Successfully processed: 2 properties", out.getvalue())
+        self.assertIn("Failed to process: 1 properties", out.getvalue())
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,3 +1,22 @@
-from django.shortcuts import render
+import hmac
 
-# Create your views here.
\ No newline at end of file
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.views.decorators.http import require_GET
+
+from .metrics import CONTENT_TYPE, render
+
+
+@require_GET
+def metrics(request):
+    # Prometheus scrape endpoint. The metrics name the Ollama backends, so it
+    # is only served with METRICS_TOKEN set and sent as a bearer token.
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if not token:
+        raise Http404
+    scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not hmac.compare_digest(credentials.strip().encode(), token.encode()):
+        response = HttpResponse('Unauthorized', status=401, content_type='text/plain')
+        response['WWW-Authenticate'] = 'Bearer'
+        return response
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
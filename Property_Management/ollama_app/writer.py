@@ -0,0 +1,193 @@
+# writer.py
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from django.db import connections, transaction
+from django.utils import timezone
+
+from . import metrics
+from .claims import finish_claims
+from .models import Hotel, HotelClaim, PropertyContent, PropertyReview, PropertySummary
+from .stats import RunStats
+
+logger = logging.getLogger(__name__)
+
+
+class GeneratedProperty(NamedTuple):
+    hotel: Hotel
+    content_data: Dict[str, str]
+    summary: str
+    review_data: Dict[str, Any]
+    fingerprint: str
+
+
+def write_properties(items: List[GeneratedProperty], incremental: bool = False,
+                     worker_id: Optional[str] = None) -> None:
+    # Every row for these hotels is written in one transaction with one
+    # INSERT per table. On PostgreSQL bulk_create returns the new primary keys,
+    # which the summaries and reviews need to point at their content rows.
+    hotel_ids = [item.hotel.id for item in items]
+    with transaction.atomic():
+        existing = {}
+        if incremental:
+            # Regenerate each hotel's latest content instead of adding a duplicate
+            latest = PropertyContent.objects.filter(hotel_id__in=hotel_ids).order_by('hotel_id', '-created_at', '-id')
+            for content in latest.only('id', 'hotel_id', 'created_at'):
+                existing.setdefault(content.hotel_id, content)
+
+        now = timezone.now()
+        contents, new_contents, updated_contents = [], [], []
+        for item in items:
+            content = existing.get(item.hotel.id)
+            if content is None:
+                content = PropertyContent(hotel_id=item.hotel.id)
+                new_contents.append(content)
+            else:
+                # bulk_update() skips auto_now, so set the timestamp here
+                content.updated_at = now
+                updated_contents.append(content)
+            content.title = item.content_data['title']
+            content.description = item.content_data['description']
+            content.propertyId = item.hotel.hotelId
+            content.source_fingerprint = item.fingerprint
+            contents.append(content)
+
+        PropertyContent.objects.bulk_create(new_contents)
+        if updated_contents:
+            PropertyContent.objects.bulk_update(
+                updated_contents, ['title', 'description', 'propertyId', 'source_fingerprint', 'updated_at'])
+            PropertySummary.objects.filter(property__in=updated_contents).delete()
+            PropertyReview.objects.filter(property__in=updated_contents).delete()
+
+        PropertySummary.objects.bulk_create([
+            PropertySummary(property=content, summary=item.summary, propertyId=item.hotel.hotelId)
+            for item, content in zip(items, contents)
+        ])
+        PropertyReview.objects.bulk_create([
+            PropertyReview(
+                property=content,
+                rating=item.review_data['rating'],
+                review=item.review_data['review'],
+                propertyId=item.hotel.hotelId
+            )
+            for item, content in zip(items, contents)
+        ])
+
+        if worker_id is not None:
+            # Completing the claims in the same transaction means a hotel is
+            # never marked done without its content
+            finish_claims(worker_id, hotel_ids, HotelClaim.DONE)
+
+
+class PropertyWriter:
+    # Collects generated properties from any thread and writes them in bulk
+    # once flush_size of them are waiting or the oldest has waited
+    # flush_interval seconds. After start(), a timer thread enforces the
+    # interval even when no more properties arrive, e.g. while the circuit
+    # breaker holds back every request.
+    def __init__(self, flush_size: int = 1, flush_interval: float = 10.0,
+                 incremental: bool = False, worker_id: Optional[str] = None,
+                 stats: Optional[RunStats] = None,
+                 on_failure: Optional[Callable[[Hotel], None]] = None):
+        self.flush_size = max(flush_size, 1)
+        self.flush_interval = flush_interval
+        self.incremental = incremental
+        self.worker_id = worker_id
+        self.stats = stats
+        # Called from the thread that flushed, as soon as a hotel fails to save
+        self.on_failure = on_failure
+        self.lock = threading.Lock()
+        self.pending: List[GeneratedProperty] = []
+        self.oldest_added_at = time.monotonic()
+        self.stop_event = threading.Event()
+        self.timer: Optional[threading.Thread] = None
+        # Read from the event loop in --async mode, so it must not share the
+        # lock that is held while writing to the database
+        self.failures: queue.SimpleQueue = queue.SimpleQueue()
+
+    def add(self, item: GeneratedProperty) -> None:
+        with self.lock:
+            if not self.pending:
+                self.oldest_added_at = time.monotonic()
+            self.pending.append(item)
+            metrics.WRITE_BUFFER.set(len(self.pending))
+            if len(self.pending) >= self.flush_size or self.overdue():
+                self._flush()
+
+    def overdue(self) -> bool:
+        return bool(self.pending) and time.monotonic() - self.oldest_added_at >= self.flush_interval
+
+    def start(self) -> None:
+        # Without a buffer or an interval nothing ever waits for the timer
+        if self.flush_size > 1 and self.flush_interval > 0:
+            self.stop_event.clear()
+            self.timer = threading.Thread(target=self.run_timer, name='property-writer', daemon=True)
+            self.timer.start()
+
+    def run_timer(self) -> None:
+        try:
+            while not self.stop_event.wait(min(self.flush_interval, 1.0)):
+                with self.lock:
+                    if self.overdue():
+                        self._flush()
+        finally:
+            # Writes from this thread went through its own DB connection
+            connections.close_all()
+
+    def stop(self) -> None:
+        if self.timer is not None:
+            self.stop_event.set()
+            self.timer.join()
+            self.timer = None
+
+    def flush(self) -> None:
+        with self.lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        items, self.pending = self.pending, []
+        metrics.WRITE_BUFFER.set(0)
+        if not items:
+            return
+
+        try:
+            self.write(items)
+        except Exception as e:
+            if len(items) == 1:
+                self.fail(items[0].hotel, e)
+                return
+            # Write the hotels one at a time so a single bad row only loses itself
+            logger.error(f"Error writing {len(items)} properties in bulk, retrying one by one: {str(e)}")
+            for item in items:
+                try:
+                    self.write([item])
+                except Exception as item_error:
+                    self.fail(item.hotel, item_error)
+
+    def fail(self, hotel: Hotel, error: Exception) -> None:
+        self.failures.put((hotel, error))
+        if self.on_failure is not None:
+            self.on_failure(hotel)
+
+    def write(self, items: List[GeneratedProperty]) -> None:
+        started_at = time.perf_counter()
+        try:
+            write_properties(items, self.incremental, self.worker_id)
+            # Counted once saved; generation and save failures are counted by the command
+            metrics.PROPERTIES.labels(result='generated').inc(len(items))
+        finally:
+            seconds = time.perf_counter() - started_at
+            metrics.DB_WRITE_LATENCY.observe(seconds)
+            if self.stats is not None:
+                self.stats.record('db_write', seconds)
+
+    def take_failures(self) -> List[Tuple[Hotel, Exception]]:
+        failures = []
+        while True:
+            try:
+                failures.append(self.failures.get_nowait())
+            except queue.Empty:
+                return failures